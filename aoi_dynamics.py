@@ -0,0 +1,237 @@
+import argparse
+
+import numpy as np
+
+import instrumentation
+from categorical import Categories
+from results import AoiTransitions, DwellCurves, RowWriter
+from session_engine import normalize_key
+from trial_store import fixation_store_from_file
+
+# length of the windows and step between their starts, in ms after the stimulus onset
+WINDOW = 200
+STEP = 50
+# end of the last window
+MAX_TIME = 3000
+
+DWELL_COLUMNS = ("condition", "side", "aoi", "window_start", "dwell", "proportion")
+TRANSITION_COLUMNS = ("condition", "side", "from_aoi", "to_aoi", "count", "probability")
+
+
+def trial_conditions(store, samples_dict=None):
+    """ returns the condition of every trial of a fixations store, read from the fixations file, or looked up
+        in the samples if the fixations file has no condition column
+        inputs
+        ------
+        store: TrialStore of kind "fixations"
+        samples_dict: dictionary returned by read_samples, only used without a condition column
+        outputs
+        -------
+        conditions: list of the condition of every trial of the store, None for trials not in the samples,
+                    or None if the fixations file has no condition column and no samples are given
+    """
+    if "condition" in store.arrays:
+        return [condition.strip() for condition in store.decode("condition", store.condition)]
+    if samples_dict is None:
+        return None
+    conditions = {normalize_key(participant, trial): trial_dict["condition"].strip()
+                  for participant in samples_dict for trial, trial_dict in samples_dict[participant].items()}
+    offsets = store.participant_offsets.tolist()
+    trials = store.decode("trial", store.trials)
+    return [conditions.get(normalize_key(participant, trial))
+            for p, participant in enumerate(store.labels("participant"))
+            for trial in trials[offsets[p]:offsets[p + 1]]]
+
+
+def trial_groups(store, conditions=None):
+    """ groups the trials of a store by condition and side of the original image
+        inputs
+        ------
+        store: TrialStore of kind "fixations"
+        conditions: condition of every trial, e.g. from trial_conditions, None to group by side only
+        outputs
+        -------
+        trial_group: array of the group of every trial
+        groups: list of the (condition, side) of every group, the condition is "" without conditions
+    """
+    # the codes are ranked by label so the groups are sorted by condition and side
+    sides = sorted(store.labels("side"))
+    num_sides = max(len(sides), 1)
+    side_rank = np.array([sides.index(side) for side in store.labels("side")] or [0], dtype=np.int64)
+    side_codes = side_rank[np.asarray(store.orig_side, dtype=np.int64)]
+    if conditions is None:
+        condition_labels = [""]
+        condition_codes = np.zeros(len(side_codes), dtype=np.int64)
+    else:
+        conditions = ["" if condition is None else condition for condition in conditions]
+        categories = Categories(sorted(set(conditions)))
+        condition_codes = categories.encode(conditions).astype(np.int64)
+        condition_labels = categories.labels
+    used, trial_group = np.unique(condition_codes * num_sides + side_codes, return_inverse=True)
+    groups = [(condition_labels[key // num_sides], sides[key % num_sides]) for key in used.tolist()]
+    return trial_group.ravel(), groups
+
+
+def _event_trials(store):
+    """ returns the trial of every fixation of a store """
+    return np.repeat(np.arange(len(store.trials)), np.diff(store.event_offsets))
+
+
+def window_starts(window=WINDOW, step=STEP, max_time=MAX_TIME):
+    """ returns the starts of the windows of length window every step ms that end by max_time """
+    return np.arange(int((max_time - window) // step) + 1) * float(step)
+
+
+@instrumentation.timed("dwell_curves")
+def dwell_curves(store, conditions=None, window=WINDOW, step=STEP, max_time=MAX_TIME):
+    """ computes how long the fixations of all trials dwell on every interest area in sliding time windows
+        after the stimulus onset, per condition and side. all the fixations of all trials are binned at once on
+        the shared grid of window edges, so the cost grows with the number of fixations plus windows rather than
+        their product
+        inputs
+        ------
+        store: TrialStore of kind "fixations", e.g. from fixation_store_from_file
+        conditions: condition of every trial, e.g. from trial_conditions, None to group by side only
+        window: length of the windows in ms
+        step: ms between the starts of consecutive windows
+        max_time: end of the last window in ms
+        outputs
+        -------
+        curves: DwellCurves, with the total dwell time of the trials of a group on an interest area in every window,
+                and its proportion of the time fixated on any interest area (nan without fixations)
+    """
+    starts = window_starts(window, step, max_time)
+    trial_group, groups = trial_groups(store, conditions)
+    labels = store.labels("aoi")
+    num_cells = len(groups) * len(labels)
+
+    # the cell of a fixation is its group and interest area
+    cells = trial_group[_event_trials(store)] * len(labels) + np.asarray(store.aoi, dtype=np.int64)
+    # the time fixated on a cell before t is the sum of (t - start) over the fixations starting before t minus the
+    # sum of (t - end) over the ones ending before t, so it is computed at every window edge from the counts and
+    # sums of the starts and ends binned between consecutive edges, and the dwell in a window is its difference
+    # at the two edges of the window
+    edges = np.unique(np.concatenate([starts, starts + window]))
+    time_before = np.zeros((num_cells, len(edges)))
+    for times, sign in ((np.asarray(store.start, dtype=np.float64), 1), (np.asarray(store.end, dtype=np.float64), -1)):
+        # the time is before the edges from this index on
+        index = cells * (len(edges) + 1) + np.searchsorted(edges, times, side="right")
+        size = num_cells * (len(edges) + 1)
+        before = np.cumsum(np.bincount(index, minlength=size).reshape(num_cells, -1), axis=1)[:, :-1]
+        sums = np.cumsum(np.bincount(index, times, minlength=size).reshape(num_cells, -1), axis=1)[:, :-1]
+        time_before += sign * (before * edges - sums)
+    dwell = time_before[:, np.searchsorted(edges, starts + window)] - time_before[:, np.searchsorted(edges, starts)]
+
+    dwell = dwell.reshape(len(groups), len(labels), len(starts))
+    total = dwell.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        proportion = np.where(total > 0, dwell / total, np.nan)
+    trials = np.bincount(trial_group, minlength=len(groups))
+    return DwellCurves(groups, labels, starts, float(window), trials, dwell, proportion)
+
+
+@instrumentation.timed("aoi_transitions")
+def aoi_transitions(store, conditions=None):
+    """ counts the transitions between the interest areas of consecutive fixations of the same trial, for all
+        trials at once, per condition and side. refixations of the same interest area are on the diagonal
+        inputs
+        ------
+        store: TrialStore of kind "fixations"
+        conditions: condition of every trial, e.g. from trial_conditions, None to group by side only
+        outputs
+        -------
+        transitions: AoiTransitions with the counts and the probabilities of the next interest area given the
+                     current one (nan for interest areas without a next fixation)
+    """
+    trial_group, groups = trial_groups(store, conditions)
+    labels = store.labels("aoi")
+    num_labels = len(labels)
+    aoi = np.asarray(store.aoi, dtype=np.int64)
+    event_trials = _event_trials(store)
+
+    same_trial = event_trials[1:] == event_trials[:-1]
+    pair_group = trial_group[event_trials[:-1][same_trial]]
+    index = (pair_group * num_labels + aoi[:-1][same_trial]) * num_labels + aoi[1:][same_trial]
+    counts = np.bincount(index, minlength=len(groups) * num_labels * num_labels).reshape(
+        len(groups), num_labels, num_labels)
+    from_counts = counts.sum(axis=2, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probabilities = np.where(from_counts > 0, counts / from_counts, np.nan)
+    return AoiTransitions(groups, labels, counts, probabilities)
+
+
+def _group_name(group):
+    condition, side = group
+    return ("condition %s, " % condition if condition else "") + "original on the " + side.lower()
+
+
+def print_dwell_curves(curves):
+    """ prints the dwell proportions of every group, a row per window and a column per interest area """
+    for g, group in enumerate(curves.groups):
+        print("dwell proportions, %s (%d trials)" % (_group_name(group), curves.trials[g]))
+        print("window (ms)   " + " ".join("%8s" % label for label in curves.labels))
+        for w, start in enumerate(curves.window_starts.tolist()):
+            print("%5d-%-7d " % (start, start + curves.window) +
+                  " ".join("%8.3f" % value for value in curves.proportion[g, :, w].tolist()))
+        print("----------------------------------------")
+
+
+def print_transitions(transitions):
+    """ prints the transition counts of every group, a row per interest area and a column per next one """
+    for g, group in enumerate(transitions.groups):
+        print("interest area transitions, " + _group_name(group))
+        print("from \\ to " + " ".join("%8s" % label for label in transitions.labels))
+        for a, label in enumerate(transitions.labels):
+            print("%-9s " % label + " ".join("%8d" % count for count in transitions.counts[g, a].tolist()))
+        print("----------------------------------------")
+
+
+def dwell_rows(curves):
+    """ yields the rows of the dwell table, with the DWELL_COLUMNS """
+    for g, (condition, side) in enumerate(curves.groups):
+        for a, label in enumerate(curves.labels):
+            for w, start in enumerate(curves.window_starts.tolist()):
+                yield condition, side, label, start, float(curves.dwell[g, a, w]), float(curves.proportion[g, a, w])
+
+
+def transition_rows(transitions):
+    """ yields the rows of the transition table, with the TRANSITION_COLUMNS """
+    for g, (condition, side) in enumerate(transitions.groups):
+        for a, from_label in enumerate(transitions.labels):
+            for b, to_label in enumerate(transitions.labels):
+                yield (condition, side, from_label, to_label, int(transitions.counts[g, a, b]),
+                       float(transitions.probabilities[g, a, b]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="computes interest area dwell curves and transition matrices")
+    parser.add_argument("fixations")
+    parser.add_argument("--samples", help="samples file giving the condition of every trial, "
+                                          "if the fixations file has no condition column")
+    parser.add_argument("--window", type=float, default=WINDOW, help="window length in ms")
+    parser.add_argument("--step", type=float, default=STEP, help="ms between the window starts")
+    parser.add_argument("--max-time", type=float, default=MAX_TIME, help="end of the last window in ms")
+    parser.add_argument("--dwell-out", help="write the dwell curves to this .csv, .json, .jsonl or .parquet file")
+    parser.add_argument("--transitions-out", help="write the transitions to this .csv, .json, .jsonl or .parquet file")
+    parser.add_argument("--quiet", action="store_true", help="do not print the tables")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.enable_from_args(args)
+
+    store = fixation_store_from_file(args.fixations)
+    conditions = trial_conditions(store)
+    if conditions is None and args.samples:
+        from samples_processing import read_samples_chunked
+        conditions = trial_conditions(store, read_samples_chunked(args.samples))
+    curves = dwell_curves(store, conditions, args.window, args.step, args.max_time)
+    transitions = aoi_transitions(store, conditions)
+    if not args.quiet:
+        print_dwell_curves(curves)
+        print_transitions(transitions)
+    if args.dwell_out:
+        with RowWriter(args.dwell_out, DWELL_COLUMNS, types={"window_start": float, "dwell": float,
+                                                              "proportion": float}) as writer:
+            writer.write_rows(dwell_rows(curves))
+    if args.transitions_out:
+        with RowWriter(args.transitions_out, TRANSITION_COLUMNS, types={"count": int, "probability": float}) as writer:
+            writer.write_rows(transition_rows(transitions))
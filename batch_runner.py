@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import csv
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional
+
+import instrumentation
+from results import RowWriter, write_results
+from session_engine import SOURCES, load_session, report_analyses, run_analyses
+
+# name of the cohort files written to the output directory, with the extension of the result format
+COHORT_RESULTS = "cohort_results"
+COHORT_SESSIONS = "cohort_sessions.csv"
+COHORT_STIMULUS_INDEX = "cohort_stimulus_index.json"
+
+
+class SessionOutcome(NamedTuple):
+    """ what happened to a session of a batch, a row of cohort_sessions.csv """
+    name: str
+    status: str
+    attempts: int
+    seconds: float
+    trials: Optional[int]
+    error: Optional[str]
+
+
+def _no_plot(*args, **kwargs):
+    pass
+
+
+def discover_sessions(patterns):
+    """ groups the files matching glob patterns into sessions by the part of their name before
+        _samples, _fixations or _messages, e.g. study1/10viewers_samples.csv and study1/10viewers_fixations.csv
+        are the session 10viewers
+    inputs
+    ------
+    patterns: glob patterns, e.g. ["exports/*.csv"]
+    outputs
+    -------
+    sessions: list of (name, {source: path}) sorted by name
+    """
+    sessions = {}
+    prefixes = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            stem = os.path.splitext(os.path.basename(path))[0]
+            for source in SOURCES:
+                if stem.endswith("_" + source):
+                    name = stem[:-len(source) - 1]
+                    prefix = os.path.join(os.path.dirname(os.path.abspath(path)), name)
+                    if prefixes.setdefault(name, prefix) != prefix:
+                        raise ValueError("session %s is in both %s and %s, list the sessions in a manifest instead" % (
+                            name, os.path.dirname(prefixes[name]), os.path.dirname(prefix)))
+                    sessions.setdefault(name, {})[source] = path
+                    break
+    return sorted(sessions.items())
+
+
+def load_manifest(manifest_path):
+    """ reads the sessions of a batch from a csv manifest with the columns name, samples, fixations and
+        messages, for sessions whose files do not share a prefix. empty cells leave a source out and
+        relative paths are relative to the manifest
+    inputs
+    ------
+    manifest_path: string path to the manifest
+    outputs
+    -------
+    sessions: list of (name, {source: path}) in the order of the manifest
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    sessions = []
+    names = set()
+    with open(manifest_path, 'r', newline="") as file:
+        for row in csv.DictReader(file):
+            name = row["name"].strip()
+            if name in names:
+                raise ValueError("session %s is listed twice in %s" % (name, manifest_path))
+            names.add(name)
+            paths = {source: os.path.join(base_dir, row[source].strip()) for source in SOURCES
+                     if (row.get(source) or "").strip()}
+            sessions.append((name, paths))
+    return sessions
+
+
+def _session_dir(out_dir, name):
+    return os.path.join(out_dir, re.sub(r"[^A-Za-z0-9._-]+", "_", name))
+
+
+def check_session_names(sessions, out_dir):
+    """ raises a ValueError if two sessions have the same name or names writing to the same directory of
+        out_dir, e.g. "a b" and "a_b", or a session of a manifest that is also found by the glob patterns
+    inputs
+    ------
+    sessions: list of (name, {source: path}), e.g. from discover_sessions and load_manifest
+    out_dir: directory the results are written to
+    """
+    names = {}
+    for name, _ in sessions:
+        session_dir = _session_dir(out_dir, name)
+        if session_dir in names:
+            other = names[session_dir]
+            raise ValueError(("session %s is given twice" % name) if other == name else
+                             "sessions %s and %s would both write to %s" % (other, name, session_dir))
+        names[session_dir] = name
+
+
+def _analyze_session(name, paths, out_dir, render, formats, result_format):
+    """ parses and analyzes a session in a worker process and writes its results
+    outputs
+    -------
+    accumulators: the output of run_analyses, merged into the cohort summary
+    reports: {analysis: result}
+    renderer: HeadlessRenderer holding the queued plots, None if render is False
+    trials: number of trials of the session
+    """
+    from plot_rendering import HeadlessRenderer
+
+    session = load_session(paths.get("samples"), paths.get("fixations"), paths.get("messages"))
+    accumulators = run_analyses(session)
+    if "stimulus_index" in accumulators:
+        accumulators["stimulus_index"][0].sessions = [name]
+    session_dir = _session_dir(out_dir, name)
+    renderer = HeadlessRenderer(os.path.join(session_dir, "plots"), formats) if render else None
+    reports = report_analyses(accumulators, renderer.add_summaries if render else _no_plot, verbose=False)
+    os.makedirs(session_dir, exist_ok=True)
+    write_results(reports, os.path.join(session_dir, "results." + result_format))
+    return accumulators, reports, renderer, len(session)
+
+
+def _render(renderer):
+    """ writes the plots of a session in a worker process """
+    renderer.render()
+
+
+class _Progress:
+    """ prints a line per finished or failed session to stderr """
+
+    def __init__(self, total):
+        self.total = total
+        self.finished = 0
+
+    def failed(self, name, attempt, attempts, error):
+        print("[%d/%d] %s failed (attempt %d of %d): %s" % (self.finished, self.total, name, attempt, attempts, error),
+              file=sys.stderr, flush=True)
+
+    def done(self, outcome):
+        self.finished += 1
+        status = "done" if outcome.status == "ok" else "gave up"
+        print("[%d/%d] %s %s in %.1f s" % (self.finished, self.total, outcome.name, status, outcome.seconds),
+              file=sys.stderr, flush=True)
+
+
+class _Pool:
+    """ the process pool of a batch, replaced if a worker dies """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def replace(self, broken):
+        # only the first session noticing the broken pool replaces it
+        if self.executor is broken:
+            broken.shutdown(wait=False)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+
+async def _run_session(name, paths, pool, slots, progress, options):
+    """ runs the parse and analyze job of a session and then its render job, retrying failed attempts
+    outputs
+    -------
+    outcome: SessionOutcome
+    analysis: the output of _analyze_session, None if every attempt failed
+    """
+    loop = asyncio.get_running_loop()
+    attempts = options["retries"] + 1
+    start = time.perf_counter()
+    error = None
+    async with slots:
+        for attempt in range(1, attempts + 1):
+            executor = pool.executor
+            try:
+                # the stages and counters of the workers come back with the results
+                analysis, metrics = await loop.run_in_executor(
+                    executor, instrumentation.run_measured, options["measure"], _analyze_session, name, paths,
+                    options["out_dir"], options["render"], options["formats"], options["result_format"])
+                instrumentation.add_metrics(metrics)
+                if options["render"]:
+                    _, metrics = await loop.run_in_executor(executor, instrumentation.run_measured, options["measure"],
+                                                            _render, analysis[2])
+                    instrumentation.add_metrics(metrics)
+                outcome = SessionOutcome(name, "ok", attempt, time.perf_counter() - start, analysis[3], None)
+                progress.done(outcome)
+                return outcome, analysis
+            except Exception as exception:
+                if isinstance(exception, BrokenProcessPool):
+                    pool.replace(executor)
+                error = "%s: %s" % (type(exception).__name__, exception)
+                progress.failed(name, attempt, attempts, error)
+                if attempt < attempts:
+                    # back off, e.g. for files that are still being copied
+                    await asyncio.sleep(options["retry_delay"] * 2 ** (attempt - 1))
+
+    outcome = SessionOutcome(name, "failed", attempts, time.perf_counter() - start, None, error)
+    progress.done(outcome)
+    return outcome, None
+
+
+def merge_accumulators(analyses):
+    """ merges the accumulators of run_analyses of several sessions into the ones of the cohort
+    inputs
+    ------
+    analyses: list of outputs of run_analyses
+    outputs
+    -------
+    merged: {name: list of accumulators}, the first session's accumulators updated in place
+    """
+    merged = {}
+    for accumulators in analyses:
+        for name, session_accumulators in accumulators.items():
+            if name not in merged:
+                merged[name] = session_accumulators
+            else:
+                for accumulator, other in zip(merged[name], session_accumulators):
+                    accumulator.merge(other)
+    return merged
+
+
+async def _run_batch(sessions, options):
+    pool = _Pool(options["workers"])
+    slots = asyncio.Semaphore(options["jobs"])
+    progress = _Progress(len(sessions))
+    try:
+        return await asyncio.gather(*(_run_session(name, paths, pool, slots, progress, options)
+                                      for name, paths in sessions))
+    finally:
+        pool.executor.shutdown()
+
+
+@instrumentation.timed("run_batch")
+def run_batch(sessions, out_dir, workers=None, jobs=None, retries=2, retry_delay=1.0, render=True,
+              formats=("png",), result_format="json", verbose=True):
+    """ runs the analyses of many sessions in a process pool and writes a cohort summary.
+        every session is parsed and analyzed by one job and its plots rendered by another, so the pool
+        keeps parsing other sessions while plots are written. its results go to out_dir/<session>/ and the
+        cohort files to out_dir: COHORT_RESULTS with the merged results of all sessions and the results of
+        each session, COHORT_SESSIONS with a SessionOutcome per session and, for sessions with samples,
+        COHORT_STIMULUS_INDEX with the merged StimulusIndex. while instrumenting, the stages and counters of
+        the workers are added to the ones of this process
+    inputs
+    ------
+    sessions: list of (name, {source: path}), e.g. from discover_sessions or load_manifest, with names
+              writing to different directories (see check_session_names)
+    out_dir: directory the results are written to
+    workers: number of worker processes, defaults to the number of cores
+    jobs: maximum number of sessions in flight, defaults to twice the number of workers
+    retries: number of times a failed session is tried again
+    retry_delay: seconds before the first retry, doubled for every further retry
+    render: if True, writes the plots of every session and of the cohort
+    formats: file formats of the plots, see HeadlessRenderer
+    result_format: "json", "csv" or "parquet"
+    verbose: if True, prints the cohort results
+    outputs
+    -------
+    cohort: {analysis: result} of the cohort
+    outcomes: list of SessionOutcome, in the order of sessions
+    """
+    from plot_rendering import HeadlessRenderer
+
+    check_session_names(sessions, out_dir)
+    workers = workers or os.cpu_count() or 1
+    options = {"out_dir": out_dir, "workers": workers, "jobs": jobs or 2 * workers, "retries": retries,
+               "retry_delay": retry_delay, "render": render, "formats": tuple(formats), "result_format": result_format,
+               "measure": instrumentation.worker_options()}
+    os.makedirs(out_dir, exist_ok=True)
+    finished = asyncio.run(_run_batch(sessions, options))
+    outcomes = [outcome for outcome, _ in finished]
+    analyses = [analysis for _, analysis in finished if analysis is not None]
+
+    merged = merge_accumulators([analysis[0] for analysis in analyses])
+    renderer = HeadlessRenderer(os.path.join(out_dir, "cohort_plots"), formats) if render else None
+    cohort = report_analyses(merged, renderer.add_summaries if render else _no_plot, verbose)
+    if render:
+        renderer.render()
+
+    session_reports = {outcome.name: analysis[1] for outcome, analysis in finished if analysis is not None}
+    write_results({"cohort": cohort, "sessions": session_reports},
+                  os.path.join(out_dir, COHORT_RESULTS + "." + result_format))
+    with RowWriter(os.path.join(out_dir, COHORT_SESSIONS), SessionOutcome._fields) as writer:
+        writer.write_rows(outcomes)
+    if "stimulus_index" in merged:
+        merged["stimulus_index"][0].save(os.path.join(out_dir, COHORT_STIMULUS_INDEX))
+    return cohort, outcomes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="runs the analyses of many session exports and summarizes the cohort")
+    parser.add_argument("patterns", nargs="*", help="glob patterns of the session files, e.g. 'exports/*.csv'")
+    parser.add_argument("--manifest", help="csv with the columns name, samples, fixations and messages")
+    parser.add_argument("--out-dir", default="batch_results")
+    parser.add_argument("--workers", type=int, help="worker processes, defaults to the number of cores")
+    parser.add_argument("--jobs", type=int, help="sessions in flight, defaults to twice the number of workers")
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--retry-delay", type=float, default=1.0, help="seconds before the first retry")
+    parser.add_argument("--no-plots", action="store_true", help="do not render the plots")
+    parser.add_argument("--formats", nargs="+", default=["png"], help="file formats of the plots")
+    parser.add_argument("--result-format", choices=("json", "csv", "parquet"), default="json")
+    parser.add_argument("--quiet", action="store_true", help="do not print the cohort results")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.enable_from_args(args)
+
+    sessions = load_manifest(args.manifest) if args.manifest else []
+    sessions += discover_sessions(args.patterns)
+    if not sessions:
+        parser.error("no sessions found, give glob patterns or a manifest")
+    try:
+        check_session_names(sessions, args.out_dir)
+    except ValueError as error:
+        parser.error(str(error))
+    _, outcomes = run_batch(sessions, args.out_dir, args.workers, args.jobs, args.retries, args.retry_delay,
+                            not args.no_plots, args.formats, args.result_format, not args.quiet)
+    failed = [outcome.name for outcome in outcomes if outcome.status != "ok"]
+    print("%d sessions, %d failed%s" % (len(outcomes), len(failed), (": " + ", ".join(failed)) if failed else ""),
+          file=sys.stderr)
+    if failed:
+        sys.exit(1)
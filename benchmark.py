@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from instrumentation import peak_rss_mb
+from synthetic_data import VERSION as SYNTHETIC_VERSION, generate_session
+
+# stage name -> (input file kind, what the stage does)
+STAGES = {
+    "read_samples": ("samples", "original samples reader"),
+    "read_samples_chunked": ("samples", "chunked samples reader"),
+    "read_fixations": ("fixations", "fixations reader"),
+    "read_messages": ("messages", "messages reader"),
+    "saccade_accuracy_helper": ("samples", "first and last saccade accuracy of a parsed samples file"),
+    "first_saccade_time_and_accuracy": ("fixations", "first saccade report of a parsed fixations file"),
+    "avg_search_time": ("fixations", "search time report of a parsed fixations file"),
+    "fixation_store": ("fixations", "fixations file to a TrialStore"),
+    "first_saccade_kernel": ("fixations", "batched first saccade report of a TrialStore"),
+    "search_time_kernel": ("fixations", "batched search time report of a TrialStore"),
+    "saccade_detection": ("samples", "streaming I-VT saccade detection of a samples file"),
+}
+
+
+def _no_plot(*args, **kwargs):
+    pass
+
+
+def _run_stage(stage, path):
+    """ runs one stage and times the part the stage measures. runs in a fresh process, so the peak
+        RSS is the one of this stage alone (including the parsing analyses need first)
+    inputs
+    ------
+    stage: one of STAGES
+    path: string path to the input file of the stage
+    outputs
+    -------
+    seconds: time of the measured part
+    peak_rss_mb: peak resident set size of the process
+    """
+    # imported here so the import time and memory are not part of the parent process
+    import event_detection
+    import fixation_kernels
+    import fixations_processing
+    import messages_processing
+    import samples_processing
+    import trial_store
+
+    readers = {
+        "read_samples": samples_processing.read_samples,
+        "read_samples_chunked": samples_processing.read_samples_chunked,
+        "read_fixations": fixations_processing.read_fixations,
+        "read_messages": messages_processing.read_messages,
+        "fixation_store": trial_store.fixation_store_from_file,
+        "saccade_detection": event_detection.detect_saccades,
+    }
+    analyses = {
+        "saccade_accuracy_helper": (samples_processing.read_samples_chunked, lambda samples_dict: (
+            samples_processing.saccade_accuracy_helper(samples_dict, 0),
+            samples_processing.saccade_accuracy_helper(samples_dict, -1))),
+        "first_saccade_time_and_accuracy": (fixations_processing.read_fixations, lambda fixation_dict:
+            fixations_processing.first_saccade_time_and_accuracy(fixation_dict, plot=_no_plot)),
+        "avg_search_time": (fixations_processing.read_fixations, lambda fixation_dict:
+            fixations_processing.avg_search_time(fixation_dict, plot=_no_plot)),
+        "first_saccade_kernel": (trial_store.fixation_store_from_file, lambda store:
+            fixation_kernels.first_saccade_time_and_accuracy_store(store, plot=_no_plot)),
+        "search_time_kernel": (trial_store.fixation_store_from_file, lambda store:
+            fixation_kernels.avg_search_time_store(store, plot=_no_plot)),
+    }
+
+    # the reports print their statistics, which would only clutter the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stage in readers:
+            start = time.perf_counter()
+            readers[stage](path)
+            seconds = time.perf_counter() - start
+        else:
+            reader, analysis = analyses[stage]
+            parsed = reader(path)
+            start = time.perf_counter()
+            analysis(parsed)
+            seconds = time.perf_counter() - start
+    return seconds, peak_rss_mb()
+
+
+def count_rows(path):
+    """ returns the number of data lines of a file, without the header """
+    with open(path, 'rb') as file:
+        return sum(block.count(b"\n") for block in iter(lambda: file.read(1024 * 1024), b"")) - 1
+
+
+def run_benchmarks(paths, stages=None, repeat=3):
+    """ runs every stage repeat times, each time in a new process
+    inputs
+    ------
+    paths: dictionary of "samples", "fixations" and "messages" to the input files
+    stages: names of the stages to run, defaults to all of STAGES
+    repeat: number of runs per stage, the fastest one is reported
+    outputs
+    -------
+    results: dictionary of stage name to a dictionary of seconds, rows, rows_per_second, peak_rss_mb and runs
+    """
+    rows = {kind: count_rows(path) for kind, path in paths.items()}
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for stage in stages or STAGES:
+        kind, _ = STAGES[stage]
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(_run_stage, stage, paths[kind]).result())
+        seconds = min(run_seconds for run_seconds, _ in runs)
+        results[stage] = {
+            "seconds": seconds,
+            "rows": rows[kind],
+            "rows_per_second": rows[kind] / seconds if seconds > 0 else None,
+            "peak_rss_mb": max(peak for _, peak in runs),
+            "runs": [run_seconds for run_seconds, _ in runs],
+        }
+    return results
+
+
+def environment():
+    """ returns the versions and machine details that affect the timings """
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, previous, tolerance=0.1):
+    """ compares the stages of two benchmark runs
+    inputs
+    ------
+    results: stage results of the new run
+    previous: stage results of the old run
+    tolerance: relative slowdown or memory growth above which a stage counts as a regression
+    outputs
+    -------
+    regressions: list of (stage, metric, old value, new value)
+    """
+    regressions = []
+    for stage, result in results.items():
+        if stage not in previous:
+            continue
+        for metric in ("seconds", "peak_rss_mb"):
+            old = previous[stage][metric]
+            new = result[metric]
+            if new > old * (1 + tolerance):
+                regressions.append((stage, metric, old, new))
+    return regressions
+
+
+def print_results(results, previous=None):
+    """ prints a table of the stage results, with the change to a previous run if given """
+    print("%-32s %10s %10s %14s %12s" % ("stage", "seconds", "rows", "rows/s", "peak MB"))
+    for stage, result in results.items():
+        line = "%-32s %10.3f %10d %14.0f %12.1f" % (stage, result["seconds"], result["rows"],
+                                                    result["rows_per_second"] or 0, result["peak_rss_mb"])
+        if previous and stage in previous:
+            line += "   (%+.1f%% time)" % ((result["seconds"] / previous[stage]["seconds"] - 1) * 100)
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmarks the readers and analyses on a synthetic session")
+    parser.add_argument("--participants", type=int, default=10)
+    parser.add_argument("--trials", type=int, default=100)
+    parser.add_argument("--samples-per-trial", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default="benchmark_data", help="directory the synthetic files are written to")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), help="stages to run, defaults to all")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the fastest one is reported")
+    parser.add_argument("--out", help="JSON file the results are saved to")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative slowdown or memory growth reported as a regression")
+    args = parser.parse_args()
+
+    config = {"participants": args.participants, "trials": args.trials,
+              "samples_per_trial": args.samples_per_trial, "seed": args.seed}
+    prefix = os.path.join(args.data_dir, "synthetic_v%d_%d_%d_%d_%d" % (
+        SYNTHETIC_VERSION, args.participants, args.trials, args.samples_per_trial, args.seed))
+    paths = {kind: "%s_%s.csv" % (prefix, kind) for kind in ("samples", "fixations", "messages")}
+    # the generator is deterministic, so existing files with the same configuration are reused
+    if not all(os.path.exists(path) for path in paths.values()):
+        paths = generate_session(prefix, **config)
+
+    results = run_benchmarks(paths, args.stages, args.repeat)
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            previous_run = json.load(file)
+        if previous_run["config"] != config:
+            print("warning: the compared run used a different configuration " + json.dumps(previous_run["config"]))
+        previous = previous_run["results"]
+    print_results(results, previous)
+
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump({"config": config, "environment": environment(), "results": results}, file, indent=2)
+
+    if previous is not None:
+        regressions = compare(results, previous, args.tolerance)
+        for stage, metric, old, new in regressions:
+            print("regression: %s %s %.3f -> %.3f" % (stage, metric, old, new))
+        if regressions:
+            sys.exit(1)
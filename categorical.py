@@ -0,0 +1,89 @@
+import sys
+
+import numpy as np
+
+# the categorical fields of the trials and events, coded by a TrialStore, which keeps the participants in their own array
+FIELDS = ("trial", "aoi", "side", "condition", "file_name", "saccade")
+
+
+def code_dtype(num_labels):
+    """ returns the smallest signed integer dtype holding the codes of num_labels labels and the
+        missing code -1
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if num_labels <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class Categories:
+    """ dictionary of the labels of a categorical field, e.g. the interest areas "[ ]", "[ 1]" and "[ 2]".
+        every label gets the next small integer code the first time it is seen, so columns of labels can be
+        stored and compared as arrays of codes and decoded again for reports
+        inputs
+        ------
+        labels: labels to code in order, e.g. the labels array of a saved TrialStore
+    """
+
+    def __init__(self, labels=()):
+        self.labels = []
+        self.codes = {}
+        for label in labels:
+            self.code(label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        return label in self.codes
+
+    def code(self, label):
+        """ returns the code of a label, adding it if it is new """
+        code = self.codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            # the dictionary keeps the one copy of the label every row refers to
+            label = sys.intern(label) if isinstance(label, str) else label
+            self.codes[label] = code
+            self.labels.append(label)
+        return code
+
+    def encode(self, labels):
+        """ returns the codes of a sequence of labels as an array, adding the new labels """
+        codes = [self.code(label) for label in labels]
+        return np.array(codes, dtype=code_dtype(len(self.labels)))
+
+    def decode(self, codes):
+        """ returns the labels of an array or list of codes, None for the missing code -1 """
+        labels = self.labels
+        return [labels[code] if code >= 0 else None for code in np.asarray(codes).tolist()]
+
+    def to_array(self):
+        """ returns the labels as a numpy string array, e.g. to save them next to the codes """
+        return np.array(self.labels, dtype=str)
+
+
+class CategoricalEncoding:
+    """ the Categories of a set of fields, e.g. the ones of a TrialStore
+        inputs
+        ------
+        fields: names of the fields, FIELDS by default
+    """
+
+    def __init__(self, fields=FIELDS):
+        self.fields = {field: Categories() for field in fields}
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def code(self, field, label):
+        """ returns the code of a label of a field, adding it if it is new """
+        return self.fields[field].code(label)
+
+    def decode(self, field, codes):
+        """ returns the labels of codes of a field """
+        return self.fields[field].decode(codes)
+
+    def label_arrays(self):
+        """ returns {"<field>_labels": labels array} of every field """
+        return {field + "_labels": categories.to_array() for field, categories in self.fields.items()}
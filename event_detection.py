@@ -0,0 +1,295 @@
+import argparse
+import time
+
+import numpy as np
+
+import instrumentation
+from row_filter import DEFAULT_FILTER
+from samples_processing import CHUNK_SIZE, gaze_columns, parse_gaze_chunk
+
+METHODS = ("ivt", "idt")
+# screen pixels per degree of visual angle, for a 1920 pixel wide screen spanning about 55 degrees
+PIXELS_PER_DEGREE = 35.0
+# I-VT: samples faster than this many degrees per second are part of a saccade
+VELOCITY_THRESHOLD = 30.0
+# I-DT: windows of at least FIXATION_DURATION ms whose dispersion, (max x - min x) + (max y - min y),
+# is at most DISPERSION_THRESHOLD degrees are fixations
+DISPERSION_THRESHOLD = 1.0
+FIXATION_DURATION = 100.0
+EVENT_COLUMNS = ("participant", "trial", "onset", "offset", "amplitude", "peak_velocity")
+
+
+def _concat_gaze(first, second):
+    return {name: np.concatenate((first[name], second[name])) for name in first}
+
+
+def _slice_gaze(gaze, start, end):
+    return {name: values[start:end] for name, values in gaze.items()}
+
+
+def _trial_starts(gaze):
+    """ returns a boolean array, True for the first sample of each trial """
+    participants = gaze["participant"]
+    trials = gaze["trial"]
+    new_trial = np.empty(len(participants), dtype=bool)
+    new_trial[:1] = True
+    new_trial[1:] = (participants[1:] != participants[:-1]) | (trials[1:] != trials[:-1])
+    return new_trial
+
+
+def sample_velocities(gaze, new_trial, window=1, pixels_per_degree=PIXELS_PER_DEGREE):
+    """ computes the gaze velocity of every sample from the positions window samples before and after it
+    inputs
+    ------
+    gaze: column arrays returned by parse_gaze_chunk
+    new_trial: boolean array, True for the first sample of each trial
+    window: number of samples on each side, 1 is the usual three sample central difference and larger
+            windows smooth noisy recordings
+    pixels_per_degree: screen pixels per degree of visual angle
+    outputs
+    -------
+    velocity: float array in degrees per second, nan for samples within window samples of the edge of
+              their trial and for samples whose position or the positions window samples away are missing
+    """
+    num_samples = len(new_trial)
+    velocity = np.full(num_samples, np.nan)
+    if num_samples <= 2 * window:
+        return velocity
+    trial_ids = np.cumsum(new_trial)
+    before = slice(0, num_samples - 2 * window)
+    after = slice(2 * window, num_samples)
+    distance = np.hypot(gaze["x"][after] - gaze["x"][before], gaze["y"][after] - gaze["y"][before])
+    duration = gaze["time"][after] - gaze["time"][before]
+    same_trial = trial_ids[after] == trial_ids[before]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        central = distance / pixels_per_degree / duration * 1000
+    velocity[window:num_samples - window] = np.where(same_trial & (duration > 0), central, np.nan)
+    velocity[np.isnan(gaze["x"]) | np.isnan(gaze["y"])] = np.nan
+    return velocity
+
+
+def _runs(mask):
+    """ returns the first and last index of each run of True values of a boolean array """
+    padded = np.concatenate(([False], mask, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return changes[0::2], changes[1::2] - 1
+
+
+def _run_max(values, starts, ends):
+    """ returns the maximum of values[start:end + 1] of each run, ignoring nans """
+    if len(starts) == 0:
+        return np.empty(0)
+    # reduce over [start, end + 1) and drop the reductions over the gaps between the runs
+    extended = np.append(values, np.nan)
+    bounds = np.empty(2 * len(starts), dtype=np.int64)
+    bounds[0::2] = starts
+    bounds[1::2] = ends + 1
+    return np.fmax.reduceat(extended, bounds)[0::2]
+
+
+def _events(gaze, onsets, offsets, velocity, pixels_per_degree):
+    """ builds the event columns of the saccades going from sample onsets to sample offsets """
+    amplitude = np.hypot(gaze["x"][offsets] - gaze["x"][onsets], gaze["y"][offsets] - gaze["y"][onsets])
+    return {
+        "participant": gaze["participant"][onsets],
+        "trial": gaze["trial"][onsets],
+        "onset": gaze["time"][onsets],
+        "offset": gaze["time"][offsets],
+        "amplitude": amplitude / pixels_per_degree,
+        "peak_velocity": _run_max(velocity, onsets, offsets),
+    }
+
+
+@instrumentation.timed("detect_ivt")
+def detect_ivt(gaze, velocity_threshold=VELOCITY_THRESHOLD, min_duration=0.0, window=1,
+               pixels_per_degree=PIXELS_PER_DEGREE):
+    """ velocity threshold (I-VT) saccade detection over whole trials of gaze samples.
+        a saccade is a run of samples faster than the threshold, missing samples end a saccade
+    inputs
+    ------
+    gaze: column arrays returned by parse_gaze_chunk, holding whole trials
+    velocity_threshold: degrees per second
+    min_duration: shortest saccade kept, in ms from the first to the last sample
+    window: samples on each side the velocity is computed over, see sample_velocities
+    pixels_per_degree: screen pixels per degree of visual angle
+    outputs
+    -------
+    events: {column: array} with a row per saccade, see EVENT_COLUMNS. amplitude is in degrees from the
+            first to the last sample of the saccade and peak_velocity in degrees per second
+    """
+    new_trial = _trial_starts(gaze)
+    velocity = sample_velocities(gaze, new_trial, window, pixels_per_degree)
+    # the velocity is nan across trial boundaries, so no run spans two trials
+    onsets, offsets = _runs(velocity > velocity_threshold)
+    long_enough = gaze["time"][offsets] - gaze["time"][onsets] >= min_duration
+    return _events(gaze, onsets[long_enough], offsets[long_enough], velocity, pixels_per_degree)
+
+
+@instrumentation.timed("detect_idt")
+def detect_idt(gaze, dispersion_threshold=DISPERSION_THRESHOLD, fixation_duration=FIXATION_DURATION,
+               min_duration=0.0, window=1, pixels_per_degree=PIXELS_PER_DEGREE):
+    """ dispersion threshold (I-DT) saccade detection over whole trials of gaze samples.
+        a sample is part of a fixation if any window of fixation_duration containing it has a dispersion
+        of at most the threshold, which is the usual growing window algorithm with every window tested at
+        once. a saccade goes from the last sample of a fixation to the first sample of the next fixation of
+        the same trial, gaps holding missing samples are blinks and not saccades
+    inputs
+    ------
+    gaze: column arrays returned by parse_gaze_chunk, holding whole trials
+    dispersion_threshold: degrees
+    fixation_duration: shortest fixation in ms, converted to a number of samples with the median interval of the chunk
+    min_duration: shortest saccade kept, in ms from onset to offset
+    window: samples on each side the peak velocity is computed over, see sample_velocities
+    pixels_per_degree: screen pixels per degree of visual angle
+    outputs
+    -------
+    events: {column: array} with a row per saccade, see EVENT_COLUMNS
+    """
+    new_trial = _trial_starts(gaze)
+    velocity = sample_velocities(gaze, new_trial, window, pixels_per_degree)
+    num_samples = len(new_trial)
+    times = gaze["time"]
+    intervals = np.diff(times)[~new_trial[1:]]
+    intervals = intervals[intervals > 0]
+    if len(intervals) == 0:
+        return _events(gaze, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), velocity, pixels_per_degree)
+    window_samples = max(int(round(fixation_duration / np.median(intervals))) + 1, 2)
+    if num_samples < window_samples:
+        return _events(gaze, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), velocity, pixels_per_degree)
+
+    # dispersion of every window of window_samples samples, nan if a position is missing
+    x_windows = np.lib.stride_tricks.sliding_window_view(gaze["x"], window_samples)
+    y_windows = np.lib.stride_tricks.sliding_window_view(gaze["y"], window_samples)
+    dispersion = (np.ptp(x_windows, axis=1) + np.ptp(y_windows, axis=1)) / pixels_per_degree
+    trial_ids = np.cumsum(new_trial)
+    same_trial = trial_ids[window_samples - 1:] == trial_ids[:num_samples - window_samples + 1]
+    fixation_window = same_trial & (dispersion <= dispersion_threshold)
+
+    # a sample is covered by the windows starting at most window_samples - 1 samples before it
+    covered = np.concatenate(([0], np.cumsum(fixation_window)))
+    first_window = np.maximum(np.arange(num_samples) - window_samples + 1, 0)
+    last_window = np.minimum(np.arange(num_samples), len(fixation_window) - 1)
+    fixation = covered[last_window + 1] - covered[first_window] > 0
+
+    # saccades are the gaps between two fixations of the same trial
+    gap_starts, gap_ends = _runs(~fixation)
+    onsets = gap_starts - 1
+    offsets = gap_ends + 1
+    inside = (onsets >= 0) & (offsets < num_samples)
+    onsets, offsets = onsets[inside], offsets[inside]
+    missing = np.isnan(gaze["x"]) | np.isnan(gaze["y"])
+    missing_counts = np.concatenate(([0], np.cumsum(missing)))
+    keep = ((trial_ids[onsets] == trial_ids[offsets])
+            & (missing_counts[offsets] == missing_counts[onsets + 1])
+            & (times[offsets] - times[onsets] >= min_duration))
+    return _events(gaze, onsets[keep], offsets[keep], velocity, pixels_per_degree)
+
+
+DETECTORS = {"ivt": detect_ivt, "idt": detect_idt}
+
+
+def iter_saccade_events(samples_path, method="ivt", chunk_size=CHUNK_SIZE, row_filter=DEFAULT_FILTER, **params):
+    """ streams the samples file in chunks and detects the saccades of each trial once all its samples are read.
+        the samples of the last trial of a chunk are carried over to the next chunk instead of rereading them,
+        so memory use is bounded by the chunk size and the longest trial.
+        assumes the rows of a trial are contiguous in the file, like in the exports.
+    inputs
+    ------
+    samples_path: string path to the samples file
+    method: "ivt" (velocity threshold) or "idt" (dispersion threshold)
+    chunk_size: number of characters parsed at once
+    row_filter: RowFilter selecting the rows to keep, by default every participant but nikki
+    params: thresholds passed to detect_ivt or detect_idt
+    outputs
+    -------
+    yields (events, num_samples) for each chunk of whole trials, where events are the column arrays returned by
+    the detector and num_samples is the number of samples they were detected in
+    """
+    if method not in DETECTORS:
+        raise ValueError("method must be one of " + ", ".join(METHODS))
+    detect = DETECTORS[method]
+    carry = None
+    with open(samples_path, 'r') as file:
+        columns = gaze_columns(next(file, None))
+        while True:
+            # read whole lines only
+            text = file.read(chunk_size)
+            if not text:
+                break
+            text += file.readline()
+            gaze = parse_gaze_chunk(text, columns, row_filter)
+            if carry is not None:
+                gaze = _concat_gaze(carry, gaze)
+            if len(gaze["time"]) == 0:
+                continue
+
+            # the last trial may continue in the next chunk
+            last_start = int(np.flatnonzero(_trial_starts(gaze))[-1])
+            carry = _slice_gaze(gaze, last_start, None)
+            if last_start > 0:
+                yield detect(_slice_gaze(gaze, 0, last_start), **params), last_start
+
+    if carry is not None and len(carry["time"]):
+        yield detect(carry, **params), len(carry["time"])
+
+
+def detect_saccades(samples_path, method="ivt", chunk_size=CHUNK_SIZE, row_filter=DEFAULT_FILTER, **params):
+    """ detects the saccades of every trial of the samples file, see iter_saccade_events
+    outputs
+    -------
+    res_dict: {participant: {trial: [(onset, offset, amplitude, peak_velocity), ...]}} with the participant and
+              trial keys read_samples uses and the saccades of each trial in time order
+    """
+    res_dict = {}
+    for events, _ in iter_saccade_events(samples_path, method, chunk_size, row_filter, **params):
+        rows = zip(events["participant"].astype(str).tolist(), events["trial"].astype(str).tolist(),
+                   events["onset"].tolist(), events["offset"].tolist(), events["amplitude"].tolist(),
+                   events["peak_velocity"].tolist())
+        for participant, trial, onset, offset, amplitude, peak_velocity in rows:
+            if participant not in res_dict:
+                res_dict[participant] = {}
+            if trial not in res_dict[participant]:
+                res_dict[participant][trial] = []
+            res_dict[participant][trial].append((onset, offset, amplitude, peak_velocity))
+    return res_dict
+
+
+def print_saccade_events(num_saccades, num_samples, amplitudes, peak_velocities, duration):
+    """ prints a summary of the saccades detected by iter_saccade_events and the processing rate """
+    print("saccades detected: " + str(num_saccades) + " in " + str(num_samples) + " samples")
+    if num_saccades:
+        print("average amplitude (degrees): " + str(amplitudes / num_saccades))
+        print("average peak velocity (degrees/s): " + str(peak_velocities / num_saccades))
+    if duration > 0:
+        print("samples processed per second: " + str(int(num_samples / duration)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="detects the saccades in the gaze samples of a samples file")
+    parser.add_argument("samples")
+    parser.add_argument("--method", choices=METHODS, default="ivt")
+    parser.add_argument("--velocity-threshold", type=float, default=VELOCITY_THRESHOLD, help="I-VT, degrees/s")
+    parser.add_argument("--dispersion-threshold", type=float, default=DISPERSION_THRESHOLD, help="I-DT, degrees")
+    parser.add_argument("--fixation-duration", type=float, default=FIXATION_DURATION, help="I-DT, ms")
+    parser.add_argument("--min-duration", type=float, default=0.0, help="shortest saccade kept, ms")
+    parser.add_argument("--window", type=int, default=1, help="samples on each side of the velocity estimate")
+    parser.add_argument("--pixels-per-degree", type=float, default=PIXELS_PER_DEGREE)
+    args = parser.parse_args()
+    instrumentation.enable_from_env()
+
+    params = {"min_duration": args.min_duration, "window": args.window, "pixels_per_degree": args.pixels_per_degree}
+    if args.method == "ivt":
+        params["velocity_threshold"] = args.velocity_threshold
+    else:
+        params["dispersion_threshold"] = args.dispersion_threshold
+        params["fixation_duration"] = args.fixation_duration
+
+    start = time.perf_counter()
+    num_saccades = num_samples = 0
+    amplitudes = peak_velocities = 0.0
+    for events, chunk_samples in iter_saccade_events(args.samples, args.method, **params):
+        num_saccades += len(events["onset"])
+        num_samples += chunk_samples
+        amplitudes += float(events["amplitude"].sum())
+        peak_velocities += float(np.nansum(events["peak_velocity"]))
+    print_saccade_events(num_saccades, num_samples, amplitudes, peak_velocities, time.perf_counter() - start)
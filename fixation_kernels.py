@@ -0,0 +1,161 @@
+import warnings
+
+import numpy as np
+
+import instrumentation
+from fixations_processing import report_first_saccades, report_search_times
+
+
+def first_saccade_kernel(store):
+    """ finds the first fixation on an interest area ("[ 1]" or "[ 2]") after the first fixation of
+        every trial at once, using segmented minimums over the flat fixation arrays
+        inputs
+        ------
+        store: TrialStore of kind "fixations"
+        outputs
+        -------
+        hit: array of the interest area of the first saccade per trial, 1, 2 or 0 if there is none
+        latency: array of the time from the end of the previous fixation to the start of that fixation,
+                 nan if there is none
+    """
+    num_trials = len(store.trials)
+    starts = store.event_offsets[:-1]
+    ends = store.event_offsets[1:]
+    aoi = np.asarray(store.aoi)
+    positions = np.arange(len(aoi))
+
+    first_code = store.code("aoi", "[ 1]")
+    second_code = store.code("aoi", "[ 2]")
+    # the first fixation of a trial can not be the target of a saccade
+    on_interest_area = (aoi == first_code) | (aoi == second_code)
+    on_interest_area[starts] = False
+
+    hit = np.zeros(num_trials, dtype=np.int8)
+    latency = np.full(num_trials, np.nan)
+    if len(aoi) == 0:
+        return hit, latency
+
+    first = np.minimum.reduceat(np.where(on_interest_area, positions, len(aoi)), starts)
+    found = first < ends
+    found_first = first[found]
+    hit[found] = np.where(aoi[found_first] == first_code, 1, 2)
+    latency[found] = np.asarray(store.start)[found_first] - np.asarray(store.end)[found_first - 1]
+    return hit, latency
+
+
+def search_time_kernel(store):
+    """ finds the search time (end of the fixations on the crosshairs to the start of the final run of
+        fixations on the same interest area) of every trial at once, using segmented operations over
+        the flat fixation arrays
+        inputs
+        ------
+        store: TrialStore of kind "fixations"
+        outputs
+        -------
+        search_time: array of the search time per trial, nan for trials that only fixate the crosshairs
+        final_aoi: array of the interest area code (into store.aoi_labels) of the final run, -1 if there is none
+    """
+    num_trials = len(store.trials)
+    starts = store.event_offsets[:-1]
+    ends = store.event_offsets[1:]
+    aoi = np.asarray(store.aoi)
+    fixation_start = np.asarray(store.start)
+    fixation_end = np.asarray(store.end)
+    positions = np.arange(len(aoi))
+
+    search_time = np.full(num_trials, np.nan)
+    final_aoi = np.full(num_trials, -1, dtype=np.int64)
+    if len(aoi) == 0:
+        return search_time, final_aoi
+
+    off_crosshairs = aoi != store.code("aoi", "[ ]")
+    first_off = np.minimum.reduceat(np.where(off_crosshairs, positions, len(aoi)), starts)
+    last_off = np.maximum.reduceat(np.where(off_crosshairs, positions, -1), starts)
+    valid = first_off < ends
+
+    # the search starts at the end of the last leading crosshair fixation, or at 0 without one
+    leading = valid & (first_off > starts)
+    start_time = np.zeros(num_trials)
+    start_time[leading] = fixation_end[first_off[leading] - 1]
+
+    # start of the run of equal interest areas every fixation belongs to
+    new_run = np.ones(len(aoi), dtype=bool)
+    new_run[1:] = aoi[1:] != aoi[:-1]
+    new_run[starts] = True
+    run_start = np.maximum.accumulate(np.where(new_run, positions, 0))
+
+    last = last_off[valid]
+    search_time[valid] = fixation_start[run_start[last]] - start_time[valid]
+    final_aoi[valid] = aoi[last]
+    return search_time, final_aoi
+
+
+def first_saccade_times_store(store):
+    """ batched version of fixations_processing.first_saccade_times for a TrialStore
+        inputs
+        ------
+        store: TrialStore of kind "fixations"
+        outputs
+        -------
+        the same lists and counts, in the same order, as first_saccade_times
+    """
+    hit, latency = first_saccade_kernel(store)
+    side = np.asarray(store.orig_side)
+    left = side == store.code("side", "Left")
+    right = side == store.code("side", "Right")
+    return (latency[left & (hit == 1)].tolist(), latency[left & (hit == 2)].tolist(), int(left.sum()),
+            latency[right & (hit == 2)].tolist(), latency[right & (hit == 1)].tolist(), int(right.sum()))
+
+
+def search_times_store(store):
+    """ batched version of fixations_processing.search_times for a TrialStore
+        inputs
+        ------
+        store: TrialStore of kind "fixations"
+        outputs
+        -------
+        the same lists, in the same order, as search_times, without the trials that only fixate the crosshairs
+    """
+    search_time, final_aoi = search_time_kernel(store)
+    # search_times fails on the trials that only fixate the crosshairs, they are left out with a warning
+    searched = ~np.isnan(search_time)
+    skipped = len(search_time) - int(searched.sum())
+    if skipped:
+        instrumentation.count("search_trials_skipped", skipped)
+        warnings.warn("left out %d trials without a fixation on an interest area from the search times" % skipped)
+    is_left = np.asarray(store.orig_side) == store.code("side", "Left")
+    left = is_left & searched
+    right = ~is_left & searched
+    l_acc = left & (final_aoi == store.code("aoi", "[ 1]"))
+    r_acc = right & (final_aoi == store.code("aoi", "[ 2]"))
+    return (search_time[left].tolist(), search_time[right].tolist(),
+            search_time[l_acc].tolist(), search_time[left & ~l_acc].tolist(),
+            search_time[r_acc].tolist(), search_time[right & ~r_acc].tolist())
+
+
+def first_saccade_time_and_accuracy_store(store, plot=None, verbose=True):
+    """ fixations_processing.first_saccade_time_and_accuracy computed with first_saccade_kernel
+        input
+        -----
+        store: TrialStore of kind "fixations"
+        plot: function with the signature of plot_time_proportions, defaults to plot_time_proportions
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        result: FirstSaccadeResult
+    """
+    return report_first_saccades(*first_saccade_times_store(store), plot=plot, verbose=verbose)
+
+
+def avg_search_time_store(store, plot=None, verbose=True):
+    """ fixations_processing.avg_search_time computed with search_time_kernel
+        input
+        -----
+        store: TrialStore of kind "fixations"
+        plot: function with the signature of plot_time_proportions, defaults to plot_time_proportions
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        result: SearchTimeResult
+    """
+    return report_search_times(*search_times_store(store), plot=plot, verbose=verbose)
@@ -1,17 +1,50 @@
+import csv
+import sys
+import warnings
+
 import matplotlib.pyplot as plt
 import numpy as np
 
-def read_fixations(fixations_path):
-    """ takes in the fixations file and organizes it into a dictionary
+import instrumentation
+from results import FirstSaccadeResult, SearchTimeResult, TimeStats
+from row_filter import DEFAULT_FILTER
+from schema import resolve_columns
+from streaming_stats import TimeSummary
+
+# columns of the fixations file in the original exports, used for files whose header has none of the
+# FIXATION_ALIASES. a RowFilter can look at the participant, trial, side and time, the condition is only read
+# from a header naming its column
+FIXATION_COLUMNS = {"participant": 0, "trial": 1, "side": 6, "time": 11, "end": 13, "aoi": 14}
+# names of the columns read_fixations needs in the Data Viewer exports
+FIXATION_ALIASES = {
+    "participant": ("RECORDING_SESSION_LABEL", "Session_Name_"),
+    "trial": ("TRIAL_INDEX", "Trial_Index_"),
+    "side": ("orig_side",),
+    "condition": ("condition",),
+    "time": ("CURRENT_FIX_START",),
+    "end": ("CURRENT_FIX_END",),
+    "aoi": ("CURRENT_FIX_INTEREST_AREAS",),
+}
+# fields of FIXATION_ALIASES that exports without the column are read without
+OPTIONAL_FIXATION_FIELDS = ("condition",)
+
+@instrumentation.timed("read_fixations")
+def read_fixations(fixations_path, row_filter=DEFAULT_FILTER):
+    """ takes in the fixations file and organizes it into a dictionary. the columns are found by their
+        names in the header (see FIXATION_ALIASES), quoted fields are read with the csv module and malformed
+        rows are skipped with a warning
     inputs
     ------
     fixations_path: string path to the fixations file
+    row_filter: RowFilter selecting the rows to keep, by default every participant but nikki.
+                filtering on the condition needs a file with a condition column
     outputs
     -------
     res_dict: dictionary containing relevant information from the samples
               {participant1: 
                     {trial1: 
                         {"orig_side": side the original image is on,
+                        "condition": condition of the trial, if the file has a condition column,
                         "fixation_intervals": 
                             [fixation_start_time,
                             fixation_end_time,
@@ -23,43 +56,135 @@ def read_fixations(fixations_path):
                 participant2: ...
                 }
     """
-    res_dict = {}
+    instrumentation.count_file("fixations_bytes", fixations_path)
+    rejected = []
     with open(fixations_path, 'r') as file:
-        next(file)
-        for line in file:
-            # split line into each field
-            cols = line.split(",")
-      
-            participant = cols[0]
-            trial = cols[1]
-            orig_side = cols[6]
-            fixation_start = float(cols[11])
-            fixation_end = float(cols[13])
-            fixation_interest_area = cols[14]
-
-            # filter out nikki
-            if participant != "0422a3":
-                # label dict entries by participant
-                if participant not in res_dict:
-                    res_dict[participant] = {}
-                
-                # add a subdict for each trial
-                if trial not in res_dict[participant]:
-                    res_dict[participant][trial] = {}
-
-                # add the side the original image is to the subdict
-                if "orig_side" not in res_dict[participant][trial]:
-                    res_dict[participant][trial]["orig_side"] = orig_side
-
-                # adds a list of [start, end, interest_area] for each fixation for the trial to the subdict 
-                if "fixation_intervals" not in res_dict[participant][trial]:
-                    res_dict[participant][trial]["fixation_intervals"] = [[fixation_start, fixation_end, fixation_interest_area]]
-                else:
-                    res_dict[participant][trial]["fixation_intervals"] += [[fixation_start, fixation_end, fixation_interest_area]]
-        
+        header = next(file)
+        res_dict = parse_fixation_lines(instrumentation.counted(file, "fixations_rows"), row_filter, header, rejected)
+    warn_rejected(rejected, fixations_path)
+    instrumentation.count_trials("fixations_trials", res_dict)
+    return res_dict
+
+def fixation_columns(header):
+    """ returns the {field: column index} of the fixations file with the given header line, and its number of
+        columns (None without a header naming the columns, for which the FIXATION_COLUMNS layout is used)
+    """
+    return resolve_columns(header, FIXATION_ALIASES, FIXATION_COLUMNS, OPTIONAL_FIXATION_FIELDS)
+
+def warn_rejected(rejected, path):
+    """ warns about the malformed rows parse_fixation_lines skipped
+    inputs
+    ------
+    rejected: list of the skipped lines
+    path: path of the file, for the message
+    """
+    if rejected:
+        warnings.warn("skipped %d malformed rows of %s, the first one is %r" % (len(rejected), path, rejected[0]))
+
+def parse_fixation_lines(lines, row_filter=DEFAULT_FILTER, header=None, rejected=None):
+    """ organizes lines of the fixations file into the dictionary returned by read_fixations. lines are
+        split on commas, and those with a quote by the csv module. rows with the wrong number of columns or
+        times that are not numbers are skipped and counted as fixations_rejected
+    inputs
+    ------
+    lines: iterable of lines of the fixations file, without the header
+    row_filter: RowFilter selecting the rows to keep, by default every participant but nikki
+    header: the header line of the file, giving the columns by name, None for the FIXATION_COLUMNS layout
+    rejected: list the skipped lines are appended to, None to warn about them here
+    outputs
+    -------
+    res_dict: dictionary in the format returned by read_fixations
+    """
+    columns, num_columns = fixation_columns(header)
+    row_filter.check_columns(columns)
+    participant_column = columns["participant"]
+    trial_column = columns["trial"]
+    side_column = columns["side"]
+    condition_column = columns.get("condition")
+    start_column = columns["time"]
+    end_column = columns["end"]
+    aoi_column = columns["aoi"]
+    min_columns = max(columns.values()) + 1
+    # the newline stays on the last field of a split line, strip it if that field is needed
+    strip_newline = num_columns == min_columns
+    # the filter tests the participant on the raw line if it is the first column
+    prefix_filter = participant_column == 0
+
+    res_dict = {}
+    skipped = [] if rejected is None else rejected
+    num_rejected = 0
+    for line in lines:
+        try:
+            if '"' in line:
+                cols = next(csv.reader([line.rstrip("\r\n")]))
+                filtered = False
+            else:
+                # skip filtered rows before splitting them
+                if prefix_filter and not row_filter.keep_line(line, columns):
+                    continue
+                # split line into each field
+                cols = (line.rstrip("\r\n") if strip_newline else line).split(",")
+                filtered = prefix_filter
+            if len(cols) != num_columns if num_columns else len(cols) < min_columns:
+                if line.strip():
+                    num_rejected += 1
+                    skipped.append(line)
+                continue
+            if not filtered and not row_filter.keep_fields(cols, columns):
+                continue
+
+            participant = cols[participant_column]
+            trial = cols[trial_column]
+            orig_side = cols[side_column]
+            fixation_start = float(cols[start_column])
+            fixation_end = float(cols[end_column])
+            # the few interest area labels are interned, so every fixation refers to one copy of each
+            fixation_interest_area = sys.intern(cols[aoi_column])
+        except ValueError:
+            num_rejected += 1
+            skipped.append(line)
+            continue
+
+        # label dict entries by participant
+        participant_dict = res_dict.get(participant)
+        if participant_dict is None:
+            participant_dict = res_dict[sys.intern(participant)] = {}
+
+        # add a subdict for each trial, with the side the original image is on
+        trial_dict = participant_dict.get(trial)
+        if trial_dict is None:
+            trial_dict = participant_dict[sys.intern(trial)] = {"orig_side": sys.intern(orig_side),
+                                                                "fixation_intervals": []}
+            if condition_column is not None:
+                trial_dict["condition"] = sys.intern(cols[condition_column])
+
+        # adds a list of [start, end, interest_area] for each fixation for the trial to the subdict
+        trial_dict["fixation_intervals"].append([fixation_start, fixation_end, fixation_interest_area])
+
+    instrumentation.count("fixations_rejected", num_rejected)
+    if rejected is None:
+        warn_rejected(skipped, "the fixations file")
     return res_dict
 
-def first_saccade_time_and_accuracy(fixation_dict):
+def merge_fixation_dicts(res_dict, other_dict):
+    """ appends a dictionary parsed from a later part of the fixations file to res_dict, so that
+        merging the parts in file order gives the same dictionary as reading the whole file
+    inputs
+    ------
+    res_dict: dictionary in the format returned by read_fixations, updated in place
+    other_dict: dictionary in the format returned by read_fixations
+    """
+    for participant in other_dict:
+        if participant not in res_dict:
+            res_dict[participant] = {}
+        for trial in other_dict[participant]:
+            if trial not in res_dict[participant]:
+                res_dict[participant][trial] = other_dict[participant][trial]
+            else:
+                res_dict[participant][trial]["fixation_intervals"] += other_dict[participant][trial]["fixation_intervals"]
+
+@instrumentation.timed("first_saccade_time_and_accuracy")
+def first_saccade_time_and_accuracy(fixation_dict, plot=None, verbose=True):
     """ finds the time the first saccade was initiated and how accurate that saccade was.
         evaluates these based on which side the original image was on and prints that statistics to the console.
         also, displays graphs of the proportions at each time of initiation split by accuracy for the side
@@ -67,89 +192,265 @@ def first_saccade_time_and_accuracy(fixation_dict):
         input
         -----
         fixations_dict: the dictionary outputted by read_fixations
+        plot: function with the signature of plot_time_proportions used to display the graphs,
+              e.g. HeadlessRenderer.add to write them to files. defaults to plot_time_proportions
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        result: FirstSaccadeResult
+    """
+    return report_first_saccades(*first_saccade_times(fixation_dict), plot=plot, verbose=verbose)
+
+
+@instrumentation.timed("first_saccade_times")
+def first_saccade_times(fixation_dict):
+    """ finds the time to initiate the first saccade to an interest area of every trial, split by
+        the side the original image was on and by accuracy
+        input
+        -----
+        fixations_dict: the dictionary outputted by read_fixations
+        outputs
+        -------
+        l_acc_times: times of the accurate first saccades when the original was on the left
+        l_inacc_times: times of the inaccurate first saccades when the original was on the left
+        l_total_num: number of trials with the original on the left
+        r_acc_times: times of the accurate first saccades when the original was on the right
+        r_inacc_times: times of the inaccurate first saccades when the original was on the right
+        r_total_num: number of trials with the original on the right
     """
     l_acc_times = []
-    l_total_true = 0
     l_total_num = 0
     l_inacc_times = []
 
     r_acc_times = []
-    r_total_true = 0
     r_total_num = 0
     r_inacc_times = []
 
     for participant in fixation_dict:
         for trial in fixation_dict[participant]:
             side = fixation_dict[participant][trial]["orig_side"]
-            intervals = fixation_dict[participant][trial]["fixation_intervals"]
             if side == "Left":
                 l_total_num += 1
             elif side == "Right":
                 r_total_num += 1
-            
-            for i in range(1, len(intervals)):
+
+            first_saccade = trial_first_saccade(fixation_dict[participant][trial])
+            if first_saccade is not None:
+                saccade_time, accurate = first_saccade
                 if side == "Left":
-                    saccade_time = intervals[i][0] - intervals[i-1][1]
-                    if intervals[i][2] == "[ 1]":
-                        l_total_true += 1
+                    if accurate:
                         l_acc_times += [saccade_time]
-                        break
-                    elif intervals[i][2] == "[ 2]":
+                    else:
                         l_inacc_times += [saccade_time]
-                        break
-
-                elif side == "Right":
-                    saccade_time = intervals[i][0] - intervals[i-1][1]
-                    if intervals[i][2] == "[ 2]":
-                        r_total_true += 1
+                else:
+                    if accurate:
                         r_acc_times += [saccade_time]
-                        break
-                    elif intervals[i][2] == "[ 1]":
+                    else:
                         r_inacc_times += [saccade_time]
-                        break
-    
-    acc_times = l_acc_times + r_acc_times
-    total_true = l_total_true + r_total_true
+
+    return l_acc_times, l_inacc_times, l_total_num, r_acc_times, r_inacc_times, r_total_num
+
+
+def trial_first_saccade(trial_dict):
+    """ finds the first saccade to an interest area of a single trial
+        input
+        -----
+        trial_dict: a trial subdict of the dictionary outputted by read_fixations
+        outputs
+        -------
+        None if the trial has no saccade to an interest area or no known original side, otherwise
+        saccade_time: time from the end of the previous fixation to the start of the fixation on the interest area
+        accurate: True if the interest area is the original image
+    """
+    side = trial_dict["orig_side"]
+    if side == "Left":
+        target, other = "[ 1]", "[ 2]"
+    elif side == "Right":
+        target, other = "[ 2]", "[ 1]"
+    else:
+        return None
+
+    intervals = trial_dict["fixation_intervals"]
+    for i in range(1, len(intervals)):
+        if intervals[i][2] == target or intervals[i][2] == other:
+            return intervals[i][0] - intervals[i-1][1], intervals[i][2] == target
+    return None
+
+
+class FirstSaccadeAccumulator:
+    """ incrementally computes the statistics of first_saccade_time_and_accuracy one trial at a time,
+        keeping streaming summaries of the saccade times instead of lists, so it can run over any number
+        of trials and be merged across processes or runs. the medians are approximate within relative_accuracy.
+        inputs
+        ------
+        max_time: the maximum value of the histograms
+        bin_size: the size of the histogram bins
+        relative_accuracy: maximum relative error of the medians
+    """
+
+    def __init__(self, max_time=400, bin_size=10, relative_accuracy=0.001):
+        self.l_total_num = 0
+        self.r_total_num = 0
+        self.l_acc = TimeSummary(max_time, bin_size, relative_accuracy)
+        self.l_inacc = TimeSummary(max_time, bin_size, relative_accuracy)
+        self.r_acc = TimeSummary(max_time, bin_size, relative_accuracy)
+        self.r_inacc = TimeSummary(max_time, bin_size, relative_accuracy)
+
+    def add_trial(self, participant, trial, trial_dict):
+        """ adds a trial subdict of the dictionary returned by read_fixations to the summaries """
+        side = trial_dict["orig_side"]
+        if side == "Left":
+            self.l_total_num += 1
+        elif side == "Right":
+            self.r_total_num += 1
+
+        first_saccade = trial_first_saccade(trial_dict)
+        if first_saccade is not None:
+            saccade_time, accurate = first_saccade
+            if side == "Left":
+                summary = self.l_acc if accurate else self.l_inacc
+            else:
+                summary = self.r_acc if accurate else self.r_inacc
+            summary.add(saccade_time)
+
+    def merge(self, other):
+        """ adds the trials summarized by other, e.g. computed in another process """
+        self.l_total_num += other.l_total_num
+        self.r_total_num += other.r_total_num
+        for name in ("l_acc", "l_inacc", "r_acc", "r_inacc"):
+            getattr(self, name).merge(getattr(other, name))
+
+    def result(self):
+        """ returns the FirstSaccadeResult of first_saccade_time_and_accuracy """
+        return first_saccade_result(self.l_acc.count, self.l_acc.stats.total, self.l_inacc.count,
+                                    self.l_inacc.stats.total, self.l_total_num, self.r_acc.count,
+                                    self.r_acc.stats.total, self.r_inacc.count, self.r_inacc.stats.total,
+                                    self.r_total_num)
+
+    def report(self, plot=None, verbose=True):
+        """ computes the statistics of first_saccade_time_and_accuracy and displays its graphs
+            inputs
+            ------
+            plot: function with the signature of plot_time_summaries, defaults to plot_time_summaries
+            verbose: if True, prints the statistics
+            outputs
+            -------
+            result: FirstSaccadeResult
+        """
+        plot = plot or plot_time_summaries
+        result = self.result()
+        if verbose:
+            print_first_saccades(result)
+
+        acc = self.l_acc.merged(self.r_acc)
+        inacc = self.l_inacc.merged(self.r_inacc)
+        plot(acc, inacc, "Time to Initiate Saccade (ms)", "Proportions of Times to Initiate Saccades")
+        plot(self.l_acc, self.l_inacc, "Time to Initiate Saccade (ms)", "Proportions of Times to Initiate Saccades (Left)")
+        plot(self.r_acc, self.r_inacc, "Time to Initiate Saccade (ms)", "Proportions of Times to Initiate Saccades (Right)")
+        return result
+
+
+def first_saccade_summaries(fixation_dict, max_time=400, bin_size=10, relative_accuracy=0.001):
+    """ feeds every trial of the dictionary returned by read_fixations to a FirstSaccadeAccumulator
+        input
+        -----
+        fixations_dict: the dictionary outputted by read_fixations
+        max_time, bin_size, relative_accuracy: see FirstSaccadeAccumulator
+        outputs
+        -------
+        accumulator: the FirstSaccadeAccumulator
+    """
+    accumulator = FirstSaccadeAccumulator(max_time, bin_size, relative_accuracy)
+    for participant in fixation_dict:
+        for trial in fixation_dict[participant]:
+            accumulator.add_trial(participant, trial, fixation_dict[participant][trial])
+    return accumulator
+
+
+def first_saccade_result(l_acc_num, l_acc_total, l_inacc_num, l_inacc_total, l_total_num,
+                         r_acc_num, r_acc_total, r_inacc_num, r_inacc_total, r_total_num):
+    """ computes the statistics of first_saccade_time_and_accuracy
+        inputs
+        ------
+        l_acc_num, l_acc_total: number and sum of the times of the accurate first saccades when the original was on the left
+        l_inacc_num, l_inacc_total: the same for the inaccurate first saccades
+        l_total_num: number of trials with the original on the left
+        r_acc_num, r_acc_total, r_inacc_num, r_inacc_total, r_total_num: the same when the original was on the right
+        outputs
+        -------
+        result: FirstSaccadeResult
+    """
+    total_true = l_acc_num + r_acc_num
     total_num = l_total_num + r_total_num
-    inacc_times = l_inacc_times + r_inacc_times
-    
-    num_l_saccades = len(l_acc_times) + len(r_inacc_times)
-    l_avg_time = (sum(l_acc_times) + sum(l_inacc_times))/l_total_num
-    l_acc = l_total_true/l_total_num
-    
-    num_r_saccades = len(r_acc_times) + len(l_inacc_times)
-    r_avg_time = (sum(r_acc_times) + sum(r_inacc_times))/r_total_num
-    r_acc = r_total_true/r_total_num
-    
-    avg_time = (sum(acc_times) + sum(inacc_times))/total_num
+    acc_total = l_acc_total + r_acc_total
+    inacc_total = l_inacc_total + r_inacc_total
+
+    num_l_saccades = l_acc_num + r_inacc_num
+    l_avg_time = (l_acc_total + l_inacc_total)/l_total_num
+    l_acc = l_acc_num/l_total_num
+
+    num_r_saccades = r_acc_num + l_inacc_num
+    r_avg_time = (r_acc_total + r_inacc_total)/r_total_num
+    r_acc = r_acc_num/r_total_num
+
+    avg_time = (acc_total + inacc_total)/total_num
     acc = total_true/total_num
 
-    avg_acc_time = sum(acc_times)/total_true
-    avg_inacc_time = sum(inacc_times)/(total_num - total_true)
+    avg_acc_time = acc_total/total_true
+    avg_inacc_time = inacc_total/(total_num - total_true)
+    return FirstSaccadeResult(l_avg_time, l_acc, num_l_saccades, r_avg_time, r_acc, num_r_saccades,
+                              avg_time, acc, avg_acc_time, avg_inacc_time)
 
+
+def print_first_saccades(result):
+    """ prints the FirstSaccadeResult of first_saccade_time_and_accuracy """
     print("left")
-    print("average first saccade time: " + str(l_avg_time))
-    print("average first saccade accuracy: " + str(l_acc))
-    print("number of saccades to the left: " + str(num_l_saccades))
+    print("average first saccade time: " + str(result.left_avg_time))
+    print("average first saccade accuracy: " + str(result.left_accuracy))
+    print("number of saccades to the left: " + str(result.left_saccades))
     print("-----------------------------------------------------")
     print("right")
-    print("average first saccade time: " + str(r_avg_time))
-    print("average first saccade accuracy: " + str(r_acc))
-    print("number of saccades to the right: " + str(num_r_saccades))
+    print("average first saccade time: " + str(result.right_avg_time))
+    print("average first saccade accuracy: " + str(result.right_accuracy))
+    print("number of saccades to the right: " + str(result.right_saccades))
     print("-----------------------------------------------------")
     print("overall")
-    print("average first saccade time: " + str(avg_time))
-    print("average first saccade accuracy: " + str(acc))
-    print("average first accurate saccade time: " + str(avg_acc_time))
-    print("average first inaccurate saccade time: " + str(avg_inacc_time))
+    print("average first saccade time: " + str(result.avg_time))
+    print("average first saccade accuracy: " + str(result.accuracy))
+    print("average first accurate saccade time: " + str(result.avg_accurate_time))
+    print("average first inaccurate saccade time: " + str(result.avg_inaccurate_time))
     print("-----------------------------------------------------")
 
-    plot_time_proportions(acc_times, inacc_times, "Time to Initiate Saccade (ms)", "Proportions of Times to Initiate Saccades", 400, 10)
-    plot_time_proportions(l_acc_times, l_inacc_times, "Time to Initiate Saccade (ms)", "Proportions of Times to Initiate Saccades (Left)", 400, 10)
-    plot_time_proportions(r_acc_times, r_inacc_times, "Time to Initiate Saccade (ms)", "Proportions of Times to Initiate Saccades (Right)", 400, 10)
 
+def report_first_saccades(l_acc_times, l_inacc_times, l_total_num, r_acc_times, r_inacc_times, r_total_num, plot=None,
+                          verbose=True):
+    """ computes the statistics of first_saccade_time_and_accuracy and displays its graphs
+        inputs
+        ------
+        the outputs of first_saccade_times
+        plot: function with the signature of plot_time_proportions, defaults to plot_time_proportions
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        result: FirstSaccadeResult
+    """
+    plot = plot or plot_time_proportions
+    result = first_saccade_result(len(l_acc_times), sum(l_acc_times), len(l_inacc_times), sum(l_inacc_times),
+                                  l_total_num, len(r_acc_times), sum(r_acc_times), len(r_inacc_times),
+                                  sum(r_inacc_times), r_total_num)
+    if verbose:
+        print_first_saccades(result)
 
-def avg_search_time(fixation_dict):
+    acc_times = l_acc_times + r_acc_times
+    inacc_times = l_inacc_times + r_inacc_times
+    plot(acc_times, inacc_times, "Time to Initiate Saccade (ms)", "Proportions of Times to Initiate Saccades", 400, 10)
+    plot(l_acc_times, l_inacc_times, "Time to Initiate Saccade (ms)", "Proportions of Times to Initiate Saccades (Left)", 400, 10)
+    plot(r_acc_times, r_inacc_times, "Time to Initiate Saccade (ms)", "Proportions of Times to Initiate Saccades (Right)", 400, 10)
+    return result
+
+
+@instrumentation.timed("avg_search_time")
+def avg_search_time(fixation_dict, plot=None, verbose=True):
     """ finds statistics about how long it takes to find the original image (end of fixation on crosshairs
         to beginning of final fixation on face).
         finds the mean, median, maximum and minimum times. 
@@ -159,11 +460,34 @@ def avg_search_time(fixation_dict):
         input
         -----
         fixations_dict: the dictionary outputted by read_fixations
+        plot: function with the signature of plot_time_proportions used to display the graphs,
+              e.g. HeadlessRenderer.add to write them to files. defaults to plot_time_proportions
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        result: SearchTimeResult
+    """
+    return report_search_times(*search_times(fixation_dict), plot=plot, verbose=verbose)
+
+
+@instrumentation.timed("search_times")
+def search_times(fixation_dict):
+    """ finds the time from the end of the fixation on the crosshairs to the beginning of the final
+        fixation on a face of every trial, split by the side the original image was on and by accuracy
+        input
+        -----
+        fixations_dict: the dictionary outputted by read_fixations
+        outputs
+        -------
+        left_times: search times of the trials with the original on the left
+        right_times: search times of the other trials
+        l_acc_times: left_times of the trials ending on the original
+        l_in_acc_times: left_times of the trials ending on the other image
+        r_acc_times: right_times of the trials ending on the original
+        r_in_acc_times: right_times of the trials ending on the other image
     """
     left_times = []
     right_times = []
-    acc_times = []
-    in_acc_times = []
 
     l_acc_times = []
     l_in_acc_times = []
@@ -173,89 +497,200 @@ def avg_search_time(fixation_dict):
 
     for participant in fixation_dict:
         for trial in fixation_dict[participant]:
-            start_time = 0
-            end_time = 0
-            i = 0
-            intervals = fixation_dict[participant][trial]["fixation_intervals"]
-            # find last fixation not on interest area
-            while intervals[i][2] == "[ ]":
-                start_time = intervals[i][1]
-                i += 1
-            i = 1
-            # find first fixation on last interest area
-            # skip all of the non interest area fixations
-            while intervals[-i][2] == "[ ]":
-                i += 1
-            j = i
-            # find the first of the interest area fixations
-            while intervals[-i][2] == intervals[-j][2]:
-                end_time = intervals[-j][0]
-                j += 1
-            j -= 1
-            trial_time = end_time - start_time
+            trial_time, accurate = trial_search_time(fixation_dict[participant][trial])
 
             side = fixation_dict[participant][trial]["orig_side"]
             if side == "Left":
                 left_times += [trial_time]
-                if intervals[-j][2] == "[ 1]":
+                if accurate:
                     l_acc_times += [trial_time]
                 else:
                     l_in_acc_times += [trial_time]
             else:
                 right_times += [trial_time]
-                if intervals[-j][2] == "[ 2]":
+                if accurate:
                     r_acc_times += [trial_time]
                 else:
                     r_in_acc_times += [trial_time]
 
-    l_max_time = max(left_times)
-    l_min_time = min(left_times)
-    l_avg_time = sum(left_times)/len(left_times)
+    return left_times, right_times, l_acc_times, l_in_acc_times, r_acc_times, r_in_acc_times
 
-    r_max_time = max(right_times)
-    r_min_time = min(right_times)
-    r_avg_time = sum(right_times)/len(right_times)
 
-    times = left_times + right_times
-    max_time = max(times)
-    min_time = min(times)
-    avg_time = sum(times)/len(times)
-    print("left")
-    print("average time: " + str(l_avg_time))
-    print("maximum time: " + str(l_max_time))
-    print("minimum time: " + str(l_min_time))
-    print("----------------------------------")
-    print("right")
-    print("average time: " + str(r_avg_time))
-    print("maximum time: " + str(r_max_time))
-    print("minimum time: " + str(r_min_time))
-    print("----------------------------------")
-    print("overall")
-    print("average time: " + str(avg_time))
-    print("maximum time: " + str(max_time))
-    print("minimum time: " + str(min_time))
+def trial_search_time(trial_dict):
+    """ finds the search time of a single trial
+        input
+        -----
+        trial_dict: a trial subdict of the dictionary outputted by read_fixations
+        outputs
+        -------
+        trial_time: time from the end of the fixation on the crosshairs to the beginning of the final fixation on a face
+        accurate: True if the final fixation is on the original image
+    """
+    start_time = 0
+    end_time = 0
+    i = 0
+    intervals = trial_dict["fixation_intervals"]
+    # find last fixation not on interest area
+    while intervals[i][2] == "[ ]":
+        start_time = intervals[i][1]
+        i += 1
+    i = 1
+    # find first fixation on last interest area
+    # skip all of the non interest area fixations
+    while intervals[-i][2] == "[ ]":
+        i += 1
+    j = i
+    # find the first of the interest area fixations
+    while intervals[-i][2] == intervals[-j][2]:
+        end_time = intervals[-j][0]
+        j += 1
+    j -= 1
+    trial_time = end_time - start_time
+
+    if trial_dict["orig_side"] == "Left":
+        accurate = intervals[-j][2] == "[ 1]"
+    else:
+        accurate = intervals[-j][2] == "[ 2]"
+    return trial_time, accurate
+
+
+class SearchTimeAccumulator:
+    """ incrementally computes the statistics of avg_search_time one trial at a time, keeping streaming
+        summaries of the search times instead of lists, so it can run over any number of trials and
+        be merged across processes. the medians are approximate within relative_accuracy.
+        inputs
+        ------
+        max_time: the maximum value of the histograms
+        bin_size: the size of the histogram bins
+        relative_accuracy: maximum relative error of the medians
+    """
+
+    def __init__(self, max_time=4000, bin_size=75, relative_accuracy=0.001):
+        self.l_acc = TimeSummary(max_time, bin_size, relative_accuracy)
+        self.l_in_acc = TimeSummary(max_time, bin_size, relative_accuracy)
+        self.r_acc = TimeSummary(max_time, bin_size, relative_accuracy)
+        self.r_in_acc = TimeSummary(max_time, bin_size, relative_accuracy)
+
+    def add_trial(self, participant, trial, trial_dict):
+        """ adds a trial subdict of the dictionary returned by read_fixations to the summaries """
+        trial_time, accurate = trial_search_time(trial_dict)
+        if trial_dict["orig_side"] == "Left":
+            summary = self.l_acc if accurate else self.l_in_acc
+        else:
+            summary = self.r_acc if accurate else self.r_in_acc
+        summary.add(trial_time)
+
+    def merge(self, other):
+        """ adds the trials summarized by other, e.g. computed in another process """
+        for name in ("l_acc", "l_in_acc", "r_acc", "r_in_acc"):
+            getattr(self, name).merge(getattr(other, name))
+
+    def result(self):
+        """ returns the SearchTimeResult of avg_search_time, with approximate medians """
+        stats = []
+        for summary in (self.l_acc.merged(self.l_in_acc), self.r_acc.merged(self.r_in_acc),
+                        self.l_acc.merged(self.l_in_acc, self.r_acc, self.r_in_acc)):
+            stats.append(TimeStats(summary.stats.mean(), summary.stats.max, summary.stats.min,
+                                   summary.sketch.median()))
+        return SearchTimeResult(*stats)
+
+    def report(self, plot=None, verbose=True):
+        """ computes the statistics of avg_search_time and displays its graphs
+            inputs
+            ------
+            plot: function with the signature of plot_time_summaries, defaults to plot_time_summaries
+            verbose: if True, prints the statistics and the medians
+            outputs
+            -------
+            result: SearchTimeResult
+        """
+        plot = plot or plot_time_summaries
+        result = self.result()
+        if verbose:
+            print_search_times(result)
+
+        acc = self.l_acc.merged(self.r_acc)
+        in_acc = self.l_in_acc.merged(self.r_in_acc)
+        plot(acc, in_acc, "Time to Locate Target (ms)", "Proportions of Times to Locate Target", verbose)
+        plot(self.l_acc, self.l_in_acc, "Time to Locate Target (ms)", "Proportions of Times to Locate Target (Left)", verbose)
+        plot(self.r_acc, self.r_in_acc, "Time to Locate Target (ms)", "Proportions of Times to Locate Target (Right)", verbose)
+        return result
+
+
+def search_time_summaries(fixation_dict, max_time=4000, bin_size=75, relative_accuracy=0.001):
+    """ feeds every trial of the dictionary returned by read_fixations to a SearchTimeAccumulator
+        input
+        -----
+        fixations_dict: the dictionary outputted by read_fixations
+        max_time, bin_size, relative_accuracy: see SearchTimeAccumulator
+        outputs
+        -------
+        accumulator: the SearchTimeAccumulator
+    """
+    accumulator = SearchTimeAccumulator(max_time, bin_size, relative_accuracy)
+    for participant in fixation_dict:
+        for trial in fixation_dict[participant]:
+            accumulator.add_trial(participant, trial, fixation_dict[participant][trial])
+    return accumulator
+
+
+def time_stats(times):
+    """ returns the TimeStats of a list of times, with the median time_proportions computes """
+    ordered = sorted(times)
+    return TimeStats(sum(times)/len(times), ordered[-1], ordered[0], ordered[int(len(ordered) * 0.5)])
+
+
+def print_search_times(result):
+    """ prints the SearchTimeResult of avg_search_time """
+    for name, stats in (("left", result.left), ("right", result.right), ("overall", result.overall)):
+        print(name)
+        print("average time: " + str(stats.mean))
+        print("maximum time: " + str(stats.maximum))
+        print("minimum time: " + str(stats.minimum))
+        if name != "overall":
+            print("----------------------------------")
+
+
+def report_search_times(left_times, right_times, l_acc_times, l_in_acc_times, r_acc_times, r_in_acc_times, plot=None,
+                        verbose=True):
+    """ computes the statistics of avg_search_time and displays its graphs
+        inputs
+        ------
+        the outputs of search_times
+        plot: function with the signature of plot_time_proportions, defaults to plot_time_proportions
+        verbose: if True, prints the statistics and the medians
+        outputs
+        -------
+        result: SearchTimeResult
+    """
+    plot = plot or plot_time_proportions
+    result = SearchTimeResult(time_stats(left_times), time_stats(right_times), time_stats(left_times + right_times))
+    if verbose:
+        print_search_times(result)
 
-    acc_times += l_acc_times + r_acc_times
-    in_acc_times += l_in_acc_times + r_in_acc_times
+    acc_times = l_acc_times + r_acc_times
+    in_acc_times = l_in_acc_times + r_in_acc_times
     
-    plot_time_proportions(acc_times, in_acc_times, "Time to Locate Target (ms)", "Proportions of Times to Locate Target", 4000, 75, True)
-    plot_time_proportions(l_acc_times, l_in_acc_times, "Time to Locate Target (ms)", "Proportions of Times to Locate Target (Left)", 4000, 75, True)
-    plot_time_proportions(r_acc_times, r_in_acc_times, "Time to Locate Target (ms)", "Proportions of Times to Locate Target (Right)", 4000, 75, True)
+    plot(acc_times, in_acc_times, "Time to Locate Target (ms)", "Proportions of Times to Locate Target", 4000, 75, verbose)
+    plot(l_acc_times, l_in_acc_times, "Time to Locate Target (ms)", "Proportions of Times to Locate Target (Left)", 4000, 75, verbose)
+    plot(r_acc_times, r_in_acc_times, "Time to Locate Target (ms)", "Proportions of Times to Locate Target (Right)", 4000, 75, verbose)
+    return result
 
-def plot_time_proportions(acc_times, in_acc_times, x_label, title, max_time, bin_size, print_median=False):
-    """ creates a line histogram with a line for the accurate times and the inaccurate times. 
-        can also compute and print the median. 
+def time_proportions(acc_times, in_acc_times, max_time, bin_size):
+    """ computes the histograms and the median plotted by plot_time_proportions
         inputs
         ------
         acc_times: a list of the times associated with accurate responses
         in_acc_times: a list of the times associated with inaccurate responses
-        x_label: label for the x axis
-        title: the title of the plot
         max_time: the maximum value to display in the x direction
         bin_size: the size of the bins for the histogram
-        print_median: bool. if True, prints the median
+        outputs
+        -------
+        bin_edges: the edges of the bins
+        acc_proportions: proportion of all times that are accurate and in each bin
+        in_acc_proportions: proportion of all times that are inaccurate and in each bin
+        median: the median of all times
     """
-   
     bin_edges = np.arange(0, max_time, bin_size) 
     total_times = acc_times + in_acc_times
     total_count = len(total_times)
@@ -266,26 +701,87 @@ def plot_time_proportions(acc_times, in_acc_times, x_label, title, max_time, bin
     in_acc_hist, _ = np.histogram(in_acc_times, bins=bin_edges)
     in_acc_proportions = in_acc_hist / total_count
 
-    
     total_times.sort() 
     # find the index for the median
     percentile_index = int(total_count * 0.5)  
     median = total_times[percentile_index]
+    return bin_edges, acc_proportions, in_acc_proportions, median
+
+def draw_time_proportions(ax, bin_edges, acc_proportions, in_acc_proportions, median, x_label, title):
+    """ draws the line histogram of plot_time_proportions on a matplotlib axes
+        inputs
+        ------
+        ax: the axes to draw on
+        bin_edges, acc_proportions, in_acc_proportions, median: the outputs of time_proportions
+        x_label: label for the x axis
+        title: the title of the plot
+    """
+    ax.axvline(x=median, color='r', linestyle='--', label='50% of Times')
+
+    # Plot the proportions
+    ax.plot(bin_edges[:-1], acc_proportions, marker='o', label="Accurate Responses")
+    ax.plot(bin_edges[:-1], in_acc_proportions, marker='x', label="Inaccurate Responses")
+    ax.set_xlabel(x_label)
+    ax.set_ylabel("Proportion of Times")
+    ax.set_title(title)
+    ax.grid(True)
+
+def summary_time_proportions(acc_summary, in_acc_summary):
+    """ computes the histograms and the median of time_proportions from streaming summaries
+        inputs
+        ------
+        acc_summary: TimeSummary of the times associated with accurate responses
+        in_acc_summary: TimeSummary of the times associated with inaccurate responses, with the same bins
+        outputs
+        -------
+        the same as time_proportions, the median is approximate within the sketches' relative accuracy
+    """
+    acc_hist, acc_count = acc_summary.histogram.histogram()
+    in_acc_hist, in_acc_count = in_acc_summary.histogram.histogram()
+    total_count = acc_count + in_acc_count
+    median = acc_summary.merged(in_acc_summary).sketch.median()
+    return acc_summary.histogram.bin_edges, acc_hist / total_count, in_acc_hist / total_count, median
+
+@instrumentation.timed("plot_time_summaries")
+def plot_time_summaries(acc_summary, in_acc_summary, x_label, title, print_median=False):
+    """ plot_time_proportions for streaming summaries of the times
+        inputs
+        ------
+        acc_summary: TimeSummary of the times associated with accurate responses
+        in_acc_summary: TimeSummary of the times associated with inaccurate responses, with the same bins
+        x_label: label for the x axis
+        title: the title of the plot
+        print_median: bool. if True, prints the median
+    """
+    bin_edges, acc_proportions, in_acc_proportions, median = summary_time_proportions(acc_summary, in_acc_summary)
+    if print_median:
+        print("Median" + title[10:] + ": " + str(median))
+    draw_time_proportions(plt.gca(), bin_edges, acc_proportions, in_acc_proportions, median, x_label, title)
+    plt.show()
+
+@instrumentation.timed("plot_time_proportions")
+def plot_time_proportions(acc_times, in_acc_times, x_label, title, max_time, bin_size, print_median=False):
+    """ creates a line histogram with a line for the accurate times and the inaccurate times. 
+        can also compute and print the median. 
+        inputs
+        ------
+        acc_times: a list of the times associated with accurate responses
+        in_acc_times: a list of the times associated with inaccurate responses
+        x_label: label for the x axis
+        title: the title of the plot
+        max_time: the maximum value to display in the x direction
+        bin_size: the size of the bins for the histogram
+        print_median: bool. if True, prints the median
+    """
+    bin_edges, acc_proportions, in_acc_proportions, median = time_proportions(acc_times, in_acc_times, max_time, bin_size)
     if print_median:
         print("Median" + title[10:] + ": " + str(median))
-    plt.axvline(x=median, color='r', linestyle='--', label='50% of Times')
-
-    # Plot the proportions˜
-    plt.plot(bin_edges[:-1], acc_proportions, marker='o', label="Accurate Responses")
-    plt.plot(bin_edges[:-1], in_acc_proportions, marker='x', label="Inaccurate Responses")
-    plt.xlabel(x_label)
-    plt.ylabel("Proportion of Times")
-    plt.title(title)
-    plt.grid(True)
+    draw_time_proportions(plt.gca(), bin_edges, acc_proportions, in_acc_proportions, median, x_label, title)
     plt.show()
 
 
 if __name__ == "__main__":
+    instrumentation.enable_from_env()
     res = read_fixations("10viewers_fixations.csv")
     first_saccade_time_and_accuracy(res)
     avg_search_time(res)
@@ -0,0 +1,289 @@
+import argparse
+import hashlib
+import os
+import pickle
+
+import instrumentation
+from fixations_processing import (FirstSaccadeAccumulator, SearchTimeAccumulator, merge_fixation_dicts,
+                                   parse_fixation_lines)
+from results import SaccadeAccuracyResult
+from samples_processing import (CHUNK_SIZE, SaccadeAccuracyAccumulator, SaccadeCountAccumulator, add_sample_segment,
+                                parse_sample_chunk, print_num_interest_saccades, print_saccade_accuracy)
+
+DEFAULT_STATE_DIR = ".incremental_state"
+# bump when the saved accumulators or the way they are computed change, so old states are not reused
+STATE_VERSION = 1
+# number of bytes before the resume offset compared between runs to detect a rewritten file
+_CHECK_BYTES = 64 * 1024
+
+
+def sample_accumulators():
+    """ returns the accumulators kept for the samples file """
+    return {"first": SaccadeAccuracyAccumulator(0), "last": SaccadeAccuracyAccumulator(-1),
+            "counts": SaccadeCountAccumulator()}
+
+
+def fixation_accumulators():
+    """ returns the accumulators kept for the fixations file """
+    return {"first_saccade": FirstSaccadeAccumulator(), "search_time": SearchTimeAccumulator()}
+
+
+ACCUMULATORS = {
+    "samples": sample_accumulators,
+    "fixations": fixation_accumulators,
+}
+
+
+def default_state_path(path, kind):
+    """ returns the state file of a source file in DEFAULT_STATE_DIR, named after its absolute path """
+    digest = hashlib.blake2b(os.path.abspath(path).encode(), digest_size=10).hexdigest()
+    return os.path.join(DEFAULT_STATE_DIR, "%s-%s-%s.pkl" % (kind, os.path.basename(path), digest))
+
+
+def load_state(state_path):
+    """ returns the state saved by update_incremental, or None if there is none
+    outputs
+    -------
+    state: {"version": STATE_VERSION,
+            "kind": "samples" or "fixations",
+            "offset": byte offset of the first row of the last trial, where the next run resumes,
+            "check": hash of the bytes before the offset, to detect a rewritten file,
+            "participants": {participant: {name: accumulator}} of every trial before the offset
+            }
+    """
+    try:
+        with open(state_path, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def _save_state(state_path, state):
+    directory = os.path.dirname(state_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = state_path + ".tmp%d" % os.getpid()
+    with open(tmp_path, 'wb') as file:
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, state_path)
+
+
+def _check_hash(file, offset):
+    """ hashes the bytes before offset that the check covers """
+    start = max(0, offset - _CHECK_BYTES)
+    file.seek(start)
+    return hashlib.blake2b(file.read(offset - start), digest_size=20).hexdigest()
+
+
+def _new_state(file, kind):
+    file.seek(0)
+    return {"version": STATE_VERSION, "kind": kind, "offset": len(file.readline()), "check": None, "participants": {}}
+
+
+def _resume_state(file, state, kind):
+    """ returns the saved state if the file still starts with the rows it was computed from, otherwise a new one """
+    if state is None or state["version"] != STATE_VERSION or state["kind"] != kind:
+        return _new_state(file, kind)
+    file.seek(0, os.SEEK_END)
+    if file.tell() < state["offset"] or _check_hash(file, state["offset"]) != state["check"]:
+        return _new_state(file, kind)
+    return state
+
+
+def _read_chunks(file, offset, chunk_size):
+    """ yields (offset, data) for chunks of whole lines of a binary file, starting at a byte offset """
+    file.seek(offset)
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            break
+        data += file.readline()
+        yield offset, data
+        offset += len(data)
+
+
+def _last_trial_start(data, offset, previous):
+    """ finds the rows of the last trial of a chunk of whole lines
+    inputs
+    ------
+    data: bytes of the chunk
+    offset: byte offset of the chunk in the file
+    previous: the result for the chunk before, used if the whole chunk belongs to the same trial
+    outputs
+    -------
+    (key, start): [participant, trial] of the last row and the byte offset of the first row of its trial
+    """
+    end = len(data.rstrip(b"\r\n"))
+    if end == 0:
+        return previous
+    line_start = data.rfind(b"\n", 0, end) + 1
+    key = data[line_start:end].split(b",", 2)[:2]
+    while line_start > 0:
+        previous_start = data.rfind(b"\n", 0, line_start - 1) + 1
+        if data[previous_start:line_start - 1].split(b",", 2)[:2] != key:
+            break
+        line_start = previous_start
+    if line_start == 0 and previous is not None and previous[0] == key:
+        return previous
+    return key, offset + line_start
+
+
+def _chunk_trials(kind, data, header):
+    """ parses a chunk of whole lines into (participant, trial, part) in file order, where part is a
+        segment of parse_sample_chunk for the samples and a read_fixations style dictionary for the fixations,
+        whose columns are found by the header line
+    """
+    text = data.decode("utf-8", "surrogateescape")
+    if kind == "samples":
+        for segment in parse_sample_chunk(text):
+            yield segment[0], segment[1], segment
+    else:
+        fixation_dict = parse_fixation_lines(text.splitlines(True), header=header)
+        for participant in fixation_dict:
+            for trial in fixation_dict[participant]:
+                yield participant, trial, {participant: {trial: fixation_dict[participant][trial]}}
+
+
+def _add_part(kind, trial_dict, part):
+    """ adds a part of a trial from _chunk_trials to a dictionary holding that trial only, returns the dictionary """
+    if kind == "samples":
+        trial_dict = trial_dict if trial_dict is not None else {}
+        add_sample_segment(trial_dict, part)
+    elif trial_dict is None:
+        trial_dict = part
+    else:
+        merge_fixation_dicts(trial_dict, part)
+    return trial_dict
+
+
+def _can_evaluate(kind, trial_dict):
+    """ returns True if the accumulators can evaluate a trial whose rows may not all be written yet: a samples
+        trial needs a saccade to an interest area and a fixations trial a fixation on an interest area
+    """
+    if kind == "samples":
+        return bool(trial_dict.get("order_of_saccades"))
+    return any(interval[2] != "[ ]" for interval in trial_dict["fixation_intervals"])
+
+
+def update_incremental(path, kind, state_path=None, chunk_size=CHUNK_SIZE):
+    """ brings the saved accumulators of a growing samples or fixations file up to date, parsing only the rows
+        appended since the last run. the state keeps the accumulators of every finished trial per participant and
+        the byte offset of the last trial, which is parsed again on the next run in case more of its rows are appended.
+        the last trial is included in the returned accumulators as far as it is written, unless it is too incomplete
+        to evaluate (see _can_evaluate).
+        if the file was rewritten rather than appended to, everything is recomputed.
+        assumes the rows of a trial are contiguous in the file, like in the exports.
+    inputs
+    ------
+    path: string path to the samples or fixations file
+    kind: "samples" or "fixations"
+    state_path: file the state is saved to, defaults to default_state_path(path, kind)
+    chunk_size: number of bytes parsed at once
+    outputs
+    -------
+    accumulators: {name: accumulator} over every trial of the file, see sample_accumulators and fixation_accumulators
+    """
+    if kind not in ACCUMULATORS:
+        raise ValueError("kind must be one of " + ", ".join(ACCUMULATORS))
+    state_path = state_path or default_state_path(path, kind)
+    factory = ACCUMULATORS[kind]
+
+    with open(path, 'rb') as file:
+        state = _resume_state(file, load_state(state_path), kind)
+        participants = state["participants"]
+        file.seek(0)
+        header = file.readline().decode("utf-8", "surrogateescape")
+
+        current = None
+        current_key = None
+        last = None
+        for offset, data in _read_chunks(file, state["offset"], chunk_size):
+            last = _last_trial_start(data, offset, last)
+            for participant, trial, part in _chunk_trials(kind, data, header):
+                if (participant, trial) == current_key:
+                    _add_part(kind, current, part)
+                    continue
+                # the previous trial is finished, fold it into its participant's accumulators
+                if current is not None:
+                    for name, accumulator in participants.setdefault(current_key[0], factory()).items():
+                        accumulator.add_trial(current_key[0], current_key[1], current[current_key[0]][current_key[1]])
+                current = _add_part(kind, None, part)
+                current_key = (participant, trial)
+
+        # the last trial may still grow, so it is only folded if it ends before the resume offset
+        # (i.e. the file ends with rows that are filtered out)
+        pending = current
+        if last is not None:
+            last_key = [part.decode("utf-8", "surrogateescape") for part in last[0]]
+            if current is not None and list(current_key) != last_key:
+                for name, accumulator in participants.setdefault(current_key[0], factory()).items():
+                    accumulator.add_trial(current_key[0], current_key[1], current[current_key[0]][current_key[1]])
+                pending = None
+            state["offset"] = last[1]
+        state["check"] = _check_hash(file, state["offset"])
+    _save_state(state_path, state)
+
+    totals = factory()
+    for participant_accumulators in participants.values():
+        for name, accumulator in participant_accumulators.items():
+            totals[name].merge(accumulator)
+    # a trial cut off before its first saccade or interest area fixation is left out until more of it is written
+    if pending is not None and _can_evaluate(kind, pending[current_key[0]][current_key[1]]):
+        for name, accumulator in totals.items():
+            accumulator.add_trial(current_key[0], current_key[1], pending[current_key[0]][current_key[1]])
+    return totals
+
+
+def incremental_samples_stats(samples_path, state_path=None, chunk_size=CHUNK_SIZE, verbose=True):
+    """ computes the output of streaming_samples_stats, parsing only the rows appended since the last run
+        inputs
+        ------
+        samples_path: string path to the samples file
+        state_path: file the state is saved to, defaults to default_state_path(samples_path, "samples")
+        chunk_size: number of bytes parsed at once
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        accuracy: SaccadeAccuracyResult
+        counts: SaccadeCountResult
+    """
+    accumulators = update_incremental(samples_path, "samples", state_path, chunk_size)
+    accuracy = SaccadeAccuracyResult(accumulators["first"].result(), accumulators["last"].result())
+    counts = accumulators["counts"].result()
+    if verbose:
+        print_saccade_accuracy(*accuracy)
+        print_num_interest_saccades(*counts)
+    return accuracy, counts
+
+
+def incremental_fixations_stats(fixations_path, state_path=None, plot=None, chunk_size=CHUNK_SIZE, verbose=True):
+    """ computes the statistics of first_saccade_time_and_accuracy and avg_search_time and displays their graphs,
+        parsing only the rows appended since the last run. the medians are approximate, see SearchTimeAccumulator
+        inputs
+        ------
+        fixations_path: string path to the fixations file
+        state_path: file the state is saved to, defaults to default_state_path(fixations_path, "fixations")
+        plot: function with the signature of plot_time_summaries, e.g. HeadlessRenderer.add_summaries
+        chunk_size: number of bytes parsed at once
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        first_saccade: FirstSaccadeResult
+        search_time: SearchTimeResult
+    """
+    accumulators = update_incremental(fixations_path, "fixations", state_path, chunk_size)
+    return (accumulators["first_saccade"].report(plot, verbose),
+            accumulators["search_time"].report(plot, verbose))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="updates the statistics of a growing samples or fixations file")
+    parser.add_argument("kind", choices=list(ACCUMULATORS))
+    parser.add_argument("path")
+    parser.add_argument("--state", help="file the state is saved to")
+    args = parser.parse_args()
+    instrumentation.enable_from_env()
+    if args.kind == "samples":
+        incremental_samples_stats(args.path, args.state)
+    else:
+        incremental_fixations_stats(args.path, args.state)
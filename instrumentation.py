@@ -0,0 +1,412 @@
+import argparse
+import atexit
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+import urllib.request
+import warnings
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# set to a sink ("log", "json:<path>" or an http:// url) to instrument every run, e.g.
+#   EYE_TRACKING_INSTRUMENT=json:metrics.jsonl python3 session_engine.py ...
+ENV_VAR = "EYE_TRACKING_INSTRUMENT"
+# comma separated extras to capture, "cprofile" and/or "tracemalloc"
+PROFILE_ENV_VAR = "EYE_TRACKING_PROFILE"
+# number of functions of the cProfile capture in a report
+PROFILE_TOP = 25
+
+logger = logging.getLogger("eye_tracking.instrumentation")
+
+
+def peak_rss_mb():
+    """ returns the peak resident set size of this process in MB, nan where the resource module is not
+        available, e.g. on Windows
+    """
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+
+class LogSink:
+    """ writes reports to a logger, a line per stage and counter """
+
+    def __init__(self, logger=logger, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def send(self, report):
+        for name, stage in report["stages"].items():
+            line = "stage %s: %d calls, %.3f s" % (name, stage["calls"], stage["seconds"])
+            if "peak_traced_mb" in stage:
+                line += ", %.1f MB traced peak" % stage["peak_traced_mb"]
+            self.logger.log(self.level, line)
+        for name, value in report["counters"].items():
+            self.logger.log(self.level, "counter %s: %s" % (name, value))
+        self.logger.log(self.level, "peak rss: %.1f MB" % report["peak_rss_mb"])
+        for function, calls, own_seconds, seconds in report.get("profile", []):
+            self.logger.log(self.level, "profile %s: %d calls, %.3f s own, %.3f s cumulative" % (
+                function, calls, own_seconds, seconds))
+
+
+class JsonSink:
+    """ appends every report to a file as a line of json """
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, report):
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(report) + "\n")
+
+
+class HttpSink:
+    """ posts every report as json to a metrics endpoint, e.g. the one of serve_metrics. a report that can
+        not be delivered is dropped with a warning, so an unreachable endpoint never fails a run
+    """
+
+    def __init__(self, url, timeout=2.0):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, report):
+        request = urllib.request.Request(self.url, data=json.dumps(report).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except OSError as error:
+            warnings.warn("could not send the instrumentation report to %s: %s" % (self.url, error))
+
+
+def make_sink(spec):
+    """ returns the sink of a spec, "log", "json:<path>" or an http:// or https:// url """
+    if spec == "log":
+        return LogSink()
+    if spec.startswith("json:"):
+        return JsonSink(spec[len("json:"):])
+    if spec.startswith(("http://", "https://")):
+        return HttpSink(spec)
+    raise ValueError("the sink must be log, json:<path> or an http url, not %r" % spec)
+
+
+class _NoOpStage:
+    """ the stage context manager while instrumentation is disabled """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_OP_STAGE = _NoOpStage()
+
+
+class _Stage:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        if self.instrumentation.trace_memory:
+            # a nested stage resets the peak again, so the outer stage reports the peak after it
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        stage = self.instrumentation.stages.setdefault(self.name, {"calls": 0, "seconds": 0.0})
+        stage["calls"] += 1
+        stage["seconds"] += seconds
+        if self.instrumentation.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            stage["peak_traced_mb"] = max(stage.get("peak_traced_mb", 0.0), peak)
+        return False
+
+
+class Instrumentation:
+    """ collects the timers and counters of a run and sends them to a sink
+        inputs
+        ------
+        sink: object with a send(report) method, e.g. LogSink, JsonSink or HttpSink
+        profile: if True, runs cProfile from now until the report is sent
+        trace_memory: if True, traces the python allocations with tracemalloc to report the peak of every stage
+    """
+
+    def __init__(self, sink, profile=False, trace_memory=False):
+        self.sink = sink
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counters = {}
+        self.profiler = None
+        if profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        # only stop tracing at the end if it was started here
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def _profile_report(self):
+        """ returns (function, calls, own seconds, cumulative seconds) of the slowest functions """
+        self.profiler.disable()
+        stats = pstats.Stats(self.profiler).sort_stats("cumulative")
+        rows = []
+        for (file_name, line, function), (_, calls, own_seconds, seconds, _) in stats.stats.items():
+            # leave out the wrappers of timed
+            if file_name == __file__:
+                continue
+            rows.append(("%s:%d(%s)" % (os.path.basename(file_name), line, function), calls, own_seconds, seconds))
+        rows.sort(key=lambda row: row[3], reverse=True)
+        return rows[:PROFILE_TOP]
+
+    def report(self):
+        """ returns the report of everything collected so far """
+        report = {"time": time.time(), "pid": os.getpid(), "argv": sys.argv, "stages": self.stages,
+                  "counters": self.counters, "peak_rss_mb": peak_rss_mb()}
+        if self.profiler is not None:
+            report["profile"] = self._profile_report()
+        if self.trace_memory:
+            report["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        return report
+
+    def flush(self):
+        """ sends the report to the sink and starts collecting again """
+        self.sink.send(self.report())
+        self.stages = {}
+        self.counters = {}
+        if self.profiler is not None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+
+# the active Instrumentation, None while disabled
+_current = None
+
+
+def enable(sink="log", profile=False, trace_memory=False):
+    """ starts instrumenting the stages of the readers, analyses and plots until disable is called
+        inputs
+        ------
+        sink: a sink object or spec, see make_sink
+        profile: if True, adds the slowest functions of a cProfile capture to the report
+        trace_memory: if True, adds the traced peak memory of every stage to the report
+        outputs
+        -------
+        instrumentation: the Instrumentation collecting the timers and counters
+    """
+    global _current
+    if isinstance(sink, str):
+        if sink == "log" and not logging.getLogger().handlers:
+            logging.basicConfig(level=logging.INFO, format="%(message)s")
+        sink = make_sink(sink)
+    disable(flush=False)
+    _current = Instrumentation(sink, profile, trace_memory)
+    return _current
+
+
+def disable(flush=True):
+    """ stops instrumenting, sending what was collected to the sink if flush is True """
+    global _current
+    if _current is None:
+        return
+    instrumentation = _current
+    _current = None
+    if flush:
+        instrumentation.flush()
+    if instrumentation.profiler is not None:
+        instrumentation.profiler.disable()
+    if instrumentation.started_tracing:
+        tracemalloc.stop()
+
+
+def enabled():
+    """ returns True while instrumenting, so counters that cost something to compute can be skipped """
+    return _current is not None
+
+
+def stage(name):
+    """ returns a context manager timing a stage, e.g. with stage("read_samples"): ... """
+    if _current is None:
+        return _NO_OP_STAGE
+    return _current.stage(name)
+
+
+def count(name, value=1):
+    """ adds value to a counter, e.g. count("samples_rows", 1000) """
+    if _current is not None:
+        _current.count(name, value)
+
+
+def count_file(name, path):
+    """ adds the size of a file to the counter name, e.g. count_file("samples_bytes", samples_path) """
+    if _current is not None:
+        _current.count(name, os.path.getsize(path))
+
+
+def count_trials(name, res_dict):
+    """ adds the number of trials of a {participant: {trial: ...}} dictionary to the counter name """
+    if _current is not None:
+        _current.count(name, sum(len(trials) for trials in res_dict.values()))
+
+
+def counted(lines, name):
+    """ returns the lines of a file, counting them in the counter name while instrumenting,
+        e.g. for line in counted(file, "samples_rows"): ... the lines are returned as is while disabled
+    """
+    if _current is None:
+        return lines
+    return _counted(lines, name)
+
+
+def _counted(lines, name):
+    num_lines = 0
+    try:
+        for line in lines:
+            num_lines += 1
+            yield line
+    finally:
+        count(name, num_lines)
+
+
+def worker_options():
+    """ returns what run_measured needs to measure a task in a worker process like this process is measured,
+        None while disabled. the workers of a process pool are not instrumented themselves, so their tasks are
+        run by run_measured and their metrics added to this process with add_metrics
+    """
+    if _current is None:
+        return None
+    return {"trace_memory": _current.trace_memory}
+
+
+def run_measured(options, function, *args):
+    """ runs function(*args) in a worker process, collecting its stages and counters
+        inputs
+        ------
+        options: the worker_options of the process the task comes from, None to run the function unmeasured
+        function: the task, a picklable function
+        outputs
+        -------
+        result: what the function returns
+        metrics: {"stages": ..., "counters": ...} of the task, None if options is None
+    """
+    global _current
+    if options is None:
+        return function(*args), None
+    # a forked worker inherits a copy of the parent's instrumentation, which would never be reported
+    previous = _current
+    _current = Instrumentation(None, trace_memory=options["trace_memory"])
+    try:
+        result = function(*args)
+        metrics = {"stages": _current.stages, "counters": _current.counters}
+    finally:
+        if _current.started_tracing:
+            tracemalloc.stop()
+        _current = previous
+    return result, metrics
+
+
+def add_metrics(metrics):
+    """ adds the metrics of a task run by run_measured to the instrumentation of this process. the seconds
+        and calls of a stage are summed over the workers, so they are the cpu time spent in it and may exceed
+        the time of the run
+    """
+    if _current is None or metrics is None:
+        return
+    for name, stage in metrics["stages"].items():
+        total = _current.stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+        total["calls"] += stage["calls"]
+        total["seconds"] += stage["seconds"]
+        if "peak_traced_mb" in stage:
+            total["peak_traced_mb"] = max(total.get("peak_traced_mb", 0.0), stage["peak_traced_mb"])
+    for name, value in metrics["counters"].items():
+        _current.count(name, value)
+
+
+def timed(name):
+    """ decorator timing every call of a function as the stage name """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current is None:
+                return function(*args, **kwargs)
+            with _current.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_arguments(parser):
+    """ adds the --instrument and --profile options of enable_from_args to an argparse parser """
+    parser.add_argument("--instrument", metavar="SINK",
+                        help="report stage timings and counters to log, json:<path> or an http url")
+    parser.add_argument("--profile", nargs="+", choices=("cprofile", "tracemalloc"), default=[],
+                        help="also capture a cProfile profile and/or the tracemalloc peaks")
+
+
+def enable_from_args(args):
+    """ enables the instrumentation given by the options of add_arguments, reporting at exit. without
+        --instrument the environment variables decide, see enable_from_env
+    """
+    if args.instrument:
+        enable(args.instrument, "cprofile" in args.profile, "tracemalloc" in args.profile)
+        atexit.register(disable)
+    else:
+        enable_from_env()
+
+
+def enable_from_env():
+    """ enables the instrumentation if EYE_TRACKING_INSTRUMENT is set, reporting at exit. called by the
+        entry points, importing the modules never enables it
+    """
+    spec = os.environ.get(ENV_VAR, "")
+    if spec in ("", "0"):
+        return
+    extras = os.environ.get(PROFILE_ENV_VAR, "").split(",")
+    enable("log" if spec == "1" else spec, "cprofile" in extras, "tracemalloc" in extras)
+    atexit.register(disable)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        report = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        print(json.dumps(report, indent=2), flush=True)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=9091):
+    """ a local stand-in for a metrics endpoint that prints the reports posted by HttpSink """
+    server = HTTPServer(("127.0.0.1", port), _MetricsHandler)
+    print("listening on http://127.0.0.1:%d/" % port, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="runs a local stand-in for a metrics endpoint")
+    parser.add_argument("--port", type=int, default=9091)
+    args = parser.parse_args()
+    serve_metrics(args.port)
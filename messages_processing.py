@@ -1,70 +1,128 @@
+import sys
 
+import instrumentation
+from results import ResponseTimeResult
 
+
+@instrumentation.timed("read_messages")
 def read_messages(samples_path):
-    res_dict = {}
+    instrumentation.count_file("messages_bytes", samples_path)
     with open(samples_path, 'r') as file:
         next(file)
-        for line in file:
-            # split line into each field
-            cols = line.split(",")
-      
-            participant = cols[-1]
-            trial = cols[0]
-            resp_time = cols[3]
-            file_name = cols[5]
-
-            # label dict entries by participant
-            if participant not in res_dict:
-                res_dict[participant] = {}
-            
-            # add a subdict for each trial
-            if trial not in res_dict[participant]:
-                res_dict[participant][trial] = {}
-
-            # add the response time to the trial subdict
-            if "resp_time" not in res_dict[participant][trial]:
-                # adjust for the time only the fixation is visible
-                res_dict[participant][trial]["resp_time"] = float(resp_time) 
-
-            if "orig_side" not in res_dict[participant][trial]:
-                if "left" in file_name:
-                    res_dict[participant][trial]["orig_side"] = "left"
-                else:
-                    res_dict[participant][trial]["orig_side"] = "right"
+        res_dict = parse_message_lines(instrumentation.counted(file, "messages_rows"))
+    instrumentation.count_trials("messages_trials", res_dict)
     return res_dict
 
-def avg_response_time(messages_dict):
-    l_total_resp_time = 0
-    l_total_num = 0
+def parse_message_lines(lines):
+    """ organizes lines of the messages file into the dictionary returned by read_messages
+    inputs
+    ------
+    lines: iterable of lines of the messages file, without the header
+    outputs
+    -------
+    res_dict: {participant: {trial: {"resp_time": response time, "orig_side": "left" or "right"}}}
+    """
+    res_dict = {}
+    for line in lines:
+        # split line into each field
+        cols = line.split(",")
+  
+        participant = cols[-1]
+        trial = cols[0]
+        resp_time = cols[3]
+        file_name = cols[5]
 
-    r_total_resp_time = 0
-    r_total_num = 0
+        # label dict entries by participant
+        if participant not in res_dict:
+            res_dict[sys.intern(participant)] = {}
+        
+        # add a subdict for each trial
+        if trial not in res_dict[participant]:
+            res_dict[participant][sys.intern(trial)] = {}
 
-    for participant in messages_dict:
-        for trial in messages_dict[participant]:
-            resp_time = messages_dict[participant][trial]["resp_time"]
-            if messages_dict[participant][trial]["orig_side"] == "left":
-                l_total_resp_time += resp_time
-                l_total_num += 1
+        # add the response time to the trial subdict
+        if "resp_time" not in res_dict[participant][trial]:
+            # adjust for the time only the fixation is visible
+            res_dict[participant][trial]["resp_time"] = float(resp_time) 
+
+        if "orig_side" not in res_dict[participant][trial]:
+            if "left" in file_name:
+                res_dict[participant][trial]["orig_side"] = "left"
             else:
-                r_total_resp_time += resp_time
-                r_total_num += 1
+                res_dict[participant][trial]["orig_side"] = "right"
+    return res_dict
+
+def merge_message_dicts(res_dict, other_dict):
+    """ adds a dictionary parsed from a later part of the messages file to res_dict, so that
+        merging the parts in file order gives the same dictionary as reading the whole file
+    inputs
+    ------
+    res_dict: dictionary in the format returned by read_messages, updated in place
+    other_dict: dictionary in the format returned by read_messages
+    """
+    for participant in other_dict:
+        if participant not in res_dict:
+            res_dict[participant] = {}
+        for trial in other_dict[participant]:
+            # the first row of a trial sets its fields
+            if trial not in res_dict[participant]:
+                res_dict[participant][trial] = other_dict[participant][trial]
+
+class ResponseTimeAccumulator:
+    """ incrementally computes the averages of avg_response_time one trial at a time """
+
+    def __init__(self):
+        self.l_total_resp_time = 0
+        self.l_total_num = 0
+
+        self.r_total_resp_time = 0
+        self.r_total_num = 0
+
+    def add_trial(self, participant, trial, trial_dict):
+        """ adds a trial subdict of the dictionary returned by read_messages to the totals """
+        resp_time = trial_dict["resp_time"]
+        if trial_dict["orig_side"] == "left":
+            self.l_total_resp_time += resp_time
+            self.l_total_num += 1
+        else:
+            self.r_total_resp_time += resp_time
+            self.r_total_num += 1
 
+    def merge(self, other):
+        """ adds the totals of other, e.g. computed in another process """
+        self.l_total_resp_time += other.l_total_resp_time
+        self.l_total_num += other.l_total_num
+        self.r_total_resp_time += other.r_total_resp_time
+        self.r_total_num += other.r_total_num
 
-    total_resp_time = l_total_resp_time + r_total_resp_time
-    total_num = l_total_num + r_total_num
+    def result(self):
+        """ returns the ResponseTimeResult with the average response times if the original was on the left,
+            on the right and overall
+        """
+        total_resp_time = self.l_total_resp_time + self.r_total_resp_time
+        total_num = self.l_total_num + self.r_total_num
 
-    l_avg = l_total_resp_time/l_total_num
-    r_avg = r_total_resp_time/r_total_num
-    avg = total_resp_time/total_num
+        l_avg = self.l_total_resp_time/self.l_total_num
+        r_avg = self.r_total_resp_time/self.r_total_num
+        avg = total_resp_time/total_num
+
+        return ResponseTimeResult(l_avg, r_avg, avg)
+
+@instrumentation.timed("avg_response_time")
+def avg_response_time(messages_dict):
+    accumulator = ResponseTimeAccumulator()
+    for participant in messages_dict:
+        for trial in messages_dict[participant]:
+            accumulator.add_trial(participant, trial, messages_dict[participant][trial])
+    return accumulator.result()
 
-    return l_avg, r_avg, avg
+def print_response_times(l_avg, r_avg, avg):
+    """ prints the averages computed by avg_response_time """
+    print("average response time (left): " + str(l_avg))
+    print("average response time (right): " + str(r_avg))
+    print("average response time: " + str(avg))
 
 if __name__ == "__main__":
+    instrumentation.enable_from_env()
     res = read_messages("Pilot_messages.csv")
-    # print(len(res))
-    # print(res)
-    # print(len(res["SPa\n"]))
-    # print(res["SPa\n"]["1"])
-    average = avg_response_time(res)
-    print(average)
\ No newline at end of file
+    print_response_times(*avg_response_time(res))
\ No newline at end of file
@@ -0,0 +1,172 @@
+import io
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+from fixations_processing import merge_fixation_dicts, parse_fixation_lines
+from messages_processing import merge_message_dicts, parse_message_lines
+from row_filter import DEFAULT_FILTER
+from samples_processing import CHUNK_SIZE, add_sample_segment, parse_sample_chunk
+
+# number of bytes of a file parsed by one task
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def list_input_files(path):
+    """ lists the files to ingest
+    inputs
+    ------
+    path: string path to a file or to a directory of per-participant files
+    outputs
+    -------
+    paths: list of file paths, sorted by name for directories so the merge order is deterministic
+    """
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))
+                if os.path.isfile(os.path.join(path, name)) and not name.startswith(".")]
+    return [path]
+
+
+def split_byte_ranges(path, chunk_bytes=CHUNK_BYTES):
+    """ splits a file into byte ranges of about chunk_bytes that start and end on line boundaries.
+        the header line is not part of any range.
+    inputs
+    ------
+    path: string path to the file
+    chunk_bytes: approximate size of each range
+    outputs
+    -------
+    ranges: list of (start, end) byte offsets in file order
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as file:
+        file.readline()
+        start = file.tell()
+        while start < size:
+            target = start + max(chunk_bytes, 1)
+            if target >= size:
+                end = size
+            else:
+                # move to the start of the line after the one containing target - 1
+                file.seek(target - 1)
+                file.readline()
+                end = file.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _read_range(path, start, end):
+    """ decodes a byte range the same way open(path, 'r') would """
+    with open(path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+    return io.TextIOWrapper(io.BytesIO(data))
+
+
+def _read_header(path):
+    """ returns the header line of a file """
+    with open(path, 'r') as file:
+        return file.readline()
+
+
+def _parse_samples(text_file, row_filter, header):
+    segments = []
+    while True:
+        # parse whole lines in chunks of the samples reader's size
+        text = text_file.read(CHUNK_SIZE)
+        if not text:
+            break
+        text += text_file.readline()
+        segments += parse_sample_chunk(text, row_filter)
+    return segments
+
+
+def _merge_samples(res_dict, segments):
+    for segment in segments:
+        add_sample_segment(res_dict, segment)
+
+
+def _parse_fixations(text_file, row_filter, header):
+    return parse_fixation_lines(text_file, row_filter, header)
+
+
+def _parse_messages(text_file, row_filter, header):
+    return parse_message_lines(text_file)
+
+
+# parse a range of a file in a worker and merge the parsed parts in the main process
+PARSERS = {
+    "samples": (_parse_samples, _merge_samples),
+    "fixations": (_parse_fixations, merge_fixation_dicts),
+    "messages": (_parse_messages, merge_message_dicts),
+}
+
+
+def _parse_task(task):
+    """ parses one byte range of a file in a worker process """
+    kind, path, start, end, row_filter, header = task
+    parse, _ = PARSERS[kind]
+    return parse(_read_range(path, start, end), row_filter, header)
+
+
+def read_parallel(path, kind, workers=None, chunk_bytes=CHUNK_BYTES, row_filter=DEFAULT_FILTER):
+    """ parses a file, or a directory of per-participant files, in a process pool and merges the results.
+        the parts are merged in file order, so the result is identical to the serial reader's output
+        (for a directory, to the serial reader run on the files concatenated in name order).
+    inputs
+    ------
+    path: string path to a file or to a directory of files with the same columns
+    kind: "samples", "fixations" or "messages"
+    workers: number of worker processes, defaults to the number of cores. 1 parses in this process
+    chunk_bytes: approximate number of bytes parsed by one task
+    row_filter: RowFilter selecting the rows of the samples or fixations to keep, by default every participant
+                but nikki. the messages can not be filtered
+    while instrumenting, the stages and counters of the workers are added to the ones of this process
+    outputs
+    -------
+    res_dict: the dictionary read_samples, read_fixations or read_messages returns
+    """
+    if kind not in PARSERS:
+        raise ValueError("kind must be one of " + ", ".join(PARSERS))
+    if kind == "messages" and row_filter != DEFAULT_FILTER:
+        raise ValueError("the messages can not be filtered")
+    _, merge = PARSERS[kind]
+
+    tasks = []
+    for file_path in list_input_files(path):
+        header = _read_header(file_path)
+        for start, end in split_byte_ranges(file_path, chunk_bytes):
+            tasks.append((kind, file_path, start, end, row_filter, header))
+
+    res_dict = {}
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            merge(res_dict, _parse_task(task))
+        return res_dict
+
+    measure = instrumentation.worker_options()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map yields the results in task order, with the stages and counters of the workers
+        for part, metrics in executor.map(instrumentation.run_measured, itertools.repeat(measure),
+                                          itertools.repeat(_parse_task), tasks):
+            instrumentation.add_metrics(metrics)
+            merge(res_dict, part)
+    return res_dict
+
+
+def read_samples_parallel(samples_path, workers=None, chunk_bytes=CHUNK_BYTES, row_filter=DEFAULT_FILTER):
+    """ parallel version of read_samples, see read_parallel """
+    return read_parallel(samples_path, "samples", workers, chunk_bytes, row_filter)
+
+
+def read_fixations_parallel(fixations_path, workers=None, chunk_bytes=CHUNK_BYTES, row_filter=DEFAULT_FILTER):
+    """ parallel version of read_fixations, see read_parallel """
+    return read_parallel(fixations_path, "fixations", workers, chunk_bytes, row_filter)
+
+
+def read_messages_parallel(messages_path, workers=None, chunk_bytes=CHUNK_BYTES):
+    """ parallel version of read_messages, see read_parallel """
+    return read_parallel(messages_path, "messages", workers, chunk_bytes)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+from fixations_processing import read_fixations
+from messages_processing import read_messages
+from samples_processing import read_samples_chunked
+from trial_store import TrialStore, fixation_store_from_file, sample_store_from_file
+
+DEFAULT_CACHE_DIR = ".parse_cache"
+# the cache evicts the least recently used entries above this size
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# bump the version of a reader when its output changes so entries parsed by the old version are not used,
+# and the version of the store kind built from the same file with it
+READERS = {
+    "samples": (read_samples_chunked, 1),
+    "fixations": (read_fixations, 4),
+    "messages": (read_messages, 1),
+    "fixation_store": (fixation_store_from_file, 5),
+    "sample_store": (sample_store_from_file, 2),
+}
+# kinds parsed into a TrialStore, which is cached as a directory of memory-mappable arrays
+STORE_KINDS = ("fixation_store", "sample_store")
+
+_HASH_BLOCK = 1024 * 1024
+_INDEX_NAME = "hashes.json"
+
+
+def file_hash(path):
+    """ computes the blake2b hash of the contents of a file
+    inputs
+    ------
+    path: string path to the file
+    outputs
+    -------
+    digest: hex string
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """ on-disk cache of parsed eye-tracking files, keyed by the hash of the file contents and the
+        version of the reader, so entries are invalidated automatically when either changes.
+        the hash of a file is remembered together with its size and modification time, so warm runs
+        do not need to read the source file at all.
+        inputs
+        ------
+        cache_dir: directory the entries are stored in
+        max_bytes: maximum total size of the entries, the least recently used ones are evicted above it
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, _INDEX_NAME)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomic(self, path, write):
+        tmp_path = path + ".tmp%d" % os.getpid()
+        with open(tmp_path, 'wb') as file:
+            write(file)
+        os.replace(tmp_path, path)
+
+    def source_hash(self, path):
+        """ returns the content hash of a source file, rehashing it only if its size or mtime changed """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        index = self._load_index()
+        entry = index.get(path)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        digest = file_hash(path)
+        index[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._write_atomic(self._index_path(), lambda file: file.write(json.dumps(index).encode()))
+        return digest
+
+    def entry_path(self, kind, path):
+        """ returns the path of the cache entry for a source file parsed by the reader of the given kind """
+        _, version = READERS[kind]
+        extension = "store" if kind in STORE_KINDS else "pkl"
+        return os.path.join(self.cache_dir, "%s-v%d-%s.%s" % (kind, version, self.source_hash(path), extension))
+
+    def read(self, path, kind):
+        """ returns the parsed file, from the cache if possible
+        inputs
+        ------
+        path: string path to the samples, fixations or messages file
+        kind: one of READERS, e.g. "samples", "fixations" or "fixation_store"
+        outputs
+        -------
+        res_dict: the dictionary the reader of that kind returns, or a memory-mapped TrialStore for the store kinds
+        """
+        if kind not in READERS:
+            raise ValueError("kind must be one of " + ", ".join(READERS))
+        entry_path = self.entry_path(kind, path)
+        try:
+            if kind in STORE_KINDS:
+                res_dict = TrialStore.load(entry_path)
+            else:
+                with open(entry_path, 'rb') as file:
+                    res_dict = pickle.load(file)
+            # mark the entry as recently used
+            os.utime(entry_path)
+            return res_dict
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            pass
+
+        reader, _ = READERS[kind]
+        res_dict = reader(path)
+        if kind in STORE_KINDS:
+            tmp_path = entry_path + ".tmp%d" % os.getpid()
+            res_dict.save(tmp_path)
+            shutil.rmtree(entry_path, ignore_errors=True)
+            os.replace(tmp_path, entry_path)
+            res_dict = TrialStore.load(entry_path)
+        else:
+            self._write_atomic(entry_path, lambda file: pickle.dump(res_dict, file, pickle.HIGHEST_PROTOCOL))
+        self.evict()
+        return res_dict
+
+    def entries(self):
+        """ returns (last use time, size, path) of every cache entry, least recently used first """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".pkl"):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+            elif name.endswith(".store"):
+                size = sum(os.path.getsize(os.path.join(path, array_name)) for array_name in os.listdir(path))
+                entries.append((os.stat(path).st_mtime, size, path))
+        entries.sort()
+        return entries
+
+    def _remove(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    def evict(self):
+        """ removes the least recently used entries until the cache is at most max_bytes """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        """ removes every entry and the remembered hashes """
+        for _, _, path in self.entries():
+            self._remove(path)
+        if os.path.exists(self._index_path()):
+            os.remove(self._index_path())
+
+
+def read_cached(path, kind, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    """ reads a samples, fixations or messages file through a ParseCache
+    inputs
+    ------
+    path: string path to the file
+    kind: one of READERS, e.g. "samples", "fixations" or "fixation_store"
+    cache_dir: directory the entries are stored in
+    max_bytes: maximum total size of the cache
+    outputs
+    -------
+    res_dict: the dictionary the reader of that kind returns, or a memory-mapped TrialStore for the store kinds
+    """
+    return ParseCache(cache_dir, max_bytes).read(path, kind)
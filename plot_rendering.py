@@ -0,0 +1,115 @@
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import instrumentation
+from fixations_processing import draw_time_proportions, summary_time_proportions, time_proportions
+
+
+def _file_stem(title):
+    """ turns a plot title into a file name, e.g. "Proportions of Times (Left)" -> "proportions_of_times_left" """
+    return re.sub(r"[^a-z0-9]+", "_", title.lower()).strip("_")
+
+
+def _render_jobs(jobs, out_dir, formats, dpi):
+    """ renders plot jobs with a single reused figure and canvas, without any GUI backend
+    inputs
+    ------
+    jobs: list of (bin_edges, acc_proportions, in_acc_proportions, median, x_label, title)
+    out_dir: directory the files are written to
+    formats: file formats to write, e.g. ("png", "svg", "pdf")
+    dpi: resolution of raster formats
+    outputs
+    -------
+    timings: list of (title, paths, seconds) per job
+    """
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+
+    timings = []
+    for bin_edges, acc_proportions, in_acc_proportions, median, x_label, title in jobs:
+        start = time.perf_counter()
+        ax.clear()
+        draw_time_proportions(ax, bin_edges, acc_proportions, in_acc_proportions, median, x_label, title)
+        paths = []
+        for file_format in formats:
+            path = os.path.join(out_dir, _file_stem(title) + "." + file_format)
+            figure.savefig(path, format=file_format, dpi=dpi)
+            paths.append(path)
+        timings.append((title, paths, time.perf_counter() - start))
+    return timings
+
+
+class HeadlessRenderer:
+    """ collects the plots of plot_time_proportions and writes them to files instead of showing them,
+        so batch runs never block on a GUI. pass its add method as the plot argument of the reports:
+            renderer = HeadlessRenderer("plots")
+            first_saccade_time_and_accuracy(fixation_dict, plot=renderer.add)
+            renderer.render()
+        inputs
+        ------
+        out_dir: directory the files are written to, created if needed
+        formats: file formats to write, any of the formats matplotlib supports, e.g. ("png", "svg", "pdf")
+        workers: number of processes rendering in parallel, 1 renders in this process
+        dpi: resolution of raster formats
+    """
+
+    def __init__(self, out_dir, formats=("png",), workers=1, dpi=100):
+        self.out_dir = out_dir
+        self.formats = tuple(formats)
+        self.workers = workers
+        self.dpi = dpi
+        self.jobs = []
+        self.timings = []
+
+    @instrumentation.timed("queue_plot")
+    def add(self, acc_times, in_acc_times, x_label, title, max_time, bin_size, print_median=False):
+        """ queues a plot, same arguments as plot_time_proportions. the histograms and the median are
+            computed (and printed) right away, so only the binned data is kept until render
+        """
+        bin_edges, acc_proportions, in_acc_proportions, median = time_proportions(acc_times, in_acc_times, max_time, bin_size)
+        if print_median:
+            print("Median" + title[10:] + ": " + str(median))
+        self.jobs.append((bin_edges, acc_proportions, in_acc_proportions, median, x_label, title))
+
+    @instrumentation.timed("queue_plot")
+    def add_summaries(self, acc_summary, in_acc_summary, x_label, title, print_median=False):
+        """ queues a plot of streaming summaries, same arguments as plot_time_summaries """
+        bin_edges, acc_proportions, in_acc_proportions, median = summary_time_proportions(acc_summary, in_acc_summary)
+        if print_median:
+            print("Median" + title[10:] + ": " + str(median))
+        self.jobs.append((bin_edges, acc_proportions, in_acc_proportions, median, x_label, title))
+
+    @instrumentation.timed("render_plots")
+    def render(self):
+        """ writes all queued plots and clears the queue
+        outputs
+        -------
+        timings: list of (title, paths, seconds) per plot, in the order they were added
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        jobs, self.jobs = self.jobs, []
+        if self.workers == 1 or len(jobs) <= 1:
+            timings = _render_jobs(jobs, self.out_dir, self.formats, self.dpi)
+        else:
+            # every worker renders an interleaved share of the jobs with its own figure
+            shares = [jobs[i::self.workers] for i in range(self.workers)]
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(_render_jobs, shares, [self.out_dir] * self.workers,
+                                            [self.formats] * self.workers, [self.dpi] * self.workers))
+            timings = [None] * len(jobs)
+            for i, share_timings in enumerate(results):
+                timings[i::self.workers] = share_timings
+        self.timings += timings
+        return timings
+
+    def print_timings(self):
+        """ prints the render time of every plot written so far """
+        for title, paths, seconds in self.timings:
+            print("%s: %.1f ms (%s)" % (title, seconds * 1000, ", ".join(paths)))
+        print("total: %.1f ms" % (sum(seconds for _, _, seconds in self.timings) * 1000))
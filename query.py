@@ -0,0 +1,515 @@
+import argparse
+import math
+import operator
+import sys
+
+import instrumentation
+from fixations_processing import fixation_columns, trial_first_saccade, trial_search_time
+from results import RowWriter
+from row_filter import RowFilter
+from samples_processing import TARGETS
+from session_engine import READERS, SOURCES, Session, normalize_side
+from streaming_stats import RunningStats
+
+# bounds of a RowFilter trial range open at one end, the trial numbers start at 1
+_MIN_TRIAL = 0
+_MAX_TRIAL = sys.maxsize
+
+
+def _saccade_on_target(trial_dict, field):
+    saccades = trial_dict.get("order_of_saccades", [])
+    target = TARGETS.get(trial_dict["orig_side"].strip())
+    if not saccades or target is None:
+        return None
+    return saccades[field] == target
+
+
+def _saccade_area(trial_dict, field):
+    saccades = trial_dict.get("order_of_saccades", [])
+    return saccades[field] if saccades else None
+
+
+def _first_saccade(trial_dict):
+    first_saccade = trial_first_saccade(trial_dict)
+    return (None, None) if first_saccade is None else first_saccade
+
+
+def _search(trial_dict):
+    # the search ends on a fixation on an interest area
+    if any(interval[2] != "[ ]" for interval in trial_dict["fixation_intervals"]):
+        return trial_search_time(trial_dict)
+    return None, None
+
+
+# column -> (source file it is read from, function of the trial subdict of that file, item of the tuple the
+# function returns or None, type). participant, trial and side come from the session. columns of a source that
+# does not have the trial are None. the first_saccade_on_target and last_saccade_on_target columns are the
+# per trial values saccade_accuracy_helper averages with field 0 and -1
+COLUMNS = {
+    "participant": (None, None, None, str),
+    "trial": (None, None, None, int),
+    "side": (None, None, None, str),
+    "condition": ("samples", lambda trial_dict: trial_dict["condition"].strip(), None, str),
+    "file_name": ("samples", operator.itemgetter("file_name"), None, str),
+    "num_saccades": ("samples", lambda trial_dict: len(trial_dict.get("order_of_saccades", [])), None, int),
+    "first_saccade_area": ("samples", lambda trial_dict: _saccade_area(trial_dict, 0), None, str),
+    "last_saccade_area": ("samples", lambda trial_dict: _saccade_area(trial_dict, -1), None, str),
+    "first_saccade_on_target": ("samples", lambda trial_dict: _saccade_on_target(trial_dict, 0), None, bool),
+    "last_saccade_on_target": ("samples", lambda trial_dict: _saccade_on_target(trial_dict, -1), None, bool),
+    "first_saccade_time": ("fixations", _first_saccade, 0, float),
+    "first_saccade_accurate": ("fixations", _first_saccade, 1, bool),
+    "search_time": ("fixations", _search, 0, float),
+    "search_accurate": ("fixations", _search, 1, bool),
+    "resp_time": ("messages", operator.itemgetter("resp_time"), None, float),
+}
+# columns read from another file when the query is not given the file of COLUMNS and that file has the column,
+# with the same function of its trial subdict
+FALLBACK_SOURCES = {"condition": "fixations"}
+# the columns a query can group by
+GROUP_COLUMNS = ("participant", "trial", "side", "condition", "file_name")
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, values: value in values,
+}
+AGGREGATES = ("count", "sum", "mean", "min", "max", "median")
+
+
+def _has_condition(source, path):
+    """ returns True if the file of a source has a condition column, which the fixations file may lack """
+    if source == "samples":
+        return True
+    if source != "fixations" or path is None:
+        return False
+    with open(path, 'r') as file:
+        return "condition" in fixation_columns(next(file, None))[0]
+
+
+def convert_value(column, value):
+    """ converts a value compared to a column to the type of the column, e.g. "12" to 12 for the trial, and a side
+        in any encoding to "Left" or "Right"
+    """
+    if column not in COLUMNS:
+        raise ValueError("unknown column %r, the columns are %s" % (column, ", ".join(COLUMNS)))
+    if column == "side":
+        return normalize_side(value)
+    kind = COLUMNS[column][3]
+    if isinstance(value, str) and kind is bool:
+        return value.strip().lower() in ("true", "1", "yes")
+    return kind(value.strip() if isinstance(value, str) and kind is str else value)
+
+
+class _Aggregate:
+    """ an aggregate of the non-None values of a column in a group """
+
+    def __init__(self, function):
+        self.function = function
+        self.stats = RunningStats()
+        # the median needs the values, a value per trial
+        self.values = [] if function == "median" else None
+
+    def add(self, value):
+        value = float(value)
+        self.stats.add(value)
+        if self.values is not None:
+            self.values.append(value)
+
+    def result(self):
+        if self.function == "count":
+            return self.stats.count
+        if self.stats.count == 0:
+            return math.nan
+        if self.function == "sum":
+            return self.stats.total
+        if self.function == "mean":
+            return self.stats.mean()
+        if self.function == "min":
+            return self.stats.min
+        if self.function == "max":
+            return self.stats.max
+        # the median used across the repository, the value at rank int(n * 0.5) of the sorted values
+        return sorted(self.values)[int(len(self.values) * 0.5)]
+
+
+class _RowValues:
+    """ the columns of a row of a session, computed when first needed, so a column is only computed if some
+        query of the scan uses it, and each function of a trial subdict runs at most once per row
+    """
+
+    def __init__(self, session, column_sources):
+        self.session = session
+        self.column_sources = column_sources
+        self.row = None
+        self._values = {}
+        self._results = {}
+
+    def start(self, row):
+        self.row = row
+        self._values = {}
+        self._results = {}
+
+    def __getitem__(self, column):
+        if column in self._values:
+            return self._values[column]
+        _, function, item, _ = COLUMNS[column]
+        source = self.column_sources[column]
+        session = self.session
+        if column == "participant":
+            value = session.participants[self.row]
+        elif column == "trial":
+            value = int(session.trials[self.row])
+        elif column == "side":
+            value = session.sides[self.row]
+        else:
+            trial_dict = session.sources[source][self.row]
+            if trial_dict is None:
+                value = None
+            else:
+                key = (source, function)
+                if key not in self._results:
+                    self._results[key] = function(trial_dict)
+                value = self._results[key] if item is None else self._results[key][item]
+        self._values[column] = value
+        return value
+
+
+class Query:
+    """ lazy query over the trials of a session. filter, where, group_by, agg and select return a new query
+        with one more step in its plan, and nothing is read until collect (or collect_all) runs the plan:
+            only the files holding the columns the query uses are read,
+            the filters on the participant, trial, condition and side are pushed into the readers as a RowFilter,
+            so the rows of other trials are dropped before they are parsed,
+            all the aggregations of the query, and of every query over the same files given to collect_all,
+            are computed in a single pass over the joined trials.
+        the rows of a query are the trials of the files it reads, with the columns of COLUMNS, None for the
+        columns of a file the trial is not in. comparisons with None are false and aggregates skip None
+        inputs
+        ------
+        samples, fixations, messages: string paths to the files of the session, None for files not available
+        cache_dir: if given, files read without a pushed down filter are read through a ParseCache in this directory
+    """
+
+    def __init__(self, samples=None, fixations=None, messages=None, cache_dir=None):
+        self.paths = {"samples": samples, "fixations": fixations, "messages": messages}
+        self.cache_dir = cache_dir
+        self.predicates = ()
+        self.keys = ()
+        self.aggregations = ()
+        self.columns = ()
+
+    def _with(self, **changes):
+        query = Query.__new__(Query)
+        query.__dict__.update(self.__dict__)
+        query.__dict__.update(changes)
+        return query
+
+    def where(self, column, op, value):
+        """ keeps the rows whose column compares to value, e.g. where("resp_time", ">", 500). op is one of
+            OPERATORS, with "in" taking a list of values
+        """
+        if op not in OPERATORS:
+            raise ValueError("op must be one of " + ", ".join(OPERATORS))
+        if op == "in":
+            value = tuple(convert_value(column, item) for item in value)
+        else:
+            value = convert_value(column, value)
+        return self._with(predicates=self.predicates + ((column, op, value),))
+
+    def filter(self, **values):
+        """ keeps the rows whose columns equal the values, or one of them for a list, tuple or set,
+            e.g. filter(condition="A", participant=["SPa", "SPb"])
+        """
+        query = self
+        for column, value in values.items():
+            query = query.where(column, "in" if isinstance(value, (list, tuple, set)) else "==", value)
+        return query
+
+    def group_by(self, *keys):
+        """ groups the rows by the values of some of GROUP_COLUMNS, e.g. group_by("participant", "condition") """
+        for key in keys:
+            if key not in GROUP_COLUMNS:
+                raise ValueError("can only group by " + ", ".join(GROUP_COLUMNS))
+        return self._with(keys=tuple(keys))
+
+    def agg(self, **aggregations):
+        """ adds aggregations of the columns of every group, name=(function, column) with a function of AGGREGATES,
+            e.g. agg(accuracy=("mean", "last_saccade_on_target"), trials=("count", "trial")). booleans count as 0 and 1
+        """
+        added = []
+        for name, (function, column) in aggregations.items():
+            if function not in AGGREGATES:
+                raise ValueError("the aggregate function must be one of " + ", ".join(AGGREGATES))
+            if column not in COLUMNS:
+                raise ValueError("unknown column %r, the columns are %s" % (column, ", ".join(COLUMNS)))
+            added.append((name, function, column))
+        return self._with(aggregations=self.aggregations + tuple(added))
+
+    def select(self, *columns):
+        """ returns the rows themselves, with these columns, instead of aggregates """
+        for column in columns:
+            if column not in COLUMNS:
+                raise ValueError("unknown column %r, the columns are %s" % (column, ", ".join(COLUMNS)))
+        return self._with(columns=tuple(columns))
+
+    def used_columns(self):
+        """ returns the columns the query reads, in the order they are first used """
+        used = [column for column, _, _ in self.predicates] + list(self.keys) + \
+            [column for _, _, column in self.aggregations] + list(self.columns)
+        return list(dict.fromkeys(used))
+
+    def column_source(self, column):
+        """ returns the file a column is read from, the one of COLUMNS unless it was not given and the column has a
+            fallback in FALLBACK_SOURCES, e.g. the condition of the fixations file without the samples file
+        """
+        source = COLUMNS[column][0]
+        fallback = FALLBACK_SOURCES.get(column)
+        if source is not None and self.paths[source] is None and fallback is not None and \
+                self.paths[fallback] is not None and _has_condition(fallback, self.paths[fallback]):
+            return fallback
+        return source
+
+    def sources(self):
+        """ returns the files the query reads, raising a ValueError if one of them was not given """
+        sources = {self.column_source(column) for column in self.used_columns()} - {None}
+        missing = [source for source in sources if self.paths[source] is None]
+        if missing:
+            raise ValueError("the query needs the %s file" % " and ".join(sorted(missing)))
+        if not sources:
+            # only the participant, trial and side, which every file has
+            sources = {next((source for source in SOURCES if self.paths[source] is not None), None)} - {None}
+            if not sources:
+                raise ValueError("the query has no file to read")
+        return [source for source in SOURCES if source in sources]
+
+    def row_filter(self, source):
+        """ returns the RowFilter of the predicates that can be pushed into the reader of a source, or None.
+            the participant, trial and side are tested by the samples and fixations readers, the condition by the
+            samples reader and by the fixations reader if the file has a condition column
+        """
+        if source == "messages":
+            return None
+        push_condition = _has_condition(source, self.paths[source])
+        participants = sides = conditions = None
+        first_trial, last_trial = _MIN_TRIAL, _MAX_TRIAL
+        pushed = False
+        for column, op, value in self.predicates:
+            values = (value,) if op == "==" else value if op == "in" else None
+            if column == "participant" and values is not None:
+                participants = set(values) if participants is None else participants & set(values)
+            elif column == "side" and values is not None:
+                sides = set(values) if sides is None else sides & set(values)
+            elif column == "condition" and values is not None and push_condition:
+                conditions = set(values) if conditions is None else conditions & set(values)
+            elif column == "trial" and op in ("==", "in", "<", "<=", ">", ">="):
+                if op in ("==", "in"):
+                    first_trial = max(first_trial, min(values, default=0))
+                    last_trial = min(last_trial, max(values, default=-1))
+                elif op in (">", ">="):
+                    first_trial = max(first_trial, value + (op == ">"))
+                else:
+                    last_trial = min(last_trial, value - (op == "<"))
+            else:
+                continue
+            pushed = True
+        if not pushed:
+            return None
+        trials = None if (first_trial, last_trial) == (_MIN_TRIAL, _MAX_TRIAL) else (first_trial, last_trial)
+        return RowFilter(participants=None if participants is None else sorted(participants),
+                         trials=trials, conditions=None if conditions is None else sorted(conditions),
+                         sides=None if sides is None else sorted(side for side in sides if side is not None))
+
+    def explain(self):
+        """ returns a description of the plan of the query """
+        lines = []
+        for source in self.sources():
+            row_filter = self.row_filter(source)
+            lines.append("scan %s %s%s" % (source, self.paths[source],
+                                           "" if row_filter is None else " with " + repr(row_filter)))
+        lines.append("columns: " + ", ".join(self.used_columns()))
+        for column, op, value in self.predicates:
+            lines.append("filter: %s %s %r" % (column, op, value))
+        if self.keys:
+            lines.append("group by: " + ", ".join(self.keys))
+        for name, function, column in self.aggregations:
+            lines.append("aggregate: %s = %s(%s)" % (name, function, column))
+        if self.columns:
+            lines.append("select: " + ", ".join(self.columns))
+        return "\n".join(lines)
+
+    def collect(self):
+        """ runs the query, see collect_all """
+        return collect_all([self])[0]
+
+
+def _sort_key(row_key):
+    # None sorts after the values
+    return tuple((value is None, value if value is not None else 0) for value in row_key)
+
+
+def _scan_key(query):
+    return tuple(query.paths[source] for source in SOURCES), query.cache_dir
+
+
+@instrumentation.timed("query_scan")
+def _scan(paths, cache_dir, sources, row_filters):
+    """ reads the files of the sources, with a RowFilter or the readers' default, and joins them into a Session """
+    session = Session()
+    for source in sources:
+        row_filter = row_filters[source]
+        if row_filter is not None:
+            res_dict = READERS[source](paths[source], row_filter=row_filter)
+        elif cache_dir is not None:
+            from parse_cache import read_cached
+            res_dict = read_cached(paths[source], source, cache_dir)
+        else:
+            res_dict = READERS[source](paths[source])
+        session.add_source(source, res_dict)
+    return session
+
+
+@instrumentation.timed("collect_queries")
+def collect_all(queries):
+    """ runs several queries, reading the files shared by queries over the same session once and computing all
+        their aggregations in a single pass over its trials, e.g. every metric of a dashboard
+    inputs
+    ------
+    queries: list of Query
+    outputs
+    -------
+    results: a list per query of rows, dictionaries of the group keys and aggregations (a single row without
+             group_by), sorted by the keys, or of the selected columns in the order of the trials for select
+    """
+    results = [None] * len(queries)
+    scans = {}
+    for i, query in enumerate(queries):
+        if not query.aggregations and not query.columns:
+            raise ValueError("the query has neither aggregations nor selected columns")
+        scans.setdefault(_scan_key(query), []).append(i)
+
+    for indexes in scans.values():
+        scan_queries = [queries[i] for i in indexes]
+        sources = [source for source in SOURCES if any(source in query.sources() for query in scan_queries)]
+        # a filter is pushed into a reader when every query of the scan pushes the same one, the predicates are
+        # tested again on the joined rows in any case
+        row_filters = {}
+        for source in sources:
+            filters = {repr(query.row_filter(source)): query.row_filter(source) for query in scan_queries}
+            row_filters[source] = filters.popitem()[1] if len(filters) == 1 else None
+        session = _scan(scan_queries[0].paths, scan_queries[0].cache_dir, sources, row_filters)
+        instrumentation.count("query_rows", len(session))
+
+        plans = []
+        for query in scan_queries:
+            predicates = [(column, OPERATORS[op], value) for column, op, value in query.predicates]
+            # the rows of a query are the trials of its own files, not of the other files of the scan
+            source_rows = [session.sources[source] for source in query.sources()]
+            plans.append((query, source_rows, predicates, {} if query.aggregations else []))
+        values = _RowValues(session, {column: scan_queries[0].column_source(column) for column in COLUMNS})
+        for row in range(len(session)):
+            values.start(row)
+            for query, source_rows, predicates, output in plans:
+                if all(rows[row] is None for rows in source_rows):
+                    continue
+                if not all(values[column] is not None and test(values[column], value)
+                           for column, test, value in predicates):
+                    continue
+                if query.columns:
+                    output.append({column: values[column] for column in query.columns})
+                    continue
+                key = tuple(values[column] for column in query.keys)
+                aggregates = output.get(key)
+                if aggregates is None:
+                    aggregates = output[key] = [_Aggregate(function) for _, function, _ in query.aggregations]
+                for aggregate, (_, _, column) in zip(aggregates, query.aggregations):
+                    value = values[column]
+                    if value is not None:
+                        aggregate.add(value)
+
+        for i, (query, _, _, output) in zip(indexes, plans):
+            if query.columns:
+                results[i] = output
+                continue
+            if not output and not query.keys:
+                output[()] = [_Aggregate(function) for _, function, _ in query.aggregations]
+            rows = []
+            for key in sorted(output, key=_sort_key):
+                row = dict(zip(query.keys, key))
+                for (name, _, _), aggregate in zip(query.aggregations, output[key]):
+                    row[name] = aggregate.result()
+                rows.append(row)
+            results[i] = rows
+    return results
+
+
+def print_rows(rows):
+    """ prints the rows of a query as a table """
+    if not rows:
+        print("no rows")
+        return
+    columns = list(rows[0])
+    print(" ".join("%14s" % column for column in columns))
+    for row in rows:
+        print(" ".join("%14.4f" % value if isinstance(value, float) else "%14s" % (value,) for value in row.values()))
+
+
+def parse_predicate(text):
+    """ returns the (column, op, value) of a predicate written as "column op value", e.g. "resp_time > 500" or
+        "condition in A,B"
+    """
+    parts = text.split(None, 2)
+    if len(parts) != 3 or parts[1] not in OPERATORS:
+        raise ValueError("expected 'column op value' with op one of %s, got %r" % (" ".join(OPERATORS), text))
+    column, op, value = parts
+    return column, op, value.split(",") if op == "in" else value
+
+
+def parse_aggregation(text):
+    """ returns the (name, (function, column)) of an aggregation written as "name=function:column",
+        e.g. "accuracy=mean:last_saccade_on_target"
+    """
+    name, _, spec = text.partition("=")
+    function, _, column = spec.partition(":")
+    if not name or not column:
+        raise ValueError("expected 'name=function:column', got %r" % text)
+    return name, (function, column)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="filters, groups and aggregates the trials of a session in one pass")
+    parser.add_argument("--samples")
+    parser.add_argument("--fixations")
+    parser.add_argument("--messages")
+    parser.add_argument("--cache-dir", help="read files without a pushed down filter through a parse cache")
+    parser.add_argument("--where", action="append", default=[],
+                        help="a filter 'column op value', e.g. 'resp_time > 500', may be repeated")
+    parser.add_argument("--group-by", nargs="+", default=[], choices=GROUP_COLUMNS)
+    parser.add_argument("--agg", nargs="+", default=[], help="aggregations 'name=function:column', e.g. "
+                                                              "accuracy=mean:last_saccade_on_target")
+    parser.add_argument("--select", nargs="+", default=[], help="columns of the rows to return instead of aggregates")
+    parser.add_argument("--explain", action="store_true", help="print the plan before running it")
+    parser.add_argument("--out", help="write the rows to this .csv, .json, .jsonl or .parquet file")
+    parser.add_argument("--quiet", action="store_true", help="do not print the rows")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.enable_from_args(args)
+
+    query = Query(args.samples, args.fixations, args.messages, args.cache_dir)
+    for text in args.where:
+        query = query.where(*parse_predicate(text))
+    query = query.group_by(*args.group_by).agg(**dict(parse_aggregation(text) for text in args.agg))
+    if args.select:
+        query = query.select(*args.select)
+    if args.explain:
+        print(query.explain())
+    rows = query.collect()
+    if not args.quiet:
+        print_rows(rows)
+    if args.out:
+        columns = list(rows[0]) if rows else list(query.keys) + [name for name, _, _ in query.aggregations]
+        with RowWriter(args.out, columns) as writer:
+            writer.write_rows(rows)
@@ -0,0 +1,310 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fixations_processing import trial_first_saccade
+from samples_processing import TARGETS
+
+# number of resamples drawn by one task
+BATCH_SIZE = 1000
+# maximum number of entries of the permuted label matrix of one task
+_MAX_BATCH_ENTRIES = 20 * 1000 * 1000
+
+
+def sample_accuracy_metrics(samples_dict, field):
+    """ per-trial arrays of the accuracies of saccade_accuracy_helper. every accuracy is a ratio of sums over
+        trials, sum(numerator)/sum(denominator), so it can be recomputed for any resample of the trials
+        inputs
+        ------
+        samples_dict: dictionary returned by read_samples
+        field: either 0 or -1, looks at the first saccade (0) or the last saccade (-1)
+        outputs
+        -------
+        participants: array of the participant of every trial
+        metrics: {name: (numerator, denominator)} arrays for "left", "right", "total", "condition A" and "condition B"
+        labels: {"side": array of "Left", "Right" or "", "condition": array of the conditions, "correct": bool array}
+    """
+    participants = []
+    sides = []
+    conditions = []
+    correct = []
+    for participant in samples_dict:
+        for trial in samples_dict[participant]:
+            trial_dict = samples_dict[participant][trial]
+            participants.append(participant)
+            conditions.append(trial_dict["condition"])
+            if trial_dict["orig_side"] == "Left\n":
+                sides.append("Left")
+                correct.append(trial_dict["order_of_saccades"][field] == TARGETS["Left"])
+            elif trial_dict["orig_side"] == "Right\n":
+                sides.append("Right")
+                correct.append(trial_dict["order_of_saccades"][field] == TARGETS["Right"])
+            else:
+                sides.append("")
+                correct.append(False)
+
+    sides = np.array(sides)
+    conditions = np.array(conditions)
+    correct = np.array(correct, dtype=bool)
+    left = sides == "Left"
+    right = sides == "Right"
+    metrics = {
+        "left": (correct & left, left),
+        "right": (correct & right, right),
+        "total": (correct, left | right),
+        "condition A": (correct & (conditions == "A"), conditions == "A"),
+        "condition B": (correct & (conditions == "B"), conditions == "B"),
+    }
+    metrics = {name: (num.astype(np.float64), den.astype(np.float64)) for name, (num, den) in metrics.items()}
+    return np.array(participants), metrics, {"side": sides, "condition": conditions, "correct": correct}
+
+
+def first_saccade_metrics(fixation_dict):
+    """ per-trial arrays of the averages of first_saccade_time_and_accuracy, see sample_accuracy_metrics
+        inputs
+        ------
+        fixation_dict: dictionary returned by read_fixations
+        outputs
+        -------
+        participants: array of the participant of every trial
+        metrics: {name: (numerator, denominator)} arrays for "left time", "right time", "time", "left accuracy",
+                 "right accuracy", "accuracy", "accurate time" and "inaccurate time"
+        labels: {"side": array of "Left", "Right" or "", "latency": array of the first saccade times (nan without one),
+                 "correct": bool array}
+    """
+    participants = []
+    sides = []
+    latencies = []
+    correct = []
+    for participant in fixation_dict:
+        for trial in fixation_dict[participant]:
+            trial_dict = fixation_dict[participant][trial]
+            participants.append(participant)
+            side = trial_dict["orig_side"]
+            sides.append(side if side in ("Left", "Right") else "")
+            first_saccade = trial_first_saccade(trial_dict)
+            if first_saccade is None:
+                latencies.append(np.nan)
+                correct.append(False)
+            else:
+                latencies.append(first_saccade[0])
+                correct.append(first_saccade[1])
+
+    sides = np.array(sides)
+    latencies = np.array(latencies, dtype=np.float64)
+    correct = np.array(correct, dtype=bool)
+    times = np.nan_to_num(latencies)
+    left = sides == "Left"
+    right = sides == "Right"
+    both = left | right
+    metrics = {
+        "left time": (times * left, left),
+        "right time": (times * right, right),
+        "time": (times * both, both),
+        "left accuracy": (correct & left, left),
+        "right accuracy": (correct & right, right),
+        "accuracy": (correct & both, both),
+        "accurate time": (times * (correct & both), correct & both),
+        # like first_saccade_time_and_accuracy, trials without a first saccade count as inaccurate
+        "inaccurate time": (times * (~correct & both), ~correct & both),
+    }
+    metrics = {name: (np.asarray(num, dtype=np.float64), np.asarray(den, dtype=np.float64))
+               for name, (num, den) in metrics.items()}
+    return np.array(participants), metrics, {"side": sides, "latency": latencies, "correct": correct}
+
+
+def _map_batches(function, shared, num_resamples, seed, workers, batch_size):
+    """ runs function(shared, seed_sequence, size) over batches of the resamples, with one child seed per batch,
+        so the result only depends on seed and batch_size and not on the number of workers
+    """
+    sizes = [min(batch_size, num_resamples - start) for start in range(0, num_resamples, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(shared, seed_sequence, size) for seed_sequence, size in zip(seeds, sizes)]
+    if workers == 1 or len(tasks) <= 1:
+        return [function(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map yields the results in task order
+        return list(executor.map(function, tasks))
+
+
+def _bootstrap_batch(task):
+    """ draws a batch of participant resamples as multinomial counts and recomputes every ratio for each """
+    (numerators, denominators), seed_sequence, size = task
+    rng = np.random.default_rng(seed_sequence)
+    num_clusters = len(numerators)
+    counts = rng.multinomial(num_clusters, np.full(num_clusters, 1 / num_clusters), size=size).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (counts @ numerators) / (counts @ denominators)
+
+
+def cluster_bootstrap(participants, metrics, num_resamples=10000, confidence=0.95, seed=0, workers=1,
+                      batch_size=BATCH_SIZE):
+    """ percentile confidence intervals of ratio metrics by a cluster bootstrap over participants: every resample
+        draws the participants with replacement and keeps all trials of each drawn participant, so the intervals
+        account for trials of the same participant not being independent
+        inputs
+        ------
+        participants: array of the participant of every trial
+        metrics: {name: (numerator, denominator)} per-trial arrays, e.g. from sample_accuracy_metrics
+        num_resamples: number of bootstrap resamples
+        confidence: coverage of the intervals
+        seed: seed of the random generator, the same seed and batch size give the same intervals for any number
+              of workers
+        workers: number of processes the batches of resamples are spread over, 1 runs in this process
+        batch_size: number of resamples drawn by one task
+        outputs
+        -------
+        intervals: {name: (estimate, low, high)}
+    """
+    names = list(metrics)
+    _, clusters = np.unique(participants, return_inverse=True)
+    num_clusters = int(clusters.max()) + 1 if len(clusters) else 0
+    # every ratio only depends on the per-participant sums
+    numerators = np.column_stack([np.bincount(clusters, metrics[name][0], num_clusters) for name in names])
+    denominators = np.column_stack([np.bincount(clusters, metrics[name][1], num_clusters) for name in names])
+
+    batches = _map_batches(_bootstrap_batch, (numerators, denominators), num_resamples, seed, workers, batch_size)
+    resamples = np.concatenate(batches)
+    alpha = (1 - confidence) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        estimates = numerators.sum(axis=0) / denominators.sum(axis=0)
+    lows, highs = np.nanquantile(resamples, [alpha, 1 - alpha], axis=0)
+    return {name: (float(estimates[i]), float(lows[i]), float(highs[i])) for i, name in enumerate(names)}
+
+
+def _permutation_batch(task):
+    """ exchanges the group labels within every stratum for a batch of permutations and returns the sums of the
+        values of the first group
+    """
+    (values, labels, bounds, binary), seed_sequence, size = task
+    rng = np.random.default_rng(seed_sequence)
+    starts, ends = bounds[:-1], bounds[1:]
+    num_first = np.add.reduceat(labels, starts) if len(labels) else np.zeros(0)
+    if binary:
+        # for 0/1 values the number of ones drawn into the first group is hypergeometric, so the
+        # permutations do not need to be drawn one by one
+        num_ones = np.add.reduceat(values, starts).astype(np.int64)
+        sizes = (ends - starts).astype(np.int64)
+        draws = rng.hypergeometric(num_ones, sizes - num_ones, num_first.astype(np.int64), size=(size, len(starts)))
+        return draws.sum(axis=1).astype(np.float64)
+
+    first_sums = np.zeros(size)
+    for start, end, count in zip(starts.tolist(), ends.tolist(), num_first.tolist()):
+        if count == 0:
+            continue
+        if count == end - start:
+            first_sums += values[start:end].sum()
+            continue
+        block = np.tile(labels[start:end], (size, 1))
+        rng.permuted(block, axis=1, out=block)
+        first_sums += block @ values[start:end]
+    return first_sums
+
+
+def permutation_test(values, labels, strata=None, num_permutations=10000, seed=0, workers=1, batch_size=BATCH_SIZE):
+    """ two-sided permutation test of the difference of the means of two groups of trials
+        inputs
+        ------
+        values: array of the per-trial values, e.g. 1.0 for a correct saccade and 0.0 otherwise.
+                0/1 values are permuted through their hypergeometric distribution, which is much faster
+        labels: bool array, True for the trials of the first group
+        strata: array of the stratum (e.g. participant) of every trial, labels are only exchanged within a
+                stratum. None exchanges them across all trials
+        num_permutations: number of random permutations
+        seed: seed of the random generator, the same seed and batch size give the same p-value for any number
+              of workers
+        workers: number of processes the batches of permutations are spread over, 1 runs in this process
+        batch_size: maximum number of permutations done by one task
+        outputs
+        -------
+        difference: mean of the first group minus mean of the second group
+        p_value: proportion of permutations with a difference at least as extreme, counting the observed one
+    """
+    values = np.asarray(values, dtype=np.float64)
+    labels = np.asarray(labels, dtype=bool)
+    if labels.all() or not labels.any():
+        raise ValueError("both groups need at least one trial")
+    if strata is None:
+        codes = np.zeros(len(values), dtype=np.int64)
+    else:
+        _, codes = np.unique(np.asarray(strata), return_inverse=True)
+    order = np.argsort(codes, kind="stable")
+    values, labels, codes = values[order], labels[order].astype(np.float64), codes[order]
+    bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True])
+    binary = bool(np.all((values == 0) | (values == 1)))
+
+    num_first = labels.sum()
+    num_second = len(values) - num_first
+    difference = values[labels == 1].mean() - values[labels == 0].mean()
+    if not binary:
+        batch_size = max(1, min(batch_size, _MAX_BATCH_ENTRIES // len(values)))
+    batches = _map_batches(_permutation_batch, (values, labels, bounds, binary), num_permutations, seed, workers,
+                           batch_size)
+    first_sums = np.concatenate(batches)
+    differences = first_sums / num_first - (values.sum() - first_sums) / num_second
+    # a small tolerance keeps permutations equal to the observed difference from being lost to rounding
+    extreme = np.count_nonzero(np.abs(differences) >= abs(difference) - 1e-12)
+    return float(difference), (extreme + 1) / (num_permutations + 1)
+
+
+def print_intervals(title, intervals, confidence=0.95):
+    """ prints the estimates and confidence intervals of cluster_bootstrap """
+    print(title)
+    for name, (estimate, low, high) in intervals.items():
+        print("%s: %s (%d%% CI %s - %s)" % (name, estimate, round(confidence * 100), low, high))
+    print("----------------------------------------")
+
+
+def saccade_accuracy_significance(samples_dict, num_resamples=10000, confidence=0.95, seed=0, workers=1):
+    """ prints the accuracies of saccade_accuracy with cluster bootstrap confidence intervals, and permutation
+        tests of condition A vs B and left vs right, with labels exchanged within participants
+        inputs
+        ------
+        samples_dict: dictionary returned by read_samples
+        num_resamples: number of bootstrap resamples and of permutations
+        confidence: coverage of the intervals
+        seed: seed of the random generator
+        workers: number of processes
+    """
+    for field, name in ((0, "first"), (-1, "last")):
+        participants, metrics, labels = sample_accuracy_metrics(samples_dict, field)
+        intervals = cluster_bootstrap(participants, metrics, num_resamples, confidence, seed, workers)
+        print_intervals(name + " saccade to interest area accuracies", intervals, confidence)
+
+        correct = labels["correct"].astype(np.float64)
+        conditions = np.isin(labels["condition"], ("A", "B"))
+        difference, p_value = permutation_test(correct[conditions], labels["condition"][conditions] == "A",
+                                               participants[conditions], num_resamples, seed, workers)
+        print("condition A - B: " + str(difference) + ", p = " + str(p_value))
+        sides = labels["side"] != ""
+        difference, p_value = permutation_test(correct[sides], labels["side"][sides] == "Left",
+                                               participants[sides], num_resamples, seed, workers)
+        print("left - right: " + str(difference) + ", p = " + str(p_value))
+        print("----------------------------------------")
+        print("")
+
+
+def first_saccade_significance(fixation_dict, num_resamples=10000, confidence=0.95, seed=0, workers=1):
+    """ prints the averages of first_saccade_time_and_accuracy with cluster bootstrap confidence intervals, and
+        permutation tests of left vs right first saccade accuracy and time, with labels exchanged within participants
+        inputs
+        ------
+        fixation_dict: dictionary returned by read_fixations
+        num_resamples: number of bootstrap resamples and of permutations
+        confidence: coverage of the intervals
+        seed: seed of the random generator
+        workers: number of processes
+    """
+    participants, metrics, labels = first_saccade_metrics(fixation_dict)
+    intervals = cluster_bootstrap(participants, metrics, num_resamples, confidence, seed, workers)
+    print_intervals("first saccades", intervals, confidence)
+
+    sides = labels["side"] != ""
+    difference, p_value = permutation_test(labels["correct"][sides], labels["side"][sides] == "Left",
+                                           participants[sides], num_resamples, seed, workers)
+    print("accuracy left - right: " + str(difference) + ", p = " + str(p_value))
+    with_saccade = sides & ~np.isnan(labels["latency"])
+    difference, p_value = permutation_test(labels["latency"][with_saccade], labels["side"][with_saccade] == "Left",
+                                           participants[with_saccade], num_resamples, seed, workers)
+    print("time left - right: " + str(difference) + ", p = " + str(p_value))
+    print("----------------------------------------")
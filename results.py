@@ -0,0 +1,331 @@
+import csv
+import json
+import math
+import os
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+# number of rows a RowWriter buffers before writing them to a Parquet file
+BATCH_ROWS = 65536
+RESULT_FORMATS = ("json", "csv", "parquet")
+ROW_FORMATS = ("csv", "json", "jsonl", "parquet")
+
+
+class AccuracyResult(NamedTuple):
+    """ accuracy of the first or last saccade to an interest area, returned by saccade_accuracy_helper """
+    left: float
+    right: float
+    total: float
+    condition_a: float
+    condition_b: float
+
+
+class SaccadeAccuracyResult(NamedTuple):
+    """ result of saccade_accuracy """
+    first: AccuracyResult
+    last: AccuracyResult
+
+
+class SaccadeCountResult(NamedTuple):
+    """ result of num_interest_saccades_stats """
+    average_per_trial: float
+    max_saccades: int
+    difficult_images: List[str]
+
+
+class FirstSaccadeResult(NamedTuple):
+    """ result of first_saccade_time_and_accuracy """
+    left_avg_time: float
+    left_accuracy: float
+    left_saccades: int
+    right_avg_time: float
+    right_accuracy: float
+    right_saccades: int
+    avg_time: float
+    accuracy: float
+    avg_accurate_time: float
+    avg_inaccurate_time: float
+
+
+class TimeStats(NamedTuple):
+    """ statistics of a set of times """
+    mean: float
+    maximum: float
+    minimum: float
+    median: float
+
+
+class SearchTimeResult(NamedTuple):
+    """ result of avg_search_time """
+    left: TimeStats
+    right: TimeStats
+    overall: TimeStats
+
+
+class ResponseTimeResult(NamedTuple):
+    """ result of avg_response_time """
+    left: float
+    right: float
+    overall: float
+
+
+class StimulusStats(NamedTuple):
+    """ difficulty of a stimulus over the trials it was shown in, a row of stimulus_index.StimulusIndex.
+        the means of a file without trials of the stimulus are nan
+    """
+    file_name: str
+    trials: int
+    accuracy: float
+    mean_switches: float
+    median_switches: float
+    mean_search_time: float
+    mean_resp_time: float
+
+
+class DwellCurves(NamedTuple):
+    """ result of aoi_dynamics.dwell_curves. dwell and proportion have the shape (group, interest area, window) """
+    groups: List[Tuple[str, str]]
+    labels: List[str]
+    window_starts: np.ndarray
+    window: float
+    trials: np.ndarray
+    dwell: np.ndarray
+    proportion: np.ndarray
+
+
+class AoiTransitions(NamedTuple):
+    """ result of aoi_dynamics.aoi_transitions. counts and probabilities have the shape (group, from, to) """
+    groups: List[Tuple[str, str]]
+    labels: List[str]
+    counts: np.ndarray
+    probabilities: np.ndarray
+
+
+class TrialMetrics(NamedTuple):
+    """ per trial metrics of a session, a row of the table written by session_engine.write_trial_metrics.
+        the metrics of a file the trial is not in are None
+    """
+    participant: str
+    trial: str
+    side: Optional[str]
+    condition: Optional[str]
+    file_name: Optional[str]
+    num_saccades: Optional[int]
+    first_saccade_area: Optional[str]
+    last_saccade_area: Optional[str]
+    first_saccade_time: Optional[float]
+    first_saccade_accurate: Optional[bool]
+    search_time: Optional[float]
+    search_accurate: Optional[bool]
+    resp_time: Optional[float]
+
+
+def column_types(row_type):
+    """ returns the {column: type} of a NamedTuple row type for RowWriter, e.g. {"num_saccades": int} for
+        TrialMetrics, with Optional[int] taken as int
+    """
+    types = {}
+    for name, annotation in row_type.__annotations__.items():
+        args = [arg for arg in getattr(annotation, "__args__", ()) if arg is not type(None)]
+        types[name] = args[0] if getattr(annotation, "__origin__", None) is Union and len(args) == 1 else annotation
+    return {name: kind for name, kind in types.items() if kind in (int, float, bool, str)}
+
+
+def result_to_dict(result):
+    """ converts a result, or a dictionary or list of results, to plain dictionaries and lists for json """
+    if hasattr(result, "_asdict"):
+        return {name: result_to_dict(value) for name, value in result._asdict().items()}
+    if isinstance(result, (np.ndarray, np.generic)):
+        return result_to_dict(result.tolist())
+    if isinstance(result, dict):
+        return {name: result_to_dict(value) for name, value in result.items()}
+    if isinstance(result, (list, tuple)):
+        return [result_to_dict(value) for value in result]
+    if isinstance(result, float) and not math.isfinite(result):
+        # json has no nan or infinity
+        return None
+    return result
+
+
+def flatten_result(result, prefix=""):
+    """ flattens a result into (metric, value) pairs, e.g. ("first.left", 0.8). the items of lists are
+        numbered, e.g. ("difficult_images.0", "face001_left.jpg")
+    """
+    if hasattr(result, "_asdict"):
+        items = result._asdict().items()
+    elif isinstance(result, dict):
+        items = result.items()
+    elif isinstance(result, (list, tuple)):
+        items = enumerate(result)
+    elif isinstance(result, np.ndarray):
+        items = enumerate(result.tolist())
+    else:
+        return [(prefix, result)]
+    pairs = []
+    for name, value in items:
+        pairs += flatten_result(value, "%s.%s" % (prefix, name) if prefix else str(name))
+    return pairs
+
+
+def _format(path, format, formats):
+    """ returns the output format, taken from the extension of the path if not given """
+    if format is None:
+        format = os.path.splitext(path)[1].lstrip(".").lower()
+    if format not in formats:
+        raise ValueError("format must be one of " + ", ".join(formats))
+    return format
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("writing Parquet files needs pyarrow, install it with pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+
+def _result_rows(results):
+    """ yields the (analysis, metric, value, label) rows of the long table of write_results, numbers go
+        in value and text in label
+    """
+    for analysis, result in results.items():
+        for metric, value in flatten_result(result):
+            if isinstance(value, str):
+                yield analysis, metric, None, value
+            else:
+                yield analysis, metric, None if value is None else float(value), None
+
+
+def write_results(results, path, format=None):
+    """ writes the results of a set of analyses to a file. json keeps the nesting of the results, csv and
+        parquet write a long table with a row per metric
+    inputs
+    ------
+    results: {analysis name: result}, e.g. {"response_time": avg_response_time(res)}
+    path: string path to the output file
+    format: "json", "csv" or "parquet", taken from the extension of path by default
+    """
+    format = _format(path, format, RESULT_FORMATS)
+    if format == "json":
+        tmp_path = path + ".tmp%d" % os.getpid()
+        with open(tmp_path, 'w') as file:
+            json.dump(result_to_dict(results), file, indent=2)
+            file.write("\n")
+        os.replace(tmp_path, path)
+    else:
+        with RowWriter(path, ("analysis", "metric", "value", "label"), format, {"value": float}) as writer:
+            writer.write_rows(_result_rows(results))
+
+
+class RowWriter:
+    """ writes a table one row at a time, so tables of any number of trials can be written without holding
+        them in memory. the file is written under a temporary name and moved to path when the writer is
+        closed, so readers never see a partial table.
+        inputs
+        ------
+        path: string path to the output file
+        columns: names of the columns, e.g. TrialMetrics._fields
+        format: "csv", "json" (an array of objects), "jsonl" (an object per line) or "parquet", taken from
+                the extension of path by default. parquet needs pyarrow
+        types: {column: int, float, bool or str} for the Parquet schema, e.g. column_types(TrialMetrics).
+               columns without a type are strings
+        batch_rows: number of rows buffered before a Parquet row group is written
+    """
+
+    def __init__(self, path, columns, format=None, types=None, batch_rows=BATCH_ROWS):
+        self.path = path
+        self.columns = tuple(columns)
+        self.types = dict(types or {})
+        self.format = _format(path, format, ROW_FORMATS)
+        self.batch_rows = batch_rows
+        self.num_rows = 0
+        self._tmp_path = path + ".tmp%d" % os.getpid()
+        self._batch = []
+        self._parquet = None
+        if self.format == "parquet":
+            self._pyarrow, parquet = _import_pyarrow()
+            self._arrow_schema = self._schema()
+            self._parquet = parquet.ParquetWriter(self._tmp_path, self._arrow_schema)
+            self._file = None
+        else:
+            self._file = open(self._tmp_path, 'w', newline="")
+            if self.format == "csv":
+                self._csv = csv.writer(self._file)
+                self._csv.writerow(self.columns)
+            elif self.format == "json":
+                self._file.write("[")
+
+    def _schema(self):
+        """ the Parquet schema of the columns, strings for the columns without a type """
+        pyarrow = self._pyarrow
+        arrow_types = {int: pyarrow.int64(), float: pyarrow.float64(), bool: pyarrow.bool_(), str: pyarrow.string()}
+        return pyarrow.schema([(name, arrow_types[self.types.get(name, str)]) for name in self.columns])
+
+    def _values(self, row):
+        if isinstance(row, dict):
+            return [row.get(name) for name in self.columns]
+        if len(row) != len(self.columns):
+            raise ValueError("expected %d values, got %d" % (len(self.columns), len(row)))
+        return list(row)
+
+    def write(self, row):
+        """ writes a row, a tuple (e.g. a TrialMetrics) with a value per column or a dictionary """
+        values = self._values(row)
+        if self.format == "csv":
+            self._csv.writerow(["" if value is None else value for value in values])
+        elif self.format == "parquet":
+            self._batch.append(values)
+            if len(self._batch) >= self.batch_rows:
+                self._flush()
+        else:
+            text = json.dumps(result_to_dict(dict(zip(self.columns, values))))
+            if self.format == "jsonl":
+                self._file.write(text + "\n")
+            else:
+                self._file.write(("\n" if self.num_rows == 0 else ",\n") + text)
+        self.num_rows += 1
+
+    def write_rows(self, rows):
+        """ writes every row of an iterable """
+        for row in rows:
+            self.write(row)
+
+    def _flush(self):
+        if self._batch:
+            columns = list(zip(*self._batch))
+            arrays = [self._pyarrow.array(columns[i], type=self._arrow_schema.field(name).type)
+                      for i, name in enumerate(self.columns)]
+            table = self._pyarrow.Table.from_arrays(arrays, schema=self._arrow_schema)
+            self._parquet.write_table(table)
+            self._batch = []
+
+    def close(self):
+        """ finishes the file and moves it to path """
+        if self.format == "parquet":
+            self._flush()
+            self._parquet.close()
+        else:
+            if self.format == "json":
+                self._file.write("\n]\n")
+            self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """ discards the partially written file """
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._file is not None:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,147 @@
+import numpy as np
+
+# participants left out of every analysis unless a filter says otherwise (nikki)
+EXCLUDED_PARTICIPANTS = ("0422a3",)
+
+
+class RowFilter:
+    """ selects the rows of the samples and fixations files the readers keep. rows are tested before their
+        fields are converted or added to the dictionaries, starting with prefix checks of the participant on
+        the raw line, so reading a small subset of a large file costs little more than scanning it.
+        the default filter keeps every row except those of EXCLUDED_PARTICIPANTS, like the readers always did.
+        inputs
+        ------
+        participants: participants to keep, None keeps all of them
+        exclude_participants: participants to leave out
+        trials: (first, last) range of trial numbers to keep, both included, None keeps all of them
+        conditions: conditions to keep, e.g. ("A",), None keeps all of them
+        sides: sides of the original image to keep, "Left" and/or "Right" in any case, None keeps both
+        time_window: (start, end) range of times to keep, start included and end excluded. the time of a
+                     sample is its timestamp and the time of a fixation is its start in the trial
+    """
+
+    def __init__(self, participants=None, exclude_participants=EXCLUDED_PARTICIPANTS, trials=None, conditions=None,
+                 sides=None, time_window=None):
+        self.participants = None if participants is None else tuple(participants)
+        self.exclude_participants = tuple(exclude_participants)
+        self.trials = None if trials is None else (int(trials[0]), int(trials[1]))
+        self.conditions = None if conditions is None else tuple(condition.strip() for condition in conditions)
+        self.sides = None if sides is None else tuple(side.strip().capitalize() for side in sides)
+        self.time_window = None if time_window is None else (float(time_window[0]), float(time_window[1]))
+
+        # every line starts with "participant,trial,", so participants are tested on the raw line
+        self._include_prefixes = None if self.participants is None else tuple(p + "," for p in self.participants)
+        self._exclude_prefixes = tuple(p + "," for p in self.exclude_participants)
+
+    def fields(self):
+        """ returns the names of the fields other than the participant the filter looks at """
+        return [name for name, value in (("trial", self.trials), ("condition", self.conditions),
+                                         ("side", self.sides), ("time", self.time_window)) if value is not None]
+
+    def check_columns(self, columns):
+        """ raises a ValueError if the filter looks at a field the file does not have
+            inputs
+            ------
+            columns: {field name: column index} of the file, e.g. SAMPLE_COLUMNS
+        """
+        for name in self.fields():
+            if name not in columns:
+                raise ValueError("can not filter on %s, the file has no %s column" % (name, name))
+
+    def may_match_chunk(self, text):
+        """ returns False if no line of a chunk of whole lines can pass the filter, tested by searching the chunk
+            for the participants to keep at the start of a line, so chunks of other participants are skipped whole
+        """
+        if self._include_prefixes is None:
+            return True
+        return any(text.startswith(prefix) or ("\n" + prefix) in text for prefix in self._include_prefixes)
+
+    def keep_line(self, line, columns):
+        """ returns True if a line of a file passes the filter
+            inputs
+            ------
+            line: a line of the file, as read
+            columns: {field name: column index} of the file, e.g. SAMPLE_COLUMNS
+        """
+        if self._exclude_prefixes and line.startswith(self._exclude_prefixes):
+            return False
+        if self._include_prefixes is not None and not line.startswith(self._include_prefixes):
+            return False
+        if self.trials is None and self.conditions is None and self.sides is None and self.time_window is None:
+            return True
+        return self._keep_fields(line.split(","), columns)
+
+    def keep_fields(self, cols, columns):
+        """ keep_line for a line already split into its fields, e.g. by the csv module for quoted fields or
+            for files whose participant is not the first column
+            inputs
+            ------
+            cols: the fields of the line
+            columns: {field name: column index} of the file
+        """
+        participant = cols[columns["participant"]]
+        if participant in self.exclude_participants:
+            return False
+        if self.participants is not None and participant not in self.participants:
+            return False
+        return self._keep_fields(cols, columns)
+
+    def _keep_fields(self, cols, columns):
+        """ tests the fields other than the participant """
+        if self.trials is not None and not self.trials[0] <= int(cols[columns["trial"]]) <= self.trials[1]:
+            return False
+        if self.conditions is not None and cols[columns["condition"]].strip() not in self.conditions:
+            return False
+        if self.sides is not None and cols[columns["side"]].strip().capitalize() not in self.sides:
+            return False
+        if self.time_window is not None:
+            time = float(cols[columns["time"]])
+            if not self.time_window[0] <= time < self.time_window[1]:
+                return False
+        return True
+
+    def keep_rows(self, field, num_rows):
+        """ vectorized keep_line for the chunked readers
+            inputs
+            ------
+            field: function returning a bytes array of a field ("participant", "trial", "condition", "side"
+                   or "time") of every row of the chunk, only called for the fields the filter looks at
+            num_rows: number of rows of the chunk
+            outputs
+            -------
+            keep: boolean array, True for the rows that pass the filter
+        """
+        keep = np.ones(num_rows, dtype=bool)
+        if self.exclude_participants or self.participants is not None:
+            participants = field("participant")
+            if self.exclude_participants:
+                keep &= ~np.isin(participants, [p.encode() for p in self.exclude_participants])
+            if self.participants is not None:
+                keep &= np.isin(participants, [p.encode() for p in self.participants])
+        if self.trials is not None:
+            trials = field("trial").astype(np.int64)
+            keep &= (trials >= self.trials[0]) & (trials <= self.trials[1])
+        if self.conditions is not None:
+            keep &= np.isin(np.char.strip(field("condition")), [c.encode() for c in self.conditions])
+        if self.sides is not None:
+            keep &= np.isin(np.char.capitalize(np.char.strip(field("side"))), [s.encode() for s in self.sides])
+        if self.time_window is not None:
+            times = field("time").astype(np.float64)
+            keep &= (times >= self.time_window[0]) & (times < self.time_window[1])
+        return keep
+
+    def __eq__(self, other):
+        return isinstance(other, RowFilter) and self.__dict__ == other.__dict__
+
+    def __hash__(self):
+        return hash((self.participants, self.exclude_participants, self.trials, self.conditions, self.sides,
+                     self.time_window))
+
+    def __repr__(self):
+        return "RowFilter(%s)" % ", ".join("%s=%r" % (name, value) for name, value in (
+            ("participants", self.participants), ("exclude_participants", self.exclude_participants),
+            ("trials", self.trials), ("conditions", self.conditions), ("sides", self.sides),
+            ("time_window", self.time_window)) if value is not None)
+
+
+DEFAULT_FILTER = RowFilter()
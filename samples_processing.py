@@ -1,8 +1,34 @@
-def read_samples(samples_path):
+import sys
+
+import numpy as np
+
+import instrumentation
+from results import AccuracyResult, SaccadeAccuracyResult, SaccadeCountResult
+from row_filter import DEFAULT_FILTER
+from schema import resolve_columns
+
+# number of characters of the samples file parsed together by the chunked reader
+CHUNK_SIZE = 4 * 1024 * 1024
+# columns of the samples file a RowFilter can look at
+SAMPLE_COLUMNS = {"participant": 0, "trial": 1, "time": 2, "condition": -3, "side": -1}
+# interest area ("1" for "[ 1]") of the original image in the order_of_saccades of the samples file for each side
+TARGETS = {"Left": "1", "Right": "2"}
+# names of the columns of the gaze positions parse_gaze_chunk reads, in order of preference, e.g. the average of
+# both eyes of a binocular recording before the right eye
+GAZE_ALIASES = {
+    "time": ("TIMESTAMP",),
+    "x": ("AVERAGE_GAZE_X", "RIGHT_GAZE_X", "LEFT_GAZE_X"),
+    "y": ("AVERAGE_GAZE_Y", "RIGHT_GAZE_Y", "LEFT_GAZE_Y"),
+}
+
+
+@instrumentation.timed("read_samples")
+def read_samples(samples_path, row_filter=DEFAULT_FILTER):
     """ takes in the samples file and organizes it into a dictionary
     inputs
     ------
     samples_path: string path to the samples file
+    row_filter: RowFilter selecting the rows to keep, by default every participant but nikki
     outputs
     -------
     res_dict: dictionary containing relevant information from the samples
@@ -24,12 +50,25 @@ def read_samples(samples_path):
                 }
     """
     res_dict = {}
+    # the participants are tested inline, so keep_line only runs for filters on the other fields
+    exclude_participants = row_filter.exclude_participants
+    include_prefixes = None if row_filter.participants is None else tuple(p + "," for p in row_filter.participants)
+    filter_fields = bool(row_filter.fields())
+    instrumentation.count_file("samples_bytes", samples_path)
     with open(samples_path, 'r') as file:
         next(file)
-        for line in file:
+        for line in instrumentation.counted(file, "samples_rows"):
+            # skip the rows of other participants before splitting them
+            if include_prefixes is not None and not line.startswith(include_prefixes):
+                continue
+            if filter_fields and not row_filter.keep_line(line, SAMPLE_COLUMNS):
+                continue
+
             # split line into each field
             cols = line.split(",")
             participant = cols[0]
+            if participant in exclude_participants:
+                continue
             trial = cols[1]
             orig_side = cols[-1]
             interest_area = cols[5]
@@ -37,40 +76,496 @@ def read_samples(samples_path):
             file_name = cols[-2]
             condition = cols[-3]
 
-            # filter out nikki
-            if participant != "0422a3":
-
-                # label dict entries by participant
-                if participant not in res_dict:
-                    res_dict[participant] = {}
-                
-                # add a subdict for each trial
-                if trial not in res_dict[participant]:
-                    res_dict[participant][trial] = {}
+            # label dict entries by participant
+            if participant not in res_dict:
+                res_dict[sys.intern(participant)] = {}
+            
+            # add a subdict for each trial
+            if trial not in res_dict[participant]:
+                res_dict[participant][sys.intern(trial)] = {}
 
-                # add the side the original image is on to the trial subdict
-                if "orig_side" not in res_dict[participant][trial]:
-                    res_dict[participant][trial]["orig_side"] = orig_side
+            # add the side the original image is on to the trial subdict
+            if "orig_side" not in res_dict[participant][trial]:
+                res_dict[participant][trial]["orig_side"] = sys.intern(orig_side)
             
-                if interest_area != "[]":
-                    # creates a list of the areas of interest saccaded to 
-                    if "order_of_saccades" not in res_dict[participant][trial]:
-                        res_dict[participant][trial]["order_of_saccades"] = [interest_area[2]]
-                        res_dict[participant][trial]["first_saccade_time"] = time
-                    else:
-                        if interest_area[2] != res_dict[participant][trial]["order_of_saccades"][-1]:
-                            res_dict[participant][trial]["order_of_saccades"] += [interest_area[2]]
-
-                # add filename
-                if "file_name" not in res_dict[participant][trial]:
-                    res_dict[participant][trial]["file_name"] =  file_name
-
-                # add condition
-                if "condition" not in res_dict[participant][trial]:
-                    res_dict[participant][trial]["condition"] =  condition
+            if interest_area != "[]":
+                # creates a list of the areas of interest saccaded to 
+                if "order_of_saccades" not in res_dict[participant][trial]:
+                    res_dict[participant][trial]["order_of_saccades"] = [interest_area[2]]
+                    res_dict[participant][trial]["first_saccade_time"] = time
+                else:
+                    if interest_area[2] != res_dict[participant][trial]["order_of_saccades"][-1]:
+                        res_dict[participant][trial]["order_of_saccades"] += [interest_area[2]]
+
+            # add filename
+            if "file_name" not in res_dict[participant][trial]:
+                res_dict[participant][trial]["file_name"] =  sys.intern(file_name)
+
+            # add condition
+            if "condition" not in res_dict[participant][trial]:
+                res_dict[participant][trial]["condition"] =  sys.intern(condition)
+
+    instrumentation.count_trials("samples_trials", res_dict)
+    return res_dict
+
+
+def _byte_matrix(buf, starts, lengths, width):
+    """ gathers variable length byte fields into a zero padded matrix so they can be compared row-wise
+    inputs
+    ------
+    buf: uint8 array holding the chunk
+    starts: array of the offsets the fields start at
+    lengths: array of the lengths of the fields
+    width: number of columns of the matrix
+    outputs
+    -------
+    matrix: uint8 array of shape (len(starts), width)
+    """
+    columns = np.arange(width)
+    matrix = buf[np.minimum(starts[:, None] + columns, len(buf) - 1)]
+    matrix[columns >= lengths[:, None]] = 0
+    return matrix
+
+
+def _field_values(buf, starts, ends):
+    """ returns the bytes of fields of a chunk as a numpy bytes array """
+    lengths = ends - starts
+    width = max(int(lengths.max()), 1)
+    return _byte_matrix(buf, starts, lengths, width).view("S%d" % width).ravel()
+
+
+def _line_bounds(buf):
+    """ returns the start and end offsets of the non blank lines of a chunk, the last line may not end with a newline """
+    line_ends = np.flatnonzero(buf == ord("\n"))
+    if len(line_ends) == 0 or line_ends[-1] != len(buf) - 1:
+        line_ends = np.append(line_ends, len(buf))
+    line_starts = np.empty_like(line_ends)
+    line_starts[0] = 0
+    line_starts[1:] = line_ends[:-1] + 1
+    non_blank = line_ends > line_starts
+    return line_starts[non_blank], line_ends[non_blank]
+
+
+def _filter_fields(buf, line_starts, line_ends, commas, first_comma):
+    """ returns the field function RowFilter.keep_rows is given for the lines of a chunk of the samples file
+    inputs
+    ------
+    buf: uint8 array holding the chunk
+    line_starts, line_ends: offsets of the lines in buf
+    commas: offsets of the commas in buf
+    first_comma: index in commas of the first comma of each line
+    """
+    last_comma = np.searchsorted(commas, line_ends) - 1
+    fields = {
+        "participant": lambda: _field_values(buf, line_starts, commas[first_comma]),
+        "trial": lambda: _field_values(buf, commas[first_comma] + 1, commas[first_comma + 1]),
+        "time": lambda: _field_values(buf, commas[first_comma + 1] + 1, commas[first_comma + 2]),
+        "condition": lambda: _field_values(buf, commas[last_comma - 2] + 1, commas[last_comma - 1]),
+        "side": lambda: _field_values(buf, commas[last_comma] + 1, line_ends),
+    }
+    return lambda name: fields[name]()
+
+
+@instrumentation.timed("parse_sample_chunk")
+def parse_sample_chunk(text, row_filter=DEFAULT_FILTER):
+    """ parses a chunk of the samples file into column arrays and reduces it to contiguous trial segments
+    inputs
+    ------
+    text: string holding whole lines of the samples file (without the header)
+    row_filter: RowFilter selecting the rows to keep, applied to the raw bytes before any field is decoded
+    outputs
+    -------
+    segments: list of (participant, trial, orig_side, file_name, condition, saccades,
+              first_saccade_time, leading_saccade) tuples, one per run of rows with the same trial.
+              saccades is the run-length encoded list of interest areas of the segment and
+              leading_saccade is True if the first row of the segment is on an interest area
+    """
+    if not row_filter.may_match_chunk(text):
+        if instrumentation.enabled():
+            instrumentation.count("samples_rows", text.count("\n"))
+        return []
+    data = text.encode("utf-8", "surrogateescape")
+    buf = np.frombuffer(data, dtype=np.uint8)
+    line_starts, line_ends = _line_bounds(buf)
+    instrumentation.count("samples_rows", len(line_starts))
+    if len(line_starts) == 0:
+        return []
+
+    # locate the delimiters of the first six fields of each line
+    commas = np.flatnonzero(buf == ord(","))
+    first_comma = np.searchsorted(commas, line_starts)
+    last_needed = first_comma + 5
+    if last_needed[-1] >= len(commas) or np.any(commas[last_needed] >= line_ends):
+        raise ValueError("malformed line in samples file")
+    key_ends = commas[first_comma + 1]
+    area_starts = commas[first_comma + 4] + 1
+    area_lengths = commas[last_needed] - area_starts
+
+    # the key of a row is "participant,trial"
+    key_lengths = key_ends - line_starts
+    keys = _byte_matrix(buf, line_starts, key_lengths, int(key_lengths.max()))
+
+    # drop the rows the filter rejects
+    keep = row_filter.keep_rows(_filter_fields(buf, line_starts, line_ends, commas, first_comma), len(line_starts))
+    if not keep.all():
+        line_starts, line_ends, keys = line_starts[keep], line_ends[keep], keys[keep]
+        area_starts, area_lengths = area_starts[keep], area_lengths[keep]
+        if len(line_starts) == 0:
+            return []
+
+    # a segment starts whenever the participant or trial changes
+    new_segment = np.empty(len(line_starts), dtype=bool)
+    new_segment[0] = True
+    new_segment[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+    segment_starts = np.flatnonzero(new_segment)
+    segment_ids = np.cumsum(new_segment) - 1
+
+    # interest areas other than "[]" are identified by their third character, e.g. "1" for "[ 1]"
+    areas = _byte_matrix(buf, area_starts, area_lengths, 3)
+    empty_area = (area_lengths == 2) & (areas[:, 0] == ord("[")) & (areas[:, 1] == ord("]"))
+    codes = areas[:, 2]
+
+    # a saccade is recorded whenever the interest area differs from the previous one in the segment
+    valid_rows = np.flatnonzero(~empty_area)
+    valid_codes = codes[valid_rows]
+    valid_segments = segment_ids[valid_rows]
+    new_run = np.empty(len(valid_rows), dtype=bool)
+    new_run[:1] = True
+    new_run[1:] = (valid_codes[1:] != valid_codes[:-1]) | (valid_segments[1:] != valid_segments[:-1])
+    run_rows = valid_rows[new_run]
+    run_codes = [chr(code) if code else "" for code in valid_codes[new_run].tolist()]
+    run_bounds = np.searchsorted(valid_segments[new_run], np.arange(len(segment_starts) + 1)).tolist()
+
+    def decode_line(row):
+        line = data[line_starts[row]:line_ends[row]].decode("utf-8", "surrogateescape")
+        # text mode keeps the newline on the last field
+        if line_ends[row] < len(buf):
+            line += "\n"
+        return line.split(",")
 
+    segments = []
+    for segment, start in enumerate(segment_starts.tolist()):
+        cols = decode_line(start)
+        run_start = run_bounds[segment]
+        run_end = run_bounds[segment + 1]
+        if run_start < run_end:
+            first_row = int(run_rows[run_start])
+            first_saccade_time = decode_line(first_row)[2]
+            leading_saccade = first_row == start
+        else:
+            first_saccade_time = None
+            leading_saccade = False
+        segments.append((cols[0], cols[1], cols[-1], cols[-2], cols[-3],
+                         run_codes[run_start:run_end], first_saccade_time, leading_saccade))
+    return segments
+
+
+def gaze_columns(header):
+    """ returns the {"time", "x", "y": column index} of the samples file with the given header line, raises a
+        ValueError if the header has no column for one of them (see GAZE_ALIASES)
+    """
+    return resolve_columns(header, GAZE_ALIASES)[0]
+
+
+@instrumentation.timed("parse_gaze_chunk")
+def parse_gaze_chunk(text, columns, row_filter=DEFAULT_FILTER):
+    """ parses the gaze positions of a chunk of the samples file into column arrays
+    inputs
+    ------
+    text: string holding whole lines of the samples file (without the header)
+    columns: {"time", "x", "y": column index} of the file, returned by gaze_columns
+    row_filter: RowFilter selecting the rows to keep, applied to the raw bytes before any field is decoded
+    outputs
+    -------
+    gaze: {"participant": bytes array, "trial": bytes array, "time": float array, "x": float array,
+           "y": float array} with a row per kept line, missing gaze positions (".") are nan
+    """
+    names = ("participant", "trial", "time", "x", "y")
+    empty = {name: np.empty(0, dtype="S1" if name in ("participant", "trial") else np.float64) for name in names}
+    if not row_filter.may_match_chunk(text):
+        if instrumentation.enabled():
+            instrumentation.count("samples_rows", text.count("\n"))
+        return empty
+    data = text.encode("utf-8", "surrogateescape")
+    buf = np.frombuffer(data, dtype=np.uint8)
+    line_starts, line_ends = _line_bounds(buf)
+    instrumentation.count("samples_rows", len(line_starts))
+    if len(line_starts) == 0:
+        return empty
+
+    # locate the delimiters of the fields of each line up to the last one needed
+    commas = np.flatnonzero(buf == ord(","))
+    first_comma = np.searchsorted(commas, line_starts)
+    last_needed = first_comma + max(columns.values()) - 1
+    if last_needed[-1] >= len(commas) or np.any(commas[last_needed] >= line_ends):
+        raise ValueError("malformed line in samples file")
+
+    keep = row_filter.keep_rows(_filter_fields(buf, line_starts, line_ends, commas, first_comma), len(line_starts))
+    if not keep.all():
+        line_starts, line_ends, first_comma = line_starts[keep], line_ends[keep], first_comma[keep]
+        if len(line_starts) == 0:
+            return empty
+
+    gaze = {"participant": _field_values(buf, line_starts, commas[first_comma]),
+            "trial": _field_values(buf, commas[first_comma] + 1, commas[first_comma + 1])}
+    for name in ("time", "x", "y"):
+        column = first_comma + columns[name]
+        # the field ends at the next comma, or at the end of the line for the last column
+        next_comma = np.minimum(column, len(commas) - 1)
+        last = (column >= len(commas)) | (commas[next_comma] >= line_ends)
+        values = _field_values(buf, commas[column - 1] + 1, np.where(last, line_ends, commas[next_comma]))
+        if last.any():
+            values = np.char.rstrip(values)
+        # missing gaze positions are written as "."
+        gaze[name] = np.where(values == b".", b"nan", values).astype(np.float64)
+    return gaze
+
+
+def add_sample_segment(res_dict, segment):
+    """ merges a trial segment produced by parse_sample_chunk into a read_samples style dictionary
+    inputs
+    ------
+    res_dict: dictionary in the format returned by read_samples, updated in place
+    segment: tuple produced by parse_sample_chunk
+    """
+    participant, trial, orig_side, file_name, condition, saccades, first_saccade_time, leading_saccade = segment
+
+    # label dict entries by participant
+    if participant not in res_dict:
+        res_dict[sys.intern(participant)] = {}
+
+    if trial not in res_dict[participant]:
+        # keep the key order read_samples produces for a new trial
+        trial_dict = {"orig_side": sys.intern(orig_side)}
+        if leading_saccade:
+            trial_dict["order_of_saccades"] = saccades
+            trial_dict["first_saccade_time"] = first_saccade_time
+            saccades = []
+        trial_dict["file_name"] = sys.intern(file_name)
+        trial_dict["condition"] = sys.intern(condition)
+        res_dict[participant][sys.intern(trial)] = trial_dict
+    else:
+        trial_dict = res_dict[participant][trial]
+
+    if saccades:
+        if "order_of_saccades" not in trial_dict:
+            trial_dict["order_of_saccades"] = saccades
+            trial_dict["first_saccade_time"] = first_saccade_time
+        else:
+            # the segment continues the trial, so a repeat of the last interest area is not a new saccade
+            order_of_saccades = trial_dict["order_of_saccades"]
+            if saccades[0] == order_of_saccades[-1]:
+                saccades = saccades[1:]
+            order_of_saccades += saccades
+
+
+@instrumentation.timed("read_samples_chunked")
+def read_samples_chunked(samples_path, chunk_size=CHUNK_SIZE, row_filter=DEFAULT_FILTER):
+    """ vectorized version of read_samples. parses the samples file in chunks of about chunk_size
+        characters into column arrays, so memory use is bounded by the chunk size and the size of the result
+    inputs
+    ------
+    samples_path: string path to the samples file
+    chunk_size: number of characters parsed at once
+    row_filter: RowFilter selecting the rows to keep, by default every participant but nikki
+    outputs
+    -------
+    res_dict: dictionary identical to the one returned by read_samples
+    """
+    res_dict = {}
+    instrumentation.count_file("samples_bytes", samples_path)
+    with open(samples_path, 'r') as file:
+        next(file)
+        while True:
+            # read whole lines only
+            text = file.read(chunk_size)
+            if not text:
+                break
+            text += file.readline()
+            for segment in parse_sample_chunk(text, row_filter):
+                add_sample_segment(res_dict, segment)
+
+    instrumentation.count_trials("samples_trials", res_dict)
     return res_dict
 
+def iter_sample_trials(samples_path, chunk_size=CHUNK_SIZE, row_filter=DEFAULT_FILTER):
+    """ streams the samples file one trial at a time. a trial is finished as soon as the participant
+        or trial changes in the file, so only the current trial is held in memory.
+        assumes the rows of a trial are contiguous in the file, like in the exports.
+    inputs
+    ------
+    samples_path: string path to the samples file
+    chunk_size: number of characters parsed at once
+    row_filter: RowFilter selecting the rows to keep, by default every participant but nikki
+    outputs
+    -------
+    yields (participant, trial, trial_dict) where trial_dict is the trial subdict read_samples would create
+    """
+    current = None
+    current_key = None
+    instrumentation.count_file("samples_bytes", samples_path)
+    with open(samples_path, 'r') as file:
+        next(file)
+        while True:
+            # read whole lines only
+            text = file.read(chunk_size)
+            if not text:
+                break
+            text += file.readline()
+            for segment in parse_sample_chunk(text, row_filter):
+                key = (segment[0], segment[1])
+                if key != current_key:
+                    if current is not None:
+                        instrumentation.count("samples_trials")
+                        yield current_key[0], current_key[1], current[current_key[0]][current_key[1]]
+                    current = {}
+                    current_key = key
+                add_sample_segment(current, segment)
+
+    if current is not None:
+        instrumentation.count("samples_trials")
+        yield current_key[0], current_key[1], current[current_key[0]][current_key[1]]
+
+
+class SaccadeAccuracyAccumulator:
+    """ incrementally computes the statistics of saccade_accuracy_helper one trial at a time
+        inputs
+        ------
+        field: either 0 or -1, looks at the first saccade (0) or the last saccade (-1)
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+        self.left_true_num = 0
+        self.left_total_num = 0
+
+        self.right_true_num = 0
+        self.right_total_num = 0
+
+        self.a_true_num = 0
+        self.a_total_num = 0
+
+        self.b_true_num = 0
+        self.b_total_num = 0
+
+    def add_trial(self, participant, trial, trial_dict):
+        """ adds a trial subdict of the dictionary returned by read_samples to the counts """
+        # computes the total numbers of entries for each condition
+        condition = trial_dict["condition"]
+        if condition == "A":
+            self.a_total_num += 1
+        elif condition == "B":
+            self.b_total_num += 1
+
+        if trial_dict["orig_side"] == "Left\n":
+            self.left_total_num += 1
+            # adds to the true count it the participant saccaded to the correct side
+            if trial_dict["order_of_saccades"][self.field] == TARGETS["Left"]:
+                self.left_true_num += 1
+                self._add_condition_true(condition)
+
+        elif trial_dict["orig_side"] == "Right\n":
+            self.right_total_num += 1
+            # adds to the true count it the participant saccaded to the correct side
+            if trial_dict["order_of_saccades"][self.field] == TARGETS["Right"]:
+                self.right_true_num += 1
+                self._add_condition_true(condition)
+
+    def merge(self, other):
+        """ adds the counts of other, which must look at the same saccade, e.g. computed in another process """
+        if self.field != other.field:
+            raise ValueError("can only merge accumulators of the same saccade")
+        for name in ("left_true_num", "left_total_num", "right_true_num", "right_total_num",
+                     "a_true_num", "a_total_num", "b_true_num", "b_total_num"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def _add_condition_true(self, condition):
+        if condition == "A":
+            self.a_true_num += 1
+        elif condition == "B":
+            self.b_true_num += 1
+
+    def result(self):
+        """ returns the AccuracyResult of saccade_accuracy_helper """
+        true_num = self.left_true_num + self.right_true_num
+        total_num = self.left_total_num + self.right_total_num
+
+        accuracy = true_num/total_num
+        left_accuracy = self.left_true_num/self.left_total_num
+        right_accuracy = self.right_true_num/self.right_total_num
+
+        a_accuracy = self.a_true_num/self.a_total_num
+        b_accuracy = self.b_true_num/self.b_total_num
+
+        return AccuracyResult(left_accuracy, right_accuracy, accuracy, a_accuracy, b_accuracy)
+
+
+class SaccadeCountAccumulator:
+    """ incrementally computes the statistics of num_interest_saccades_stats one trial at a time """
+
+    def __init__(self):
+        self.total_num_saccades = 0
+        self.total_num = 0
+        self.max_num_saccades = 0
+
+        self.difficult_images = []
+
+    def add_trial(self, participant, trial, trial_dict):
+        """ adds a trial subdict of the dictionary returned by read_samples to the counts """
+        # a trial without saccades counts as 0 saccades
+        num_saccades = len(trial_dict.get("order_of_saccades", []))
+        self.total_num_saccades += num_saccades
+        self.max_num_saccades = max(num_saccades, self.max_num_saccades)
+
+        if num_saccades > 2:
+            self.difficult_images += [trial_dict["file_name"]]
+
+        self.total_num += 1
+
+    def merge(self, other):
+        """ adds the counts of other, e.g. computed in another process """
+        self.total_num_saccades += other.total_num_saccades
+        self.total_num += other.total_num
+        self.max_num_saccades = max(self.max_num_saccades, other.max_num_saccades)
+        self.difficult_images += other.difficult_images
+
+    def result(self):
+        """ returns the SaccadeCountResult with the average number of saccades per trial, the maximum number
+            and the difficult stimuli, the average is nan without trials
+        """
+        average_per_trial = self.total_num_saccades/self.total_num if self.total_num else float("nan")
+        return SaccadeCountResult(average_per_trial, self.max_num_saccades, self.difficult_images)
+
+
+def accumulate_samples(samples_dict, accumulators):
+    """ feeds every trial of the dictionary returned by read_samples to the accumulators
+        inputs
+        ------
+        samples_dict: dictionary returned by read_samples
+        accumulators: list of objects with an add_trial(participant, trial, trial_dict) method
+    """
+    for participant in samples_dict:
+        for trial in samples_dict[participant]:
+            for accumulator in accumulators:
+                accumulator.add_trial(participant, trial, samples_dict[participant][trial])
+
+
+def stream_samples(samples_path, accumulators, chunk_size=CHUNK_SIZE, row_filter=DEFAULT_FILTER):
+    """ reads the samples file once in streaming mode and feeds every finished trial to the accumulators,
+        so the memory use does not depend on the size of the file
+        inputs
+        ------
+        samples_path: string path to the samples file
+        accumulators: list of objects with an add_trial(participant, trial, trial_dict) method
+        chunk_size: number of characters parsed at once
+        row_filter: RowFilter selecting the rows to keep, by default every participant but nikki
+    """
+    for participant, trial, trial_dict in iter_sample_trials(samples_path, chunk_size, row_filter):
+        for accumulator in accumulators:
+            accumulator.add_trial(participant, trial, trial_dict)
+
+
 def saccade_accuracy_helper(samples_dict, field):
     """ calculates statistics based on the inputted data dictionary and the field, and returns them
         inputs
@@ -79,75 +574,27 @@ def saccade_accuracy_helper(samples_dict, field):
         field: either 0 or -1, looks at the first saccade (0) or the last saccade (-1)
         outputs
         -------
+        AccuracyResult, a tuple of
         left_accuracy: the accuracy of the saccades if the original was on the left
         right_accuracy: the accuracy of the saccades if the original was on the right
         accuracy: the accuracy of the saccades
         a_accuracy: the accuracy of the saccades for condition A
         b_accuracy: the accuracy of the saccades for condition A
     """
-    left_true_num = 0
-    left_total_num = 0
-
-    right_true_num = 0
-    right_total_num = 0
+    accumulator = SaccadeAccuracyAccumulator(field)
+    accumulate_samples(samples_dict, [accumulator])
+    return accumulator.result()
 
-    a_true_num = 0
-    a_total_num = 0
 
-    b_true_num = 0
-    b_total_num = 0
-
-    for participant in samples_dict:
-        for trial in samples_dict[participant]:
-            # computes the total numbers of entries for each condition
-            condition = samples_dict[participant][trial]["condition"]
-            if condition == "A":
-                a_total_num += 1
-            elif condition == "B":
-                b_total_num += 1
-
-
-            if samples_dict[participant][trial]["orig_side"] == "Left\n":
-                left_total_num += 1
-                # adds to the true count it the participant saccaded to the correct side
-                if samples_dict[participant][trial]["order_of_saccades"][field] == "1":
-                    left_true_num += 1
-                    if condition == "A":
-                        a_true_num += 1
-                    elif condition == "B":
-                        b_true_num += 1
-
-            elif samples_dict[participant][trial]["orig_side"] == "Right\n":
-                right_total_num += 1
-                # adds to the true count it the participant saccaded to the correct side
-                if samples_dict[participant][trial]["order_of_saccades"][field] == "2":
-                    right_true_num += 1
-                    if condition == "A":
-                        a_true_num += 1
-                    elif condition == "B":
-                        b_true_num += 1
-    
-    true_num = left_true_num + right_true_num
-    total_num = left_total_num + right_total_num
-
-    accuracy = true_num/total_num
-    left_accuracy = left_true_num/left_total_num
-    right_accuracy = right_true_num/right_total_num
-
-    a_accuracy = a_true_num/a_total_num
-    b_accuracy = b_true_num/b_total_num
-
-    return left_accuracy, right_accuracy, accuracy, a_accuracy, b_accuracy
-
-
-def saccade_accuracy(samples_dict):
-    """" prints out statistics (computed by saccade_accuracy_helper) about the first and last saccades
+def print_saccade_accuracy(first, last):
+    """ prints out the statistics about the first and last saccades
         inputs
         ------
-        samples_dict: dictionary returned by read_samples
+        first: tuple returned by saccade_accuracy_helper for the first saccade
+        last: tuple returned by saccade_accuracy_helper for the last saccade
     """
-    f_left, f_right, f_total, f_a, f_b = saccade_accuracy_helper(samples_dict, 0)
-    l_left, l_right, l_total, l_a, l_b = saccade_accuracy_helper(samples_dict, -1)
+    f_left, f_right, f_total, f_a, f_b = first
+    l_left, l_right, l_total, l_a, l_b = last
     print("first saccade to interest area accuracies")
     print("left: " + str(f_left))
     print("right: " + str(f_right))
@@ -165,37 +612,105 @@ def saccade_accuracy(samples_dict):
     print("")
 
 
-def num_interest_saccades_stats(samples_dict):
-    """ prints the mean number of saccades between the two faces, the maximum number and the names of the stimuli
-        for which participants look back and forth more than 2 times. 
+@instrumentation.timed("saccade_accuracy")
+def saccade_accuracy(samples_dict, verbose=True):
+    """" computes statistics (computed by saccade_accuracy_helper) about the first and last saccades
         inputs
         ------
         samples_dict: dictionary returned by read_samples
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        result: SaccadeAccuracyResult of the first and last saccades
     """
-    total_num_saccades = 0
-    total_num = 0
-    max_num_saccades = 0
+    first = SaccadeAccuracyAccumulator(0)
+    last = SaccadeAccuracyAccumulator(-1)
+    accumulate_samples(samples_dict, [first, last])
+    result = SaccadeAccuracyResult(first.result(), last.result())
+    if verbose:
+        print_saccade_accuracy(*result)
+    return result
 
-    difficult_images = []
-
-    for participant in samples_dict:
-        for trial in samples_dict[participant]:
-            num_saccades = len(samples_dict[participant][trial]["order_of_saccades"])
-            total_num_saccades += num_saccades
-            max_num_saccades = max(num_saccades, max_num_saccades)
-
-            if num_saccades > 2:
-                difficult_images += [samples_dict[participant][trial]["file_name"]]
-            
-            total_num += 1
-
-    average_per_trial = total_num_saccades/total_num
 
+def print_num_interest_saccades(average_per_trial, max_num_saccades, difficult_images):
+    """ prints the statistics computed by SaccadeCountAccumulator
+        inputs
+        ------
+        average_per_trial: mean number of saccades between the two faces
+        max_num_saccades: the maximum number of saccades in a trial
+        difficult_images: names of the stimuli for which participants look back and forth more than 2 times
+    """
     print("average number of saccades per trial: " + str(average_per_trial))
     print("most saccades in a trial: " + str(max_num_saccades))
     print("difficult stimuli" + str(difficult_images))
 
+
+@instrumentation.timed("num_interest_saccades_stats")
+def num_interest_saccades_stats(samples_dict, verbose=True):
+    """ computes the mean number of saccades between the two faces, the maximum number and the names of the stimuli
+        for which participants look back and forth more than 2 times. 
+        inputs
+        ------
+        samples_dict: dictionary returned by read_samples
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        result: SaccadeCountResult
+    """
+    counts = SaccadeCountAccumulator()
+    accumulate_samples(samples_dict, [counts])
+    result = counts.result()
+    if verbose:
+        print_num_interest_saccades(*result)
+    return result
+
+
+@instrumentation.timed("num_interest_saccades_stats")
+def num_interest_saccades_stats_store(store, verbose=True):
+    """ num_interest_saccades_stats computed on the saccade counts and file name codes of a TrialStore,
+        decoding only the file names of the difficult stimuli. trials without saccades count as 0 saccades
+        inputs
+        ------
+        store: TrialStore of kind "samples"
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        result: SaccadeCountResult
+    """
+    num_saccades = np.diff(store.event_offsets)
+    difficult = np.asarray(store.file_name)[num_saccades > 2]
+    average_per_trial = int(num_saccades.sum())/len(num_saccades) if len(num_saccades) else float("nan")
+    result = SaccadeCountResult(average_per_trial, int(num_saccades.max(initial=0)),
+                                store.decode("file_name", difficult))
+    if verbose:
+        print_num_interest_saccades(*result)
+    return result
+
+
+@instrumentation.timed("streaming_samples_stats")
+def streaming_samples_stats(samples_path, chunk_size=CHUNK_SIZE, verbose=True):
+    """ computes the output of saccade_accuracy and num_interest_saccades_stats from a single streaming
+        read of the samples file, without building the dictionary returned by read_samples
+        inputs
+        ------
+        samples_path: string path to the samples file
+        chunk_size: number of characters parsed at once
+        verbose: if True, prints the statistics
+        outputs
+        -------
+        accuracy: SaccadeAccuracyResult
+        counts: SaccadeCountResult
+    """
+    first = SaccadeAccuracyAccumulator(0)
+    last = SaccadeAccuracyAccumulator(-1)
+    counts = SaccadeCountAccumulator()
+    stream_samples(samples_path, [first, last, counts], chunk_size)
+    accuracy = SaccadeAccuracyResult(first.result(), last.result())
+    if verbose:
+        print_saccade_accuracy(*accuracy)
+        print_num_interest_saccades(*counts.result())
+    return accuracy, counts.result()
+
 if __name__ == "__main__":
-    res = read_samples("10viewers_samples.csv")
-    saccade_accuracy(res)
-    num_interest_saccades_stats(res)
+    instrumentation.enable_from_env()
+    streaming_samples_stats("10viewers_samples.csv")
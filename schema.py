@@ -0,0 +1,37 @@
+import csv
+
+
+def header_names(header):
+    """ returns the column names of a header line, read with the csv module so quoted names are handled """
+    return [name.strip() for name in next(csv.reader([header.rstrip("\r\n")]), [])]
+
+
+def resolve_columns(header, aliases, default=None, optional=()):
+    """ finds the columns of the fields a reader needs by name, so exports with reordered or added columns
+        are read correctly
+    inputs
+    ------
+    header: the header line of the file, None for a file without one
+    aliases: {field: column names the field has in the different export versions}, matched ignoring case
+    default: {field: column index} used when the header has none of the names, e.g. the layout of the
+             original exports, None to require the names
+    optional: fields left out of columns when the header has none of their names, instead of raising
+    outputs
+    -------
+    columns: {field: column index}
+    num_columns: number of columns of the header, None when default is used
+    """
+    names = [] if header is None else [name.lower() for name in header_names(header)]
+    columns = {}
+    for field, field_aliases in aliases.items():
+        for alias in field_aliases:
+            if alias.lower() in names:
+                columns[field] = names.index(alias.lower())
+                break
+    if not columns and default is not None:
+        return dict(default), None
+    missing = [field for field in aliases if field not in columns and field not in optional]
+    if missing:
+        raise ValueError("the header has no column for " + ", ".join(
+            "%s (%s)" % (field, " or ".join(aliases[field])) for field in missing))
+    return columns, len(names)
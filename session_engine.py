@@ -0,0 +1,329 @@
+import argparse
+
+import instrumentation
+from fixations_processing import (FirstSaccadeAccumulator, SearchTimeAccumulator, read_fixations, trial_first_saccade,
+                                   trial_search_time)
+from messages_processing import ResponseTimeAccumulator, print_response_times, read_messages
+from results import RowWriter, SaccadeAccuracyResult, TrialMetrics, column_types, write_results
+from samples_processing import (SaccadeAccuracyAccumulator, SaccadeCountAccumulator, print_num_interest_saccades,
+                                print_saccade_accuracy, read_samples_chunked)
+from stimulus_index import StimulusIndex, report_stimulus_index
+
+SOURCES = ("samples", "fixations", "messages")
+READERS = {
+    "samples": read_samples_chunked,
+    "fixations": read_fixations,
+    "messages": read_messages,
+}
+
+# name -> (sources, factory, report, optional sources), in the order the reports are printed
+ANALYSES = {}
+
+
+def normalize_key(participant, trial):
+    """ returns the participant and trial of a row without surrounding whitespace, e.g. ("SPa\\n", "1") -> ("SPa", "1"),
+        so the keys of the three files match
+    """
+    return participant.strip(), trial.strip()
+
+
+def normalize_side(side):
+    """ returns "Left" or "Right" for the side encodings of the three files ("Left\\n", "Left", "left"),
+        or None for anything else
+    """
+    side = side.strip().capitalize()
+    return side if side in ("Left", "Right") else None
+
+
+class Session:
+    """ the samples, fixations and messages of a session joined by participant and trial.
+        every trial is a row, found through a hash index of its normalized (participant, trial) key, and
+        holds the trial subdict of each file it appears in, unchanged, so the existing accumulators work on it.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.participants = []
+        self.trials = []
+        self.sides = []
+        self.sources = {source: [] for source in SOURCES}
+        # (participant, trial, side, other source, other side) of trials whose files disagree on the side
+        self.side_conflicts = []
+
+    def __len__(self):
+        return len(self.trials)
+
+    def _row(self, participant, trial):
+        key = (participant, trial)
+        row = self.index.get(key)
+        if row is None:
+            row = len(self.trials)
+            self.index[key] = row
+            self.participants.append(participant)
+            self.trials.append(trial)
+            self.sides.append(None)
+            for rows in self.sources.values():
+                rows.append(None)
+        return row
+
+    def add_source(self, source, res_dict):
+        """ adds the dictionary returned by the reader of a source file to the session
+            inputs
+            ------
+            source: "samples", "fixations" or "messages"
+            res_dict: dictionary returned by read_samples, read_fixations or read_messages
+        """
+        if source not in SOURCES:
+            raise ValueError("source must be one of " + ", ".join(SOURCES))
+        rows = self.sources[source]
+        for participant in res_dict:
+            for trial in res_dict[participant]:
+                trial_dict = res_dict[participant][trial]
+                row = self._row(*normalize_key(participant, trial))
+                rows[row] = trial_dict
+
+                side = normalize_side(trial_dict.get("orig_side", ""))
+                if self.sides[row] is None:
+                    self.sides[row] = side
+                elif side is not None and side != self.sides[row]:
+                    self.side_conflicts.append((self.participants[row], self.trials[row], self.sides[row], source, side))
+
+    def get(self, participant, trial, source):
+        """ returns the trial subdict of a source file for a participant and trial in any of the files' encodings,
+            or None if the file does not have that trial
+        """
+        row = self.index.get(normalize_key(participant, trial))
+        return None if row is None else self.sources[source][row]
+
+    def side(self, participant, trial):
+        """ returns the normalized side ("Left" or "Right") the original image is on in a trial """
+        return self.sides[self.index[normalize_key(participant, trial)]]
+
+    def loaded_sources(self):
+        """ returns the sources with at least one trial """
+        return [source for source in SOURCES if any(trial_dict is not None for trial_dict in self.sources[source])]
+
+
+@instrumentation.timed("load_session")
+def load_session(samples_path=None, fixations_path=None, messages_path=None, cache_dir=None, row_filter=None):
+    """ reads each of the given files once and joins them into a Session
+    inputs
+    ------
+    samples_path, fixations_path, messages_path: string paths to the files, None to leave a source out
+    cache_dir: if given, the files are read through a ParseCache in this directory
+    row_filter: RowFilter selecting the rows of the samples and fixations to keep, None keeps the readers'
+                default. the messages are restricted to the trials kept in the other files
+    outputs
+    -------
+    session: the Session
+    """
+    session = Session()
+    for source, path in (("samples", samples_path), ("fixations", fixations_path), ("messages", messages_path)):
+        if path is None:
+            continue
+        if row_filter is not None and source != "messages":
+            # the cache only holds the files parsed with the default filter
+            res_dict = READERS[source](path, row_filter=row_filter)
+        elif cache_dir is not None:
+            from parse_cache import read_cached
+            res_dict = read_cached(path, source, cache_dir)
+        else:
+            res_dict = READERS[source](path)
+        if row_filter is not None and source == "messages" and len(session):
+            res_dict = {participant: {trial: trial_dict for trial, trial_dict in trials.items()
+                                      if normalize_key(participant, trial) in session.index}
+                        for participant, trials in res_dict.items()}
+        session.add_source(source, res_dict)
+    instrumentation.count("session_trials", len(session))
+    return session
+
+
+def register_analysis(name, sources, factory, report, optional_sources=()):
+    """ registers an analysis run by run_analyses
+    inputs
+    ------
+    name: name of the analysis
+    sources: the sources it needs, e.g. ("fixations",). it is given the trials that appear in all of them
+    factory: function returning a list of accumulators, objects with an add_trial(participant, trial, trial_dict)
+             method. trial_dict is the subdict of the source for a single source, otherwise {source: subdict}
+    report: function called with the list of accumulators, the plot function and verbose after the pass,
+            returning the result of the analysis and printing it if verbose is True
+    optional_sources: sources it uses when a trial is in them, e.g. ("messages",). with optional sources
+                      trial_dict is always {source: subdict}, with None for the optional sources missing the trial
+    """
+    ANALYSES[name] = (tuple(sources), factory, report, tuple(optional_sources))
+
+
+@instrumentation.timed("run_analyses")
+def run_analyses(session, names=None):
+    """ runs the registered analyses over the session in a single pass over its trials
+    inputs
+    ------
+    session: the Session
+    names: names of the analyses to run, defaults to every registered analysis whose sources are loaded
+    outputs
+    -------
+    results: {name: list of accumulators}
+    """
+    loaded = set(session.loaded_sources())
+    if names is None:
+        names = [name for name, (sources, _, _, _) in ANALYSES.items() if loaded.issuperset(sources)]
+    scheduled = []
+    results = {}
+    for name in names:
+        sources, factory, _, optional_sources = ANALYSES[name]
+        accumulators = factory()
+        results[name] = accumulators
+        scheduled.append(([session.sources[source] for source in sources], sources,
+                          [session.sources[source] for source in optional_sources], optional_sources, accumulators))
+
+    for row in range(len(session)):
+        participant = session.participants[row]
+        trial = session.trials[row]
+        for source_rows, sources, optional_rows, optional_sources, accumulators in scheduled:
+            trial_dicts = [rows[row] for rows in source_rows]
+            if any(trial_dict is None for trial_dict in trial_dicts):
+                continue
+            if optional_sources:
+                trial_dict = dict(zip(sources + optional_sources, trial_dicts + [rows[row] for rows in optional_rows]))
+            else:
+                trial_dict = trial_dicts[0] if len(sources) == 1 else dict(zip(sources, trial_dicts))
+            for accumulator in accumulators:
+                accumulator.add_trial(participant, trial, trial_dict)
+    return results
+
+
+@instrumentation.timed("report_analyses")
+def report_analyses(results, plot=None, verbose=True):
+    """ computes the results of the accumulators of run_analyses, in the order the analyses were registered
+        inputs
+        ------
+        results: the output of run_analyses
+        plot: function with the signature of plot_time_summaries, e.g. HeadlessRenderer.add_summaries
+        verbose: if True, prints the reports
+        outputs
+        -------
+        reports: {name: result}, e.g. {"response_time": ResponseTimeResult}, for write_results
+    """
+    reports = {}
+    for name in ANALYSES:
+        if name in results:
+            report = ANALYSES[name][2]
+            reports[name] = report(results[name], plot, verbose)
+    return reports
+
+
+def trial_metrics(session):
+    """ computes the metrics of each trial of the session from the files it is in
+        inputs
+        ------
+        session: the Session
+        outputs
+        -------
+        yields a TrialMetrics per trial, in the order the trials were added
+    """
+    for row in range(len(session)):
+        samples = session.sources["samples"][row]
+        fixations = session.sources["fixations"][row]
+        messages = session.sources["messages"][row]
+
+        condition = file_name = num_saccades = first_area = last_area = None
+        if samples is not None:
+            condition = samples["condition"].strip()
+            file_name = samples["file_name"]
+            saccades = samples.get("order_of_saccades", [])
+            num_saccades = len(saccades)
+            if saccades:
+                first_area = saccades[0]
+                last_area = saccades[-1]
+
+        first_time = first_accurate = search_time = search_accurate = None
+        if fixations is not None:
+            first_saccade = trial_first_saccade(fixations)
+            if first_saccade is not None:
+                first_time, first_accurate = first_saccade
+            # the search ends on a fixation on an interest area
+            if any(interval[2] != "[ ]" for interval in fixations["fixation_intervals"]):
+                search_time, search_accurate = trial_search_time(fixations)
+
+        resp_time = None if messages is None else messages["resp_time"]
+        yield TrialMetrics(session.participants[row], session.trials[row], session.sides[row], condition, file_name,
+                           num_saccades, first_area, last_area, first_time, first_accurate, search_time,
+                           search_accurate, resp_time)
+
+
+@instrumentation.timed("write_trial_metrics")
+def write_trial_metrics(session, path, format=None):
+    """ writes the trial_metrics of a session to a table, one row at a time
+        inputs
+        ------
+        session: the Session
+        path: string path to the output file
+        format: "csv", "json", "jsonl" or "parquet", taken from the extension of path by default
+    """
+    with RowWriter(path, TrialMetrics._fields, format, column_types(TrialMetrics)) as writer:
+        writer.write_rows(trial_metrics(session))
+
+
+def _report_saccade_accuracy(accumulators, plot, verbose):
+    result = SaccadeAccuracyResult(*(accumulator.result() for accumulator in accumulators))
+    if verbose:
+        print_saccade_accuracy(*result)
+    return result
+
+
+def _report_result(print_result):
+    """ returns a report function for analyses with a single accumulator with a result method """
+    def report(accumulators, plot, verbose):
+        result = accumulators[0].result()
+        if verbose:
+            print_result(*result)
+        return result
+    return report
+
+
+register_analysis("saccade_accuracy", ("samples",),
+                  lambda: [SaccadeAccuracyAccumulator(0), SaccadeAccuracyAccumulator(-1)], _report_saccade_accuracy)
+register_analysis("saccade_counts", ("samples",), lambda: [SaccadeCountAccumulator()],
+                  _report_result(print_num_interest_saccades))
+register_analysis("first_saccade", ("fixations",), lambda: [FirstSaccadeAccumulator()],
+                  lambda accumulators, plot, verbose: accumulators[0].report(plot, verbose))
+register_analysis("search_time", ("fixations",), lambda: [SearchTimeAccumulator()],
+                  lambda accumulators, plot, verbose: accumulators[0].report(plot, verbose))
+register_analysis("response_time", ("messages",), lambda: [ResponseTimeAccumulator()],
+                  _report_result(print_response_times))
+register_analysis("stimulus_index", ("samples",), lambda: [StimulusIndex()], report_stimulus_index,
+                  optional_sources=("fixations", "messages"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="runs the analyses of a session's samples, fixations and messages files")
+    parser.add_argument("--samples")
+    parser.add_argument("--fixations")
+    parser.add_argument("--messages")
+    parser.add_argument("--analyses", nargs="+", choices=list(ANALYSES), help="analyses to run, defaults to all")
+    parser.add_argument("--cache-dir", help="read the files through a parse cache in this directory")
+    parser.add_argument("--plots-dir", help="write the plots to this directory instead of showing them")
+    parser.add_argument("--results-out", help="write the results to this .json, .csv or .parquet file")
+    parser.add_argument("--trials-out", help="write the per trial metrics to this .csv, .json, .jsonl or .parquet file")
+    parser.add_argument("--quiet", action="store_true", help="do not print the reports")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.enable_from_args(args)
+
+    session = load_session(args.samples, args.fixations, args.messages, args.cache_dir)
+    for participant, trial, side, source, other_side in session.side_conflicts:
+        print("warning: participant %s trial %s is %s in the %s file but %s before" % (
+            participant, trial, other_side, source, side))
+    results = run_analyses(session, args.analyses)
+    if args.plots_dir:
+        from plot_rendering import HeadlessRenderer
+        renderer = HeadlessRenderer(args.plots_dir)
+        reports = report_analyses(results, renderer.add_summaries, not args.quiet)
+        renderer.render()
+    else:
+        reports = report_analyses(results, verbose=not args.quiet)
+    if args.results_out:
+        write_results(reports, args.results_out)
+    if args.trials_out:
+        write_trial_metrics(session, args.trials_out)
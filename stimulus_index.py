@@ -0,0 +1,240 @@
+import argparse
+import json
+import math
+import os
+
+import instrumentation
+from fixations_processing import trial_search_time
+from results import StimulusStats, write_results
+from samples_processing import TARGETS
+
+# version of the saved index, bumped when its layout changes
+INDEX_VERSION = 1
+# number of the hardest stimuli printed by report_stimulus_index
+TOP_K = 10
+# statistics the stimuli can be ranked by, and whether a higher value means a harder stimulus
+DIFFICULTY = {
+    "mean_switches": True,
+    "median_switches": True,
+    "accuracy": False,
+    "mean_search_time": True,
+    "mean_resp_time": True,
+}
+
+
+def _new_entry():
+    return {"trials": 0, "accurate": 0, "switches": {}, "search_time": 0.0, "search_trials": 0,
+            "resp_time": 0.0, "resp_trials": 0}
+
+
+def _median(histogram):
+    """ returns the median of the values counted by a {value: count} histogram, the value at rank
+        int(total * 0.5) of the sorted values like time_stats and QuantileSketch.quantile
+    """
+    total = sum(histogram.values())
+    if total == 0:
+        return math.nan
+    rank = int(total * 0.5)
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen > rank:
+            return float(value)
+
+
+class StimulusIndex:
+    """ per stimulus aggregates of a session or a set of sessions, built in the single pass of the session
+        engine over the joined samples, fixations and messages. for every stimulus file it keeps the
+        number of trials, the accurate trials (last saccade on the original), a histogram of the number of
+        switches between the interest areas (the count of num_interest_saccades_stats), and the sums of
+        the search and response times. only these totals are kept, so indexes of several sessions can be
+        merged and saved, and stimuli ranked later without the raw files.
+        inputs
+        ------
+        sessions: names of the sessions the index was built from
+    """
+
+    def __init__(self, sessions=()):
+        self.sessions = list(sessions)
+        self.stimuli = {}
+
+    def __len__(self):
+        return len(self.stimuli)
+
+    def add_trial(self, participant, trial, trial_dict):
+        """ adds a trial of the session engine, trial_dict is {"samples": subdict, "fixations": subdict or None,
+            "messages": subdict or None}
+        """
+        samples = trial_dict["samples"]
+        entry = self.stimuli.get(samples["file_name"])
+        if entry is None:
+            entry = self.stimuli[samples["file_name"]] = _new_entry()
+        entry["trials"] += 1
+
+        saccades = samples.get("order_of_saccades", [])
+        switches = entry["switches"]
+        switches[len(saccades)] = switches.get(len(saccades), 0) + 1
+        if saccades and saccades[-1] == TARGETS.get(samples["orig_side"].strip()):
+            entry["accurate"] += 1
+
+        fixations = trial_dict.get("fixations")
+        # the search ends on a fixation on an interest area
+        if fixations is not None and any(interval[2] != "[ ]" for interval in fixations["fixation_intervals"]):
+            entry["search_time"] += trial_search_time(fixations)[0]
+            entry["search_trials"] += 1
+
+        messages = trial_dict.get("messages")
+        if messages is not None:
+            entry["resp_time"] += messages["resp_time"]
+            entry["resp_trials"] += 1
+
+    def merge(self, other):
+        """ adds the trials of another index, e.g. of another session file """
+        overlap = set(self.sessions) & set(other.sessions)
+        if overlap:
+            raise ValueError("sessions %s are already in the index" % ", ".join(sorted(overlap)))
+        self.sessions += other.sessions
+        for file_name, other_entry in other.stimuli.items():
+            entry = self.stimuli.get(file_name)
+            if entry is None:
+                entry = self.stimuli[file_name] = _new_entry()
+            for name in ("trials", "accurate", "search_time", "search_trials", "resp_time", "resp_trials"):
+                entry[name] += other_entry[name]
+            for count, trials in other_entry["switches"].items():
+                entry["switches"][count] = entry["switches"].get(count, 0) + trials
+
+    def stats(self, file_name):
+        """ returns the StimulusStats of a stimulus """
+        entry = self.stimuli[file_name]
+        switches = entry["switches"]
+        return StimulusStats(
+            file_name, entry["trials"], entry["accurate"]/entry["trials"],
+            sum(count * trials for count, trials in switches.items())/entry["trials"], _median(switches),
+            entry["search_time"]/entry["search_trials"] if entry["search_trials"] else math.nan,
+            entry["resp_time"]/entry["resp_trials"] if entry["resp_trials"] else math.nan)
+
+    def hardest(self, k=None, by="mean_switches", min_trials=1):
+        """ returns the StimulusStats of the k hardest stimuli, hardest first
+            inputs
+            ------
+            k: number of stimuli, None for all of them
+            by: statistic ranking the stimuli, one of DIFFICULTY, e.g. "accuracy" ranks the least accurate first.
+                ties are broken by accuracy and then by file name
+            min_trials: leaves out the stimuli shown in fewer trials
+            outputs
+            -------
+            rows: list of StimulusStats
+        """
+        if by not in DIFFICULTY:
+            raise ValueError("by must be one of " + ", ".join(DIFFICULTY))
+        sign = -1 if DIFFICULTY[by] else 1
+
+        def rank(row):
+            value = getattr(row, by)
+            # stimuli without a value go last
+            return (math.isnan(value), sign * value if not math.isnan(value) else 0, row.accuracy, row.file_name)
+
+        rows = sorted((self.stats(file_name) for file_name, entry in self.stimuli.items()
+                       if entry["trials"] >= min_trials), key=rank)
+        return rows if k is None else rows[:k]
+
+    def result(self):
+        """ returns the StimulusStats of every stimulus, hardest first """
+        return self.hardest()
+
+    def to_dict(self):
+        """ returns the index as plain dictionaries and lists for json """
+        stimuli = {file_name: dict(entry, switches={str(count): trials for count, trials in entry["switches"].items()})
+                   for file_name, entry in self.stimuli.items()}
+        return {"version": INDEX_VERSION, "sessions": self.sessions, "stimuli": stimuli}
+
+    @classmethod
+    def from_dict(cls, data):
+        """ returns the index saved by to_dict """
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError("unsupported stimulus index version %r" % data.get("version"))
+        index = cls(data["sessions"])
+        for file_name, entry in data["stimuli"].items():
+            index.stimuli[file_name] = dict(entry, switches={int(count): trials
+                                                             for count, trials in entry["switches"].items()})
+        return index
+
+    def save(self, path):
+        """ writes the index to a json file, replacing it at once so readers never see a partial index """
+        tmp_path = path + ".tmp%d" % os.getpid()
+        with open(tmp_path, 'w') as file:
+            json.dump(self.to_dict(), file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """ reads an index written by save """
+        with open(path, 'r') as file:
+            return cls.from_dict(json.load(file))
+
+
+def print_stimulus_index(rows, k=TOP_K):
+    """ prints the k first rows of StimulusIndex.hardest """
+    print("hardest stimuli")
+    print("%-30s %7s %9s %9s %7s %12s %11s" % ("file name", "trials", "accuracy", "switches", "median",
+                                             "search time", "resp time"))
+    for row in rows[:k]:
+        print("%-30s %7d %9.3f %9.2f %7.1f %12.1f %11.1f" % row)
+
+
+def report_stimulus_index(accumulators, plot, verbose):
+    """ report function of the stimulus_index analysis of the session engine """
+    result = accumulators[0].result()
+    if verbose:
+        print_stimulus_index(result)
+    return result
+
+
+@instrumentation.timed("build_stimulus_index")
+def build_stimulus_index(samples_path, fixations_path=None, messages_path=None, name=None, cache_dir=None):
+    """ builds the StimulusIndex of a session from a single pass over its files
+    inputs
+    ------
+    samples_path: string path to the samples file, which has the stimulus of every trial
+    fixations_path, messages_path: string paths to the other files, None to leave out the search or response times
+    name: name of the session, by default the samples file name
+    cache_dir: if given, the files are read through a ParseCache in this directory
+    outputs
+    -------
+    index: the StimulusIndex
+    """
+    from session_engine import load_session, run_analyses
+
+    session = load_session(samples_path, fixations_path, messages_path, cache_dir)
+    index = run_analyses(session, ["stimulus_index"])["stimulus_index"][0]
+    index.sessions = [name or os.path.basename(samples_path)]
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="builds, merges and queries per stimulus difficulty indexes")
+    parser.add_argument("--samples", help="samples file of a session to add to the index")
+    parser.add_argument("--fixations")
+    parser.add_argument("--messages")
+    parser.add_argument("--name", help="name of the session, defaults to the samples file name")
+    parser.add_argument("--merge", nargs="+", default=[], help="saved indexes to merge")
+    parser.add_argument("--index", help="saved index to update (or create) with the session and merged indexes")
+    parser.add_argument("--top", type=int, default=TOP_K, help="number of hardest stimuli to print")
+    parser.add_argument("--by", choices=list(DIFFICULTY), default="mean_switches")
+    parser.add_argument("--min-trials", type=int, default=1)
+    parser.add_argument("--out", help="write the ranked stimuli to this .json, .csv or .parquet file")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.enable_from_args(args)
+
+    index = StimulusIndex.load(args.index) if args.index and os.path.exists(args.index) else StimulusIndex()
+    for path in args.merge:
+        index.merge(StimulusIndex.load(path))
+    if args.samples:
+        index.merge(build_stimulus_index(args.samples, args.fixations, args.messages, args.name))
+    if args.index:
+        index.save(args.index)
+    rows = index.hardest(args.top, args.by, args.min_trials)
+    print_stimulus_index(rows, args.top)
+    if args.out:
+        write_results({"stimulus_index": rows}, args.out)
@@ -0,0 +1,232 @@
+import math
+
+import numpy as np
+
+# number of values buffered before they are binned
+_BUFFER_SIZE = 4096
+
+
+class RunningStats:
+    """ count, sum, minimum and maximum of a stream of values """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values):
+            self.count += len(values)
+            self.total += float(values.sum())
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        """ adds the values summarized by other, e.g. computed in another process """
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return self.total/self.count
+
+
+class TimeHistogram:
+    """ fixed-bin histogram with the bins of plot_time_proportions, np.arange(0, max_time, bin_size).
+        counts are identical to np.histogram of all added values, and count includes the values outside
+        the bins, like the total plot_time_proportions divides by.
+        inputs
+        ------
+        max_time: the maximum value of the x direction
+        bin_size: the size of the bins
+    """
+
+    def __init__(self, max_time, bin_size):
+        self.max_time = max_time
+        self.bin_size = bin_size
+        self.bin_edges = np.arange(0, max_time, bin_size)
+        self.counts = np.zeros(max(len(self.bin_edges) - 1, 0), dtype=np.int64)
+        self.count = 0
+        self._buffer = []
+
+    def add(self, value):
+        self._buffer.append(value)
+        if len(self._buffer) >= _BUFFER_SIZE:
+            self._flush()
+
+    def add_many(self, values):
+        self._flush()
+        self._bin(np.asarray(values, dtype=np.float64))
+
+    def _bin(self, values):
+        if len(values):
+            counts, _ = np.histogram(values, bins=self.bin_edges)
+            self.counts += counts
+            self.count += len(values)
+
+    def _flush(self):
+        if self._buffer:
+            values, self._buffer = self._buffer, []
+            self._bin(np.asarray(values, dtype=np.float64))
+
+    def merge(self, other):
+        """ adds the values binned by other, which must have the same bins """
+        if self.max_time != other.max_time or self.bin_size != other.bin_size:
+            raise ValueError("can only merge histograms with the same bins")
+        self._flush()
+        other._flush()
+        self.counts += other.counts
+        self.count += other.count
+
+    def histogram(self):
+        """ returns the counts per bin and the total number of values """
+        self._flush()
+        return self.counts, self.count
+
+    def __getstate__(self):
+        self._flush()
+        return self.__dict__
+
+
+class QuantileSketch:
+    """ mergeable quantile sketch with a relative error bound. values are counted in logarithmic
+        buckets, so any quantile is returned within relative_accuracy of the exact value, with memory
+        growing only with the logarithm of the range of the values.
+        inputs
+        ------
+        relative_accuracy: maximum relative error of the returned quantiles, e.g. 0.001 for 0.1%
+    """
+
+    def __init__(self, relative_accuracy=0.001):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy)/(1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self._buffer = []
+
+    def add(self, value):
+        self._buffer.append(value)
+        if len(self._buffer) >= _BUFFER_SIZE:
+            self._flush()
+
+    def add_many(self, values):
+        self._flush()
+        self._bucket(np.asarray(values, dtype=np.float64))
+
+    def _bucket(self, values):
+        if not len(values):
+            return
+        self.count += len(values)
+        self.zero_count += int(np.count_nonzero(values == 0))
+        for store, magnitudes in ((self.positive, values[values > 0]), (self.negative, -values[values < 0])):
+            if len(magnitudes):
+                keys, counts = np.unique(np.ceil(np.log(magnitudes)/self._log_gamma).astype(np.int64), return_counts=True)
+                for key, count in zip(keys.tolist(), counts.tolist()):
+                    store[key] = store.get(key, 0) + count
+
+    def _flush(self):
+        if self._buffer:
+            values, self._buffer = self._buffer, []
+            self._bucket(np.asarray(values, dtype=np.float64))
+
+    def merge(self, other):
+        """ adds the values summarized by other, which must have the same relative accuracy """
+        if self.relative_accuracy != other.relative_accuracy:
+            raise ValueError("can only merge sketches with the same relative accuracy")
+        self._flush()
+        other._flush()
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def _value(self, key):
+        # the value with the same relative distance to both bucket bounds
+        return 2 * self.gamma ** key/(self.gamma + 1)
+
+    def quantile(self, q):
+        """ returns the value at index int(q * count) of the sorted values, like plot_time_proportions
+            computes its median, within the relative accuracy
+        """
+        self._flush()
+        if self.count == 0:
+            raise ValueError("quantile of an empty sketch")
+        rank = min(int(self.count * q), self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def __getstate__(self):
+        self._flush()
+        return self.__dict__
+
+
+class TimeSummary:
+    """ streaming summary of a list of times: RunningStats, a TimeHistogram and a QuantileSketch, so
+        means, extremes, histogram proportions and medians can be computed without keeping the times
+        inputs
+        ------
+        max_time: the maximum value of the histogram
+        bin_size: the size of the histogram bins
+        relative_accuracy: maximum relative error of the quantiles
+    """
+
+    def __init__(self, max_time, bin_size, relative_accuracy=0.001):
+        self.stats = RunningStats()
+        self.histogram = TimeHistogram(max_time, bin_size)
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    @property
+    def count(self):
+        return self.stats.count
+
+    def add(self, value):
+        self.stats.add(value)
+        self.histogram.add(value)
+        self.sketch.add(value)
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.stats.add_many(values)
+        self.histogram.add_many(values)
+        self.sketch.add_many(values)
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        self.histogram.merge(other.histogram)
+        self.sketch.merge(other.sketch)
+
+    def merged(self, *others):
+        """ returns a new summary of the values of this summary and the others """
+        result = TimeSummary(self.histogram.max_time, self.histogram.bin_size, self.sketch.relative_accuracy)
+        for summary in (self,) + others:
+            result.merge(summary)
+        return result
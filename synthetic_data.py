@@ -0,0 +1,174 @@
+import argparse
+import os
+
+import numpy as np
+
+SAMPLES_HEADER = "RECORDING_SESSION_LABEL,TRIAL_INDEX,TIMESTAMP,RIGHT_GAZE_X,RIGHT_GAZE_Y,RIGHT_INTEREST_AREAS,condition,file_name,orig_side\n"
+FIXATIONS_HEADER = ("RECORDING_SESSION_LABEL,TRIAL_INDEX,CURRENT_FIX_INDEX,CURRENT_FIX_X,CURRENT_FIX_Y,CURRENT_FIX_DURATION,"
+                    "orig_side,condition,file_name,CURRENT_FIX_PUPIL,TRIAL_START_TIME,CURRENT_FIX_START,CURRENT_FIX_INTEREST_AREA_INDEX,"
+                    "CURRENT_FIX_END,CURRENT_FIX_INTEREST_AREAS,CURRENT_FIX_INTEREST_AREA_LABEL\n")
+MESSAGES_HEADER = "TRIAL_INDEX,CURRENT_MSG_TIME,CURRENT_MSG_TEXT,RESPONSE_TIME,condition,file_name,RECORDING_SESSION_LABEL\n"
+
+# screen positions of the crosshairs and of the left ("[ 1]") and right ("[ 2]") faces
+CROSSHAIR = (960.0, 540.0)
+FACES = {1: (480.0, 540.0), 2: (1440.0, 540.0)}
+# time between two samples in ms
+SAMPLE_INTERVAL = 2
+# range of the durations of a saccade between two fixations in ms
+SACCADE_DURATION = (20, 80)
+NUM_STIMULI = 200
+# standard deviation of the gaze position during fixations in pixels, about 0.015 degrees at 35 pixels per degree,
+# the precision of a video eye tracker
+GAZE_NOISE = 0.5
+# version of the generated files, bumped when the same arguments produce different files
+VERSION = 2
+
+
+def _trial_fixations(rng, side, duration):
+    """ draws the sequence of fixations of a trial
+    inputs
+    ------
+    rng: numpy random generator
+    side: 1 if the original is on the left, 2 if it is on the right
+    duration: length of the trial in ms
+    outputs
+    -------
+    fixations: list of (start, end, area) with area 0 for the crosshairs, 1 and 2 for the faces
+    """
+    # one or two fixations on the crosshairs, then a few looks back and forth, ending mostly on the original
+    areas = [0] * int(rng.integers(1, 3))
+    area = side if rng.random() < 0.6 else 3 - side
+    for _ in range(int(rng.integers(1, 6))):
+        areas.append(area)
+        if rng.random() < 0.5:
+            area = 3 - area
+    if areas[-1] == 0:
+        areas.append(side)
+
+    # split the trial into fixations separated by saccades
+    saccades = rng.integers(SACCADE_DURATION[0], SACCADE_DURATION[1], len(areas))
+    saccades[-1] = 0
+    weights = rng.uniform(0.5, 1.5, len(areas))
+    available = duration - saccades.sum()
+    lengths = np.maximum(np.floor(weights / weights.sum() * available), SAMPLE_INTERVAL)
+    fixations = []
+    start = 0.0
+    for area, length, saccade in zip(areas, lengths.tolist(), saccades.tolist()):
+        fixations.append((start, start + length, area))
+        start += length + saccade
+    return fixations
+
+
+def _gaze_position(fixations, times, rng, noise=GAZE_NOISE):
+    """ returns the gaze x and y of every sample time, with noise of standard deviation noise pixels during
+        fixations and linear movement during saccades, and the area being fixated (-1 during saccades)
+    """
+    targets = [CROSSHAIR if area == 0 else FACES[area] for _, _, area in fixations]
+    x = np.empty(len(times))
+    y = np.empty(len(times))
+    area = np.full(len(times), -1)
+    for i, (start, end, fixated) in enumerate(fixations):
+        during = (times >= start) & (times <= end)
+        x[during] = targets[i][0] + rng.normal(0, noise, during.sum())
+        y[during] = targets[i][1] + rng.normal(0, noise, during.sum())
+        area[during] = fixated
+        if i + 1 < len(fixations):
+            next_start = fixations[i + 1][0]
+            between = (times > end) & (times < next_start)
+            progress = (times[between] - end) / (next_start - end)
+            x[between] = targets[i][0] + progress * (targets[i + 1][0] - targets[i][0])
+            y[between] = targets[i][1] + progress * (targets[i + 1][1] - targets[i][1])
+    after = times > fixations[-1][1]
+    x[after] = targets[-1][0] + rng.normal(0, noise, after.sum())
+    y[after] = targets[-1][1] + rng.normal(0, noise, after.sum())
+    area[after] = fixations[-1][2]
+    return x, y, area
+
+
+def generate_session(prefix, participants=10, trials=100, samples_per_trial=1000, seed=0, missing_rate=0.001,
+                     gaze_noise=GAZE_NOISE):
+    """ writes a synthetic EyeLink-style session: <prefix>_samples.csv, <prefix>_fixations.csv and
+        <prefix>_messages.csv, with the columns read_samples, read_fixations and read_messages expect.
+        the same arguments always produce the same files.
+    inputs
+    ------
+    prefix: path prefix of the files
+    participants: number of participants
+    trials: number of trials per participant
+    samples_per_trial: number of gaze samples per trial, at one sample every 2 ms, at least 1
+    seed: seed of the random generator
+    missing_rate: proportion of samples with missing gaze data (".")
+    gaze_noise: standard deviation of the gaze position during fixations in pixels
+    outputs
+    -------
+    paths: dictionary of "samples", "fixations" and "messages" to the written paths
+    """
+    if samples_per_trial < 1:
+        raise ValueError("samples_per_trial must be at least 1")
+    rng = np.random.default_rng(seed)
+    paths = {kind: "%s_%s.csv" % (prefix, kind) for kind in ("samples", "fixations", "messages")}
+    directory = os.path.dirname(prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(paths["samples"], 'w') as samples, open(paths["fixations"], 'w') as fixations, \
+            open(paths["messages"], 'w') as messages:
+        samples.write(SAMPLES_HEADER)
+        fixations.write(FIXATIONS_HEADER)
+        messages.write(MESSAGES_HEADER)
+
+        for p in range(participants):
+            participant = "p%04d" % p
+            clock = 100000.0 * (p + 1)
+            for trial in range(1, trials + 1):
+                side = int(rng.integers(1, 3))
+                side_name = "Left" if side == 1 else "Right"
+                condition = "A" if rng.random() < 0.5 else "B"
+                file_name = "face%03d_%s.jpg" % (rng.integers(NUM_STIMULI), side_name.lower())
+                duration = samples_per_trial * SAMPLE_INTERVAL
+                trial_fixations = _trial_fixations(rng, side, duration)
+
+                # gaze samples
+                times = np.arange(samples_per_trial) * SAMPLE_INTERVAL
+                x, y, area = _gaze_position(trial_fixations, times.astype(np.float64), rng, gaze_noise)
+                missing = rng.random(samples_per_trial) < missing_rate
+                labels = np.where(area > 0, np.char.add(np.char.add("[ ", area.astype(str)), "]"), "[]")
+                tail = ",%s,%s,%s\n" % (condition, file_name, side_name)
+                lines = []
+                for timestamp, gaze_x, gaze_y, label, is_missing in zip((times + clock).astype(np.int64).tolist(), x.tolist(),
+                                                                        y.tolist(), labels.tolist(), missing.tolist()):
+                    if is_missing:
+                        lines.append("%s,%d,%d,.,.,[]%s" % (participant, trial, timestamp, tail))
+                    else:
+                        lines.append("%s,%d,%d,%.1f,%.1f,%s%s" % (participant, trial, timestamp, gaze_x, gaze_y, label, tail))
+                samples.write("".join(lines))
+
+                # fixations, with times relative to the start of the trial
+                lines = []
+                for index, (start, end, fixated) in enumerate(trial_fixations):
+                    target = CROSSHAIR if fixated == 0 else FACES[fixated]
+                    label = "[ ]" if fixated == 0 else "[ %d]" % fixated
+                    lines.append("%s,%d,%d,%.1f,%.1f,%.0f,%s,%s,%s,%d,%.0f,%.0f,%s,%.0f,%s,%s\n" % (
+                        participant, trial, index + 1, target[0], target[1], end - start, side_name, condition, file_name,
+                        int(rng.integers(800, 1200)), clock, start, fixated if fixated else ".", end, label,
+                        "face_%d" % fixated if fixated else "."))
+                fixations.write("".join(lines))
+
+                # response message, at least 400 ms after the start of trials long enough
+                response_time = float(rng.uniform(min(400, duration), duration))
+                messages.write("%d,%.0f,RESPONSE,%.1f,%s,%s,%s\n" % (trial, clock + response_time, response_time,
+                                                                    condition, file_name, participant))
+                clock += duration + 1000
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="writes a synthetic EyeLink-style session for testing and benchmarks")
+    parser.add_argument("prefix", help="path prefix of the written files")
+    parser.add_argument("--participants", type=int, default=10)
+    parser.add_argument("--trials", type=int, default=100)
+    parser.add_argument("--samples-per-trial", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for kind, path in generate_session(args.prefix, args.participants, args.trials, args.samples_per_trial, args.seed).items():
+        print(kind + ": " + path)
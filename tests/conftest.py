@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_data import generate_session  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def session_paths(tmp_path_factory):
+    """ paths of a small synthetic session, {"samples": path, "fixations": path, "messages": path} """
+    return generate_session(str(tmp_path_factory.mktemp("session") / "synthetic"), participants=4, trials=30,
+                            samples_per_trial=500, seed=1)
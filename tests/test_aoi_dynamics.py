@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from aoi_dynamics import aoi_transitions, dwell_curves, trial_conditions, window_starts
+from fixations_processing import read_fixations
+from row_filter import RowFilter
+from samples_processing import read_samples
+from trial_store import fixation_store_from_file
+
+
+def _without_condition(path, out_path):
+    """ writes a copy of a fixations file without its condition column """
+    with open(path) as file:
+        lines = file.readlines()
+    column = lines[0].split(",").index("condition")
+    with open(out_path, "w") as file:
+        for line in lines:
+            cols = line.split(",")
+            del cols[column]
+            file.write(",".join(cols))
+
+
+def test_conditions_from_the_fixations_file(session_paths, tmp_path):
+    store = fixation_store_from_file(session_paths["fixations"])
+    conditions = trial_conditions(store)
+    assert set(conditions) == {"A", "B"}
+
+    # an export without the column falls back to the samples and gives the same conditions
+    no_condition = str(tmp_path / "fixations.csv")
+    _without_condition(session_paths["fixations"], no_condition)
+    no_condition_store = fixation_store_from_file(no_condition)
+    assert trial_conditions(no_condition_store) is None
+    assert trial_conditions(no_condition_store, read_samples(session_paths["samples"])) == conditions
+
+
+def test_condition_filter_on_the_fixations_file(session_paths):
+    fixation_dict = read_fixations(session_paths["fixations"], RowFilter(conditions=["A"]))
+    trials = [trial_dict for participant_dict in fixation_dict.values() for trial_dict in participant_dict.values()]
+    assert trials and all(trial_dict["condition"] == "A" for trial_dict in trials)
+    store = fixation_store_from_file(session_paths["fixations"], row_filter=RowFilter(conditions=["A"]))
+    view = store.as_mapping()
+    assert {participant: {trial: dict(view[participant][trial]) for trial in view[participant]}
+            for participant in view} == fixation_dict
+
+
+def test_unnamed_columns_have_no_condition(session_paths, tmp_path):
+    # a header without the column names is read with the FIXATION_COLUMNS layout, which has no condition
+    with open(session_paths["fixations"]) as file:
+        lines = file.readlines()
+    unnamed = tmp_path / "fixations.csv"
+    unnamed.write_text(",".join("column%d" % i for i in range(len(lines[0].split(",")))) + "\n" + "".join(lines[1:]))
+    fixation_dict = read_fixations(str(unnamed))
+    trials = [trial_dict for participant_dict in fixation_dict.values() for trial_dict in participant_dict.values()]
+    assert trials and not any("condition" in trial_dict for trial_dict in trials)
+    assert trial_conditions(fixation_store_from_file(str(unnamed))) is None
+    with pytest.raises(ValueError, match="no condition column"):
+        read_fixations(str(unnamed), RowFilter(conditions=["A"]))
+
+
+def _trial_items(fixation_dict, with_conditions):
+    """ yields the (condition, side) group and the fixation intervals of every trial """
+    for participant_dict in fixation_dict.values():
+        for trial_dict in participant_dict.values():
+            condition = trial_dict["condition"].strip() if with_conditions else ""
+            yield (condition, trial_dict["orig_side"].strip()), trial_dict["fixation_intervals"]
+
+
+@pytest.mark.parametrize("with_conditions", [True, False])
+@pytest.mark.parametrize("window, step, max_time", [(200, 50, 3000), (150, 70, 1000)])
+def test_dwell_curves_match_a_loop(session_paths, with_conditions, window, step, max_time):
+    store = fixation_store_from_file(session_paths["fixations"])
+    curves = dwell_curves(store, trial_conditions(store) if with_conditions else None, window, step, max_time)
+    groups = {group: g for g, group in enumerate(curves.groups)}
+    labels = {label: a for a, label in enumerate(curves.labels)}
+    starts = window_starts(window, step, max_time).tolist()
+    assert curves.window_starts.tolist() == starts
+
+    dwell = np.zeros(curves.dwell.shape)
+    trials = np.zeros(len(groups), dtype=np.int64)
+    for group, intervals in _trial_items(read_fixations(session_paths["fixations"]), with_conditions):
+        trials[groups[group]] += 1
+        for start, end, aoi in intervals:
+            for w, window_start in enumerate(starts):
+                dwell[groups[group], labels[aoi], w] += max(0, min(end, window_start + window) - max(start, window_start))
+    assert curves.trials.tolist() == trials.tolist()
+    assert dwell.sum() > 0 and np.allclose(curves.dwell, dwell)
+    total = dwell.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore"):
+        assert np.allclose(curves.proportion, dwell / total, equal_nan=True)
+
+
+@pytest.mark.parametrize("with_conditions", [True, False])
+def test_aoi_transitions_match_a_loop(session_paths, with_conditions):
+    store = fixation_store_from_file(session_paths["fixations"])
+    transitions = aoi_transitions(store, trial_conditions(store) if with_conditions else None)
+    groups = {group: g for g, group in enumerate(transitions.groups)}
+    labels = {label: a for a, label in enumerate(transitions.labels)}
+
+    counts = np.zeros(transitions.counts.shape, dtype=np.int64)
+    for group, intervals in _trial_items(read_fixations(session_paths["fixations"]), with_conditions):
+        for before, after in zip(intervals, intervals[1:]):
+            counts[groups[group], labels[before[2]], labels[after[2]]] += 1
+    assert transitions.counts.tolist() == counts.tolist()
+    assert counts.sum() > 0
+    from_counts = counts.sum(axis=2, keepdims=True)
+    with np.errstate(invalid="ignore"):
+        assert np.allclose(transitions.probabilities, counts / from_counts, equal_nan=True)
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+from batch_runner import discover_sessions, load_manifest, run_batch
+
+
+def test_duplicate_session_names_are_rejected(session_paths, tmp_path):
+    discovered = discover_sessions([os.path.join(os.path.dirname(session_paths["samples"]), "synthetic_*.csv")])
+    assert [name for name, _ in discovered] == ["synthetic"]
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("name,samples,fixations,messages\nsynthetic,%s,,\nsession 1,%s,,\n" % (
+        session_paths["samples"], session_paths["samples"]))
+    out_dir = str(tmp_path / "out")
+
+    # the same session in the manifest and in the glob patterns
+    with pytest.raises(ValueError, match="session synthetic is given twice"):
+        run_batch(load_manifest(str(manifest)) + discovered, out_dir, workers=1, render=False, verbose=False)
+    # names that write to the same directory
+    with pytest.raises(ValueError, match="sessions session 1 and session_1 would both write to"):
+        run_batch(load_manifest(str(manifest))[1:] + [("session_1", {"samples": session_paths["samples"]})], out_dir,
+                  workers=1, render=False, verbose=False)
+    assert not os.path.exists(out_dir)
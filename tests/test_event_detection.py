@@ -0,0 +1,99 @@
+import pytest
+
+from event_detection import FIXATION_DURATION, detect_saccades
+from fixations_processing import read_fixations
+from synthetic_data import SAMPLE_INTERVAL, generate_session
+
+
+@pytest.fixture(scope="module")
+def clean_session(tmp_path_factory):
+    """ a synthetic session without missing samples, so every saccade the generator wrote is a whole run """
+    return generate_session(str(tmp_path_factory.mktemp("clean") / "clean"), participants=3, trials=40, seed=2,
+                            missing_rate=0)
+
+
+def _trial_starts(samples_path):
+    """ returns the time of the first sample of every trial, the fixation times are relative to it """
+    starts = {}
+    with open(samples_path, 'r') as file:
+        next(file)
+        for line in file:
+            cols = line.split(",", 3)
+            starts.setdefault((cols[0], cols[1]), float(cols[2]))
+    return starts
+
+
+def _planted_saccades(paths, min_fixation=0.0):
+    """ returns {(participant, trial): [(onset, offset), ...]} of the gaps between fixations on different targets
+        the generator wrote, in the times of the samples file
+    """
+    starts = _trial_starts(paths["samples"])
+    fixations = read_fixations(paths["fixations"])
+    planted = {}
+    for participant in fixations:
+        for trial, trial_dict in fixations[participant].items():
+            start = starts[(participant, trial)]
+            intervals = trial_dict["fixation_intervals"]
+            planted[(participant, trial)] = [
+                (start + before[1], start + after[0]) for before, after in zip(intervals, intervals[1:])
+                if before[2] != after[2] and min(before[1] - before[0], after[1] - after[0]) >= min_fixation]
+    return planted
+
+
+def _assert_matches(detected, planted, tolerance):
+    for (participant, trial), saccades in planted.items():
+        events = detected.get(participant, {}).get(trial, [])
+        assert len(events) == len(saccades), (participant, trial)
+        for (onset, offset), event in zip(saccades, events):
+            assert abs(event[0] - onset) <= tolerance and abs(event[1] - offset) <= tolerance, (participant, trial)
+
+
+def test_ivt_finds_the_planted_saccades(clean_session):
+    detected = detect_saccades(clean_session["samples"], "ivt")
+    _assert_matches(detected, _planted_saccades(clean_session), 2 * SAMPLE_INTERVAL)
+
+
+def test_idt_finds_the_planted_saccades(clean_session):
+    planted = _planted_saccades(clean_session, FIXATION_DURATION)
+    # fixations shorter than FIXATION_DURATION are not fixations for I-DT, so only trials without them are compared
+    complete = _planted_saccades(clean_session)
+    planted = {key: saccades for key, saccades in planted.items() if len(saccades) == len(complete[key])}
+    assert planted
+    _assert_matches(detect_saccades(clean_session["samples"], "idt"), planted, 3 * SAMPLE_INTERVAL)
+
+
+def test_defaults_on_the_default_session(session_paths):
+    # the missing samples of the default session can split or hide a saccade, but every detected saccade must
+    # be one the generator wrote
+    planted = _planted_saccades(session_paths)
+    for method in ("ivt", "idt"):
+        detected = detect_saccades(session_paths["samples"], method)
+        for participant in detected:
+            for trial, events in detected[participant].items():
+                for event in events:
+                    assert any(event[0] <= offset + SAMPLE_INTERVAL and event[1] >= onset - SAMPLE_INTERVAL
+                               for onset, offset in planted[(participant, trial)]), (method, participant, trial)
+        if method == "ivt":
+            num_planted = sum(len(saccades) for saccades in planted.values())
+            num_detected = sum(len(events) for trials in detected.values() for events in trials.values())
+            assert abs(num_detected - num_planted) <= 0.05 * num_planted
+
+
+def test_gaze_columns_are_found_by_name(clean_session, tmp_path):
+    # the gaze positions moved after the other columns, the average of both eyes preferred to the left eye
+    order = [0, 1, 5, 2, 6, 7, 8, 3, 4]
+    with open(clean_session["samples"]) as file:
+        lines = [line.rstrip("\n").split(",") for line in file]
+    lines[0][3:5] = ["AVERAGE_GAZE_X", "AVERAGE_GAZE_Y"]
+    reordered = tmp_path / "samples.csv"
+    reordered.write_text("".join(",".join([cols[i] for i in order[:-1]] + ["LEFT_GAZE_X" if i == 0 else ".",
+                                                                        cols[order[-1]]]) + "\n"
+                                 for i, cols in enumerate(lines)))
+    for method in ("ivt", "idt"):
+        assert detect_saccades(str(reordered), method) == detect_saccades(clean_session["samples"], method)
+
+    # without a column of the gaze positions
+    no_gaze = tmp_path / "no_gaze.csv"
+    no_gaze.write_text(",".join(lines[0][:3] + lines[0][5:]) + "\n")
+    with pytest.raises(ValueError, match="no column for x"):
+        detect_saccades(str(no_gaze))
@@ -0,0 +1,32 @@
+import pytest
+
+from fixation_kernels import first_saccade_times_store, search_times_store
+from fixations_processing import first_saccade_times, read_fixations, search_times
+from trial_store import fixation_store_from_file
+
+
+def test_fixation_kernels_match_the_loops(session_paths):
+    fixation_dict = read_fixations(session_paths["fixations"])
+    store = fixation_store_from_file(session_paths["fixations"])
+    assert first_saccade_times_store(store) == first_saccade_times(fixation_dict)
+    assert search_times_store(store) == search_times(fixation_dict)
+
+
+def test_crosshair_only_trials_are_left_out(session_paths, tmp_path):
+    with open(session_paths["fixations"]) as file:
+        lines = file.readlines()
+    # a last trial whose fixations are all on the crosshairs, which search_times can not evaluate
+    crosshair_rows = [line for line in lines[1:] if line.split(",")[14] == "[ ]"][:2]
+    extra = [",".join(["p9999", "1"] + line.split(",")[2:]) for line in crosshair_rows]
+    path = str(tmp_path / "fixations.csv")
+    with open(path, "w") as file:
+        file.writelines(lines + extra)
+
+    store = fixation_store_from_file(path)
+    with pytest.warns(UserWarning, match="left out 1 trials"):
+        times = search_times_store(store)
+    assert times == search_times(read_fixations(session_paths["fixations"]))
+    with pytest.raises(IndexError):
+        search_times(read_fixations(path))
+    # the first saccade kernel counts the trial without a first saccade, like the loop
+    assert first_saccade_times_store(store) == first_saccade_times(read_fixations(path))
@@ -0,0 +1,44 @@
+import pytest
+
+from fixations_processing import first_saccade_summaries, read_fixations, search_time_summaries
+from incremental import update_incremental
+from samples_processing import SaccadeAccuracyAccumulator, SaccadeCountAccumulator, accumulate_samples, read_samples
+
+
+def _results(accumulators):
+    return {name: accumulator.result() for name, accumulator in accumulators.items()}
+
+
+def _expected(kind, path):
+    if kind == "samples":
+        accumulators = {"first": SaccadeAccuracyAccumulator(0), "last": SaccadeAccuracyAccumulator(-1),
+                        "counts": SaccadeCountAccumulator()}
+        accumulate_samples(read_samples(path), list(accumulators.values()))
+        return _results(accumulators)
+    fixation_dict = read_fixations(path)
+    return {"first_saccade": first_saccade_summaries(fixation_dict).result(),
+            "search_time": search_time_summaries(fixation_dict).result()}
+
+
+def _trial_first_rows(lines):
+    """ returns the indexes of the lines starting a trial, after the header """
+    keys = [line.split(b",", 2)[:2] for line in lines]
+    return [i for i in range(2, len(lines)) if keys[i] != keys[i - 1]]
+
+
+@pytest.mark.parametrize("kind", ["samples", "fixations"])
+def test_growing_file_cut_mid_trial(session_paths, tmp_path, kind):
+    with open(session_paths[kind], 'rb') as file:
+        lines = file.readlines()
+    path = str(tmp_path / ("growing_%s.csv" % kind))
+    state_path = str(tmp_path / "state.pkl")
+    # cut right after the first row of trials, before their first saccade or interest area fixation
+    cuts = [i + 1 for i in _trial_first_rows(lines)[5::17]] + [len(lines)]
+    written = 0
+    with open(path, 'wb') as file:
+        for cut in cuts:
+            file.write(b"".join(lines[written:cut]))
+            file.flush()
+            written = cut
+            accumulators = update_incremental(path, kind, state_path, chunk_size=4096)
+    assert _results(accumulators) == _expected(kind, session_paths[kind])
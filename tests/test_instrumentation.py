@@ -0,0 +1,48 @@
+import math
+import os
+import subprocess
+import sys
+
+import instrumentation
+from parallel_ingest import read_parallel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _ListSink:
+    def __init__(self):
+        self.reports = []
+
+    def send(self, report):
+        self.reports.append(report)
+
+
+def _counters(path, workers):
+    sink = _ListSink()
+    instrumentation.enable(sink)
+    try:
+        read_parallel(path, "samples", workers=workers, chunk_bytes=64 * 1024)
+    finally:
+        instrumentation.disable()
+    return sink.reports[0]
+
+
+def test_import_does_not_enable():
+    env = dict(os.environ, **{instrumentation.ENV_VAR: "log"})
+    code = "import instrumentation, session_engine; print(instrumentation.enabled())"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "False"
+
+
+def test_worker_metrics_are_reported(session_paths):
+    serial = _counters(session_paths["samples"], 1)
+    parallel = _counters(session_paths["samples"], 2)
+    assert parallel["counters"] == serial["counters"]
+    assert parallel["counters"] and set(parallel["stages"]) == set(serial["stages"])
+
+
+def test_peak_rss_without_the_resource_module(monkeypatch):
+    assert instrumentation.peak_rss_mb() > 0
+    # a None entry makes the import fail, as on Windows
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert math.isnan(instrumentation.peak_rss_mb())
@@ -0,0 +1,28 @@
+from fixations_processing import read_fixations
+from messages_processing import read_messages
+from parallel_ingest import read_fixations_parallel, read_messages_parallel, read_samples_parallel
+from samples_processing import read_samples
+
+
+def test_parallel_readers_match_the_serial_ones(session_paths):
+    # small byte ranges so every file is split across the workers
+    assert read_samples_parallel(session_paths["samples"], workers=2, chunk_bytes=64 * 1024) == read_samples(
+        session_paths["samples"])
+    assert read_fixations_parallel(session_paths["fixations"], workers=2, chunk_bytes=4096) == read_fixations(
+        session_paths["fixations"])
+    assert read_messages_parallel(session_paths["messages"], workers=2, chunk_bytes=1024) == read_messages(
+        session_paths["messages"])
+
+
+def test_parallel_reader_of_a_directory(session_paths, tmp_path):
+    # a directory of per-participant files reads like the files concatenated in name order
+    with open(session_paths["samples"]) as file:
+        header = next(file)
+        lines = file.readlines()
+    participants = sorted({line.split(",", 1)[0] for line in lines})
+    for participant in participants:
+        with open(str(tmp_path / ("%s.csv" % participant)), "w") as file:
+            file.write(header)
+            file.writelines(line for line in lines if line.startswith(participant + ","))
+    assert read_samples_parallel(str(tmp_path), workers=2, chunk_bytes=64 * 1024) == read_samples(
+        session_paths["samples"])
@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import pytest
+
+from fixations_processing import read_fixations
+from messages_processing import read_messages
+from parse_cache import ParseCache, read_cached
+from samples_processing import read_samples
+from trial_store import fixation_store_from_file
+
+
+@pytest.mark.parametrize("kind, reader", [("samples", read_samples), ("fixations", read_fixations),
+                                          ("messages", read_messages)])
+def test_cached_readers_match_the_readers(session_paths, tmp_path, kind, reader):
+    expected = reader(session_paths[kind])
+    cache = ParseCache(str(tmp_path))
+    # the first read parses the file and the second one loads the entry
+    for _ in range(2):
+        assert cache.read(session_paths[kind], kind) == expected
+    assert os.path.exists(cache.entry_path(kind, session_paths[kind]))
+
+
+def test_cached_store_matches_the_store(session_paths, tmp_path):
+    expected = fixation_store_from_file(session_paths["fixations"])
+    for _ in range(2):
+        store = read_cached(session_paths["fixations"], "fixation_store", str(tmp_path))
+        assert set(store.arrays) == set(expected.arrays)
+        for name, values in expected.arrays.items():
+            assert np.array_equal(store.arrays[name], values)
+
+
+def test_changed_file_is_parsed_again(session_paths, tmp_path):
+    path = str(tmp_path / "messages.csv")
+    with open(session_paths["messages"]) as file:
+        lines = file.readlines()
+    with open(path, "w") as file:
+        file.writelines(lines)
+    cache_dir = str(tmp_path / "cache")
+    assert read_cached(path, "messages", cache_dir) == read_messages(path)
+    with open(path, "w") as file:
+        file.writelines(lines[:len(lines) // 2])
+    assert read_cached(path, "messages", cache_dir) == read_messages(path)
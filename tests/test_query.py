@@ -0,0 +1,76 @@
+import pytest
+
+from fixations_processing import avg_search_time, read_fixations, search_times, time_stats
+from messages_processing import avg_response_time, read_messages
+from query import Query, collect_all
+from samples_processing import read_samples, saccade_accuracy_helper
+
+
+def _no_plot(*args, **kwargs):
+    pass
+
+
+def test_condition_from_the_fixations_file(session_paths):
+    with_samples = Query(samples=session_paths["samples"], fixations=session_paths["fixations"])
+    fixations_only = Query(fixations=session_paths["fixations"])
+    # the condition is tested by the reader of every file of the query
+    for query in (with_samples, fixations_only):
+        scans = [line for line in query.filter(condition="A").agg(n=("count", "trial")).explain().splitlines()
+                 if line.startswith("scan")]
+        assert scans and all("conditions=('A',)" in line for line in scans)
+    rows = [query.filter(condition="A").group_by("condition", "side").agg(
+        n=("count", "trial"), search=("mean", "search_time")).collect() for query in (with_samples, fixations_only)]
+    assert rows[0] == rows[1]
+    assert [row["condition"] for row in rows[0]] == ["A", "A"]
+
+
+def test_median_is_the_repository_median(session_paths):
+    fixation_dict = read_fixations(session_paths["fixations"])
+    left_times, right_times = search_times(fixation_dict)[:2]
+    rows = Query(fixations=session_paths["fixations"]).group_by("side").agg(
+        median=("median", "search_time"), n=("count", "search_time")).collect()
+    assert [(row["side"], row["n"]) for row in rows] == [("Left", len(left_times)), ("Right", len(right_times))]
+    assert [row["median"] for row in rows] == [time_stats(left_times).median, time_stats(right_times).median]
+    # an even number of trials, where the middle values are not averaged
+    overall = Query(fixations=session_paths["fixations"]).agg(median=("median", "search_time")).collect()
+    assert overall[0]["median"] == time_stats(left_times + right_times).median
+
+
+def _by(rows, key):
+    return {row[key]: row for row in rows}
+
+
+def test_saccade_accuracy_matches_the_helper(session_paths):
+    samples_dict = read_samples(session_paths["samples"])
+    query = Query(samples=session_paths["samples"])
+    for field, column in ((0, "first_saccade_on_target"), (-1, "last_saccade_on_target")):
+        expected = saccade_accuracy_helper(samples_dict, field)
+        overall, by_side, by_condition = collect_all([query.agg(accuracy=("mean", column)),
+                                                      query.group_by("side").agg(accuracy=("mean", column)),
+                                                      query.group_by("condition").agg(accuracy=("mean", column))])
+        assert overall[0]["accuracy"] == pytest.approx(expected.total)
+        assert _by(by_side, "side")["Left"]["accuracy"] == pytest.approx(expected.left)
+        assert _by(by_side, "side")["Right"]["accuracy"] == pytest.approx(expected.right)
+        assert _by(by_condition, "condition")["A"]["accuracy"] == pytest.approx(expected.condition_a)
+        assert _by(by_condition, "condition")["B"]["accuracy"] == pytest.approx(expected.condition_b)
+
+
+def test_search_time_matches_avg_search_time(session_paths):
+    expected = avg_search_time(read_fixations(session_paths["fixations"]), plot=_no_plot, verbose=False)
+    query = Query(fixations=session_paths["fixations"]).agg(
+        mean=("mean", "search_time"), maximum=("max", "search_time"), minimum=("min", "search_time"),
+        median=("median", "search_time"))
+    overall, by_side = collect_all([query, query.group_by("side")])
+    for stats, row in ((expected.overall, overall[0]), (expected.left, _by(by_side, "side")["Left"]),
+                       (expected.right, _by(by_side, "side")["Right"])):
+        assert row["mean"] == pytest.approx(stats.mean)
+        assert (row["maximum"], row["minimum"], row["median"]) == (stats.maximum, stats.minimum, stats.median)
+
+
+def test_response_time_matches_avg_response_time(session_paths):
+    expected = avg_response_time(read_messages(session_paths["messages"]))
+    query = Query(messages=session_paths["messages"]).agg(resp=("mean", "resp_time"))
+    overall, by_side = collect_all([query, query.group_by("side")])
+    assert overall[0]["resp"] == pytest.approx(expected.overall)
+    assert _by(by_side, "side")["Left"]["resp"] == pytest.approx(expected.left)
+    assert _by(by_side, "side")["Right"]["resp"] == pytest.approx(expected.right)
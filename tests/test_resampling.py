@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from fixations_processing import first_saccade_time_and_accuracy, read_fixations
+from resampling import cluster_bootstrap, first_saccade_metrics, permutation_test, sample_accuracy_metrics
+from samples_processing import read_samples, saccade_accuracy_helper
+
+
+def _no_plot(*args, **kwargs):
+    pass
+
+
+def test_bootstrap_estimates_match_the_analyses(session_paths):
+    samples_dict = read_samples(session_paths["samples"])
+    names = {"left": "left", "right": "right", "total": "total", "condition A": "condition_a",
+             "condition B": "condition_b"}
+    for field in (0, -1):
+        expected = saccade_accuracy_helper(samples_dict, field)._asdict()
+        intervals = cluster_bootstrap(*sample_accuracy_metrics(samples_dict, field)[:2], num_resamples=200)
+        for name, (estimate, low, high) in intervals.items():
+            assert estimate == pytest.approx(expected[names[name]])
+            assert low <= high
+
+    expected = first_saccade_time_and_accuracy(read_fixations(session_paths["fixations"]), plot=_no_plot,
+                                               verbose=False)
+    participants, metrics, _ = first_saccade_metrics(read_fixations(session_paths["fixations"]))
+    intervals = cluster_bootstrap(participants, metrics, num_resamples=200)
+    names = {"left time": "left_avg_time", "right time": "right_avg_time", "time": "avg_time",
+             "left accuracy": "left_accuracy", "right accuracy": "right_accuracy", "accuracy": "accuracy",
+             "accurate time": "avg_accurate_time", "inaccurate time": "avg_inaccurate_time"}
+    for name, field in names.items():
+        assert intervals[name][0] == pytest.approx(getattr(expected, field))
+
+
+def test_seed_gives_the_same_results_for_any_number_of_workers(session_paths):
+    participants, metrics, labels = sample_accuracy_metrics(read_samples(session_paths["samples"]), 0)
+    serial = cluster_bootstrap(participants, metrics, num_resamples=2500, seed=3, workers=1, batch_size=1000)
+    assert cluster_bootstrap(participants, metrics, num_resamples=2500, seed=3, workers=3, batch_size=1000) == serial
+
+    sides = labels["side"] != ""
+    args = (labels["correct"][sides], labels["side"][sides] == "Left", participants[sides], 2500, 3)
+    assert permutation_test(*args, workers=1, batch_size=1000) == permutation_test(*args, workers=3, batch_size=1000)
+
+
+@pytest.mark.parametrize("values", [np.tile([0.0, 1.0, 1.0], 20), np.tile([250.0, 310.5, 480.0], 20)])
+def test_identical_groups_are_not_different(values):
+    # every stratum holds the same values in both groups
+    labels = np.tile([True, True, True, False, False, False], 10)
+    strata = np.repeat(np.arange(10), 6)
+    difference, p_value = permutation_test(values, labels, strata, num_permutations=500)
+    assert difference == pytest.approx(0)
+    assert p_value == pytest.approx(1)
+    assert permutation_test(values, labels, num_permutations=500)[1] == pytest.approx(1)
@@ -0,0 +1,81 @@
+import pytest
+
+from fixations_processing import read_fixations
+from parallel_ingest import read_fixations_parallel, read_samples_parallel
+from row_filter import RowFilter
+from samples_processing import iter_sample_trials, read_samples, read_samples_chunked
+from trial_store import fixation_store_from_file, sample_store_from_file
+
+FILTERS = [
+    RowFilter(participants=["p0001", "p0003"]),
+    RowFilter(trials=(5, 12), conditions=["B"]),
+    RowFilter(sides=["right"]),
+    RowFilter(participants=["nobody"]),
+]
+# the sample times are timestamps, the first participant's trials start at 100000, and the fixation times are
+# relative to the start of the trial
+SAMPLE_FILTERS = FILTERS + [RowFilter(sides=["left"], time_window=(100300, 130000))]
+FIXATION_FILTERS = FILTERS + [RowFilter(sides=["left"], time_window=(100, 600))]
+# a small chunk so the trials are split across chunks
+CHUNK = 4096
+
+
+def _as_dict(store):
+    view = store.as_mapping()
+    return {participant: {trial: dict(view[participant][trial]) for trial in view[participant]} for participant in view}
+
+
+def _keep_trials(res_dict, row_filter):
+    """ drops the trials a filter on the participant, trial, condition or side leaves out from a dictionary """
+    kept = {}
+    for participant, participant_dict in res_dict.items():
+        if row_filter.participants is not None and participant not in row_filter.participants:
+            continue
+        for trial, trial_dict in participant_dict.items():
+            if row_filter.trials is not None and not row_filter.trials[0] <= int(trial) <= row_filter.trials[1]:
+                continue
+            if row_filter.conditions is not None and trial_dict["condition"].strip() not in row_filter.conditions:
+                continue
+            if row_filter.sides is not None and trial_dict["orig_side"].strip() not in row_filter.sides:
+                continue
+            kept.setdefault(participant, {})[trial] = trial_dict
+    return kept
+
+
+@pytest.mark.parametrize("row_filter", SAMPLE_FILTERS, ids=repr)
+def test_filtered_samples_readers(session_paths, row_filter):
+    path = session_paths["samples"]
+    expected = read_samples(path, row_filter)
+    assert bool(expected) == (row_filter.participants != ("nobody",))
+    assert read_samples_chunked(path, CHUNK, row_filter) == expected
+    streamed = {}
+    for participant, trial, trial_dict in iter_sample_trials(path, CHUNK, row_filter):
+        streamed.setdefault(participant, {})[trial] = trial_dict
+    assert streamed == expected
+    assert read_samples_parallel(path, workers=2, chunk_bytes=64 * 1024, row_filter=row_filter) == expected
+    assert _as_dict(sample_store_from_file(path, row_filter, CHUNK)) == expected
+
+
+@pytest.mark.parametrize("row_filter", FIXATION_FILTERS, ids=repr)
+def test_filtered_fixations_readers(session_paths, row_filter):
+    path = session_paths["fixations"]
+    expected = read_fixations(path, row_filter)
+    assert bool(expected) == (row_filter.participants != ("nobody",))
+    assert read_fixations_parallel(path, workers=2, chunk_bytes=4096, row_filter=row_filter) == expected
+    assert _as_dict(fixation_store_from_file(path, chunk_lines=50, row_filter=row_filter)) == expected
+
+
+@pytest.mark.parametrize("row_filter", FILTERS[:3], ids=repr)
+def test_filters_drop_whole_trials(session_paths, row_filter):
+    for kind, reader in (("samples", read_samples), ("fixations", read_fixations)):
+        expected = _keep_trials(reader(session_paths[kind]), row_filter)
+        assert expected and reader(session_paths[kind], row_filter) == expected
+
+
+def test_time_window_cuts_the_trials(session_paths):
+    # a window keeps part of the rows of the trials it overlaps
+    samples = read_samples(session_paths["samples"], RowFilter(time_window=(100300, 130000)))
+    assert list(samples) == ["p0000"] and 0 < len(samples["p0000"]) < 30
+    fixations = read_fixations(session_paths["fixations"], RowFilter(time_window=(100, 600)))
+    assert all(100 <= start < 600 for participant_dict in fixations.values() for trial_dict in participant_dict.values()
+               for start, _, _ in trial_dict["fixation_intervals"])
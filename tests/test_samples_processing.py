@@ -0,0 +1,23 @@
+from samples_processing import (CHUNK_SIZE, iter_sample_trials, num_interest_saccades_stats, read_samples,
+                                read_samples_chunked, saccade_accuracy, streaming_samples_stats)
+
+
+def test_chunked_reader_matches_read_samples(session_paths):
+    expected = read_samples(session_paths["samples"])
+    # a small chunk splits the trials across chunks
+    for chunk_size in (4096, CHUNK_SIZE):
+        assert read_samples_chunked(session_paths["samples"], chunk_size) == expected
+
+
+def test_streamed_trials_match_read_samples(session_paths):
+    streamed = {}
+    for participant, trial, trial_dict in iter_sample_trials(session_paths["samples"], 4096):
+        streamed.setdefault(participant, {})[trial] = trial_dict
+    assert streamed == read_samples(session_paths["samples"])
+
+
+def test_streaming_stats_match_the_analyses(session_paths):
+    samples_dict = read_samples(session_paths["samples"])
+    accuracy, counts = streaming_samples_stats(session_paths["samples"], 4096, verbose=False)
+    assert accuracy == saccade_accuracy(samples_dict, verbose=False)
+    assert counts == num_interest_saccades_stats(samples_dict, verbose=False)
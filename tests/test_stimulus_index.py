@@ -0,0 +1,16 @@
+from fixations_processing import time_stats
+from samples_processing import read_samples
+from stimulus_index import build_stimulus_index
+
+
+def test_median_switches_is_the_repository_median(session_paths):
+    switches = {}
+    for participant_dict in read_samples(session_paths["samples"]).values():
+        for trial_dict in participant_dict.values():
+            switches.setdefault(trial_dict["file_name"], []).append(len(trial_dict.get("order_of_saccades", [])))
+    index = build_stimulus_index(session_paths["samples"])
+    assert sorted(index.stimuli) == sorted(switches)
+    for file_name, counts in switches.items():
+        stats = index.stats(file_name)
+        assert stats.trials == len(counts)
+        assert stats.median_switches == time_stats(counts).median
@@ -0,0 +1,20 @@
+import pytest
+
+from messages_processing import read_messages
+from synthetic_data import SAMPLE_INTERVAL, generate_session
+
+
+@pytest.mark.parametrize("samples_per_trial", [1, 100, 199])
+def test_short_trials(tmp_path, samples_per_trial):
+    paths = generate_session(str(tmp_path / "short"), participants=2, trials=10, samples_per_trial=samples_per_trial)
+    with open(paths["samples"]) as file:
+        assert len(file.readlines()) == 1 + 2 * 10 * samples_per_trial
+    # the responses are inside the trial
+    times = [trial_dict["resp_time"] for participant_dict in read_messages(paths["messages"]).values()
+             for trial_dict in participant_dict.values()]
+    assert len(times) == 20 and all(0 <= time <= samples_per_trial * SAMPLE_INTERVAL for time in times)
+
+
+def test_no_samples_per_trial(tmp_path):
+    with pytest.raises(ValueError, match="samples_per_trial"):
+        generate_session(str(tmp_path / "empty"), samples_per_trial=0)
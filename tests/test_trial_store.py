@@ -0,0 +1,58 @@
+import math
+
+import numpy as np
+import pytest
+
+from fixations_processing import read_fixations
+from row_filter import RowFilter
+from samples_processing import num_interest_saccades_stats, num_interest_saccades_stats_store, read_samples
+from trial_store import TrialStore, fixation_store_from_file, sample_store_from_dict, sample_store_from_file
+
+
+def _as_dict(store):
+    view = store.as_mapping()
+    return {participant: {trial: dict(view[participant][trial]) for trial in view[participant]} for participant in view}
+
+
+# the sample times are timestamps, the first participant's trials start at 100000
+@pytest.mark.parametrize("row_filter", [RowFilter(), RowFilter(conditions=["A"], time_window=(100300, 130000))])
+def test_sample_store_matches_read_samples(session_paths, row_filter):
+    expected = read_samples(session_paths["samples"], row_filter)
+    assert expected
+    # small chunks split the trials across segments
+    for chunk_size in (4096, 1 << 20):
+        assert _as_dict(sample_store_from_file(session_paths["samples"], row_filter, chunk_size)) == expected
+
+
+def test_fixation_store_matches_read_fixations(session_paths):
+    expected = read_fixations(session_paths["fixations"])
+    for chunk_lines in (50, 100000):
+        assert _as_dict(fixation_store_from_file(session_paths["fixations"], chunk_lines)) == expected
+
+
+def test_saved_store_is_memory_mapped(session_paths, tmp_path):
+    store = fixation_store_from_file(session_paths["fixations"])
+    store.save(str(tmp_path / "store"))
+    loaded = TrialStore.load(str(tmp_path / "store"))
+    assert isinstance(loaded.start, np.memmap)
+    assert _as_dict(loaded) == _as_dict(store)
+
+
+def test_saccade_counts_of_the_store(session_paths):
+    samples_dict = read_samples(session_paths["samples"])
+    store = sample_store_from_file(session_paths["samples"])
+    assert num_interest_saccades_stats_store(store, verbose=False) == num_interest_saccades_stats(
+        samples_dict, verbose=False)
+
+    # a trial without saccades counts as 0 saccades in both
+    trial_dict = {key: value for key, value in samples_dict["p0000"]["1"].items()
+                  if key not in ("order_of_saccades", "first_saccade_time")}
+    samples_dict["p9999"] = {"1": trial_dict}
+    counts = num_interest_saccades_stats(samples_dict, verbose=False)
+    assert num_interest_saccades_stats_store(sample_store_from_dict(samples_dict), verbose=False) == counts
+    assert counts.average_per_trial < num_interest_saccades_stats_store(store, verbose=False).average_per_trial
+
+    # without trials the average is nan
+    empty = num_interest_saccades_stats_store(sample_store_from_dict({}), verbose=False)
+    assert math.isnan(empty.average_per_trial) and empty.max_saccades == 0
+    assert math.isnan(num_interest_saccades_stats({}, verbose=False).average_per_trial)
@@ -0,0 +1,418 @@
+import itertools
+import json
+import os
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+import instrumentation
+from categorical import CategoricalEncoding, code_dtype
+from fixations_processing import parse_fixation_lines, warn_rejected
+from row_filter import DEFAULT_FILTER
+from samples_processing import CHUNK_SIZE, parse_sample_chunk
+
+# number of lines of the fixations file parsed together when building a store
+STORE_CHUNK_LINES = 100000
+
+_META_NAME = "meta.json"
+# columns holding codes of a categorical field, decoded by the "<field>_labels" array
+CATEGORICAL_COLUMNS = {"trials": "trial", "orig_side": "side", "file_name": "file_name", "condition": "condition",
+                       "aoi": "aoi", "saccades": "saccade"}
+
+
+class TrialStore:
+    """ compact, columnar store of parsed trials. instead of a dict and a list per trial and per
+        fixation, every field is one flat typed array:
+            participants: the participants, in the order read_fixations/read_samples would list them
+            participant_offsets: trials of participant p are trials[participant_offsets[p]:participant_offsets[p + 1]]
+            trials: the trial of every trial
+            event_offsets: events of trial t are at event_offsets[t]:event_offsets[t + 1] in the event arrays
+        plus per-trial and per-event arrays depending on the kind:
+            "fixations": orig_side per trial (and condition if the file has the column), start, end and aoi per
+                         fixation
+            "samples": orig_side, file_name, condition, first_saccade_time and has_saccades per trial,
+                       saccades (the order_of_saccades entries) per saccade
+        the categorical columns (CATEGORICAL_COLUMNS) hold small integer codes instead of strings, so they
+        are compared as integers, e.g. store.orig_side == store.code("side", "Left"). the labels of a field
+        are in the "<field>_labels" array, e.g. aoi_labels, and decoded with decode
+        inputs
+        ------
+        kind: "fixations" or "samples"
+        arrays: dictionary of name to numpy array
+    """
+
+    def __init__(self, kind, arrays):
+        self.kind = kind
+        self.arrays = arrays
+        self._labels = {}
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["arrays"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    @property
+    def nbytes(self):
+        """ total size of the arrays in bytes """
+        return sum(values.nbytes for values in self.arrays.values())
+
+    def labels(self, field):
+        """ returns the list of labels of a categorical field, e.g. "aoi", or "participant" for the participants """
+        if field not in self._labels:
+            labels = self.participants if field == "participant" else self.arrays[field + "_labels"]
+            self._labels[field] = labels.tolist()
+        return self._labels[field]
+
+    def code(self, field, label):
+        """ returns the code of a label of a field, or -1 if no trial or event has it """
+        labels = self.labels(field)
+        return labels.index(label) if label in labels else -1
+
+    def decode(self, field, codes):
+        """ returns the labels of an array of codes of a field, None for the missing code -1,
+            e.g. store.decode("file_name", store.file_name[:10])
+        """
+        labels = self.labels(field)
+        return [labels[code] if code >= 0 else None for code in np.asarray(codes).tolist()]
+
+    def save(self, directory):
+        """ saves the store as one .npy file per array, so it can be memory-mapped by load
+        inputs
+        ------
+        directory: path of the directory to create
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, values in self.arrays.items():
+            np.save(os.path.join(directory, name + ".npy"), values)
+        with open(os.path.join(directory, _META_NAME), 'w') as file:
+            json.dump({"kind": self.kind, "arrays": list(self.arrays)}, file)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        """ loads a store saved by save
+        inputs
+        ------
+        directory: path of the directory the store was saved to
+        mmap_mode: passed to np.load, "r" maps the arrays read-only instead of reading them
+        outputs
+        -------
+        store: the TrialStore
+        """
+        with open(os.path.join(directory, _META_NAME), 'r') as file:
+            meta = json.load(file)
+        arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+                  for name in meta["arrays"]}
+        return cls(meta["kind"], arrays)
+
+    def as_mapping(self):
+        """ returns a read-only view with the same nesting and values as the dictionary returned by
+            read_fixations or read_samples, so the analyses can run on the store unchanged
+        """
+        return TrialStoreView(self)
+
+
+class TrialStoreView(Mapping):
+    """ read-only {participant: {trial: {field: value}}} view of a TrialStore """
+
+    def __init__(self, store):
+        self.store = store
+        self._participants = store.participants.tolist()
+        self._index = {participant: i for i, participant in enumerate(self._participants)}
+
+    def __getitem__(self, participant):
+        return _ParticipantView(self.store, self._index[participant])
+
+    def __iter__(self):
+        return iter(self._participants)
+
+    def __len__(self):
+        return len(self._participants)
+
+
+class _ParticipantView(Mapping):
+
+    def __init__(self, store, participant_index):
+        self.store = store
+        self._first = int(store.participant_offsets[participant_index])
+        self._trials = store.decode("trial", store.trials[self._first:int(store.participant_offsets[participant_index + 1])])
+        self._index = None
+
+    def __getitem__(self, trial):
+        if self._index is None:
+            self._index = {trial: i for i, trial in enumerate(self._trials)}
+        return _TrialView(self.store, self._first + self._index[trial])
+
+    def __iter__(self):
+        return iter(self._trials)
+
+    def __len__(self):
+        return len(self._trials)
+
+
+class _TrialView(Mapping):
+
+    def __init__(self, store, trial_index):
+        self.store = store
+        self.trial_index = trial_index
+        if store.kind == "fixations":
+            self._keys = ("orig_side", "condition", "fixation_intervals") if "condition" in store.arrays \
+                else ("orig_side", "fixation_intervals")
+        elif store.has_saccades[trial_index]:
+            self._keys = ("orig_side", "order_of_saccades", "first_saccade_time", "file_name", "condition")
+        else:
+            self._keys = ("orig_side", "file_name", "condition")
+
+    def _events(self):
+        offsets = self.store.event_offsets
+        return int(offsets[self.trial_index]), int(offsets[self.trial_index + 1])
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        store = self.store
+        if key == "fixation_intervals":
+            start, end = self._events()
+            return [[fixation_start, fixation_end, aoi] for fixation_start, fixation_end, aoi
+                    in zip(store.start[start:end].tolist(), store.end[start:end].tolist(),
+                           store.decode("aoi", store.aoi[start:end]))]
+        if key == "order_of_saccades":
+            start, end = self._events()
+            return store.decode("saccade", store.saccades[start:end])
+        if key in CATEGORICAL_COLUMNS:
+            return store.labels(CATEGORICAL_COLUMNS[key])[int(store.arrays[key][self.trial_index])]
+        return str(store.arrays[key][self.trial_index])
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+def _dictionary_order(trial_participants):
+    """ orders trials the way the readers' dictionaries do: participants by first appearance, then
+        the trials of each participant by first appearance
+    inputs
+    ------
+    trial_participants: participant index of every trial, with participants and trials numbered in order of first appearance
+    outputs
+    -------
+    order: array of trial indexes in dictionary order
+    """
+    trial_participants = np.asarray(trial_participants, dtype=np.int64)
+    return np.lexsort((np.arange(len(trial_participants)), trial_participants))
+
+
+def fixation_store_from_file(fixations_path, chunk_lines=STORE_CHUNK_LINES, row_filter=DEFAULT_FILTER):
+    """ builds a TrialStore from the fixations file without building the whole read_fixations dictionary
+    inputs
+    ------
+    fixations_path: string path to the fixations file
+    chunk_lines: number of lines parsed at once
+    row_filter: RowFilter selecting the rows to keep, by default every participant but nikki
+    outputs
+    -------
+    store: TrialStore of kind "fixations"
+    """
+    participants = {}
+    trial_index = {}
+    trial_keys = []
+    trial_participants = []
+    orig_sides = []
+    conditions = []
+    encoding = CategoricalEncoding(("trial", "side", "condition", "aoi"))
+    aoi_codes = encoding["aoi"]
+
+    event_trials = array('q')
+    starts = array('d')
+    ends = array('d')
+    aois = array('h')
+
+    rejected = []
+    with open(fixations_path, 'r') as file:
+        header = next(file)
+        while True:
+            lines = list(itertools.islice(file, chunk_lines))
+            if not lines:
+                break
+            chunk_dict = parse_fixation_lines(lines, row_filter, header, rejected)
+            for participant in chunk_dict:
+                participant_id = participants.setdefault(participant, len(participants))
+                for trial in chunk_dict[participant]:
+                    trial_dict = chunk_dict[participant][trial]
+                    key = (participant, trial)
+                    if key not in trial_index:
+                        trial_index[key] = len(trial_keys)
+                        trial_keys.append(key)
+                        trial_participants.append(participant_id)
+                        orig_sides.append(encoding.code("side", trial_dict["orig_side"]))
+                        if "condition" in trial_dict:
+                            conditions.append(encoding.code("condition", trial_dict["condition"]))
+                    trial_id = trial_index[key]
+                    for fixation_start, fixation_end, fixation_interest_area in trial_dict["fixation_intervals"]:
+                        event_trials.append(trial_id)
+                        starts.append(fixation_start)
+                        ends.append(fixation_end)
+                        aois.append(aoi_codes.code(fixation_interest_area))
+
+    warn_rejected(rejected, fixations_path)
+
+    order = _dictionary_order(trial_participants)
+    # position of every trial in dictionary order
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    event_rank = rank[np.frombuffer(event_trials, dtype=np.int64)] if len(event_trials) else np.empty(0, dtype=np.int64)
+    event_order = np.argsort(event_rank, kind="stable")
+
+    arrays = _trial_arrays(participants, trial_keys, trial_participants, order,
+                           np.bincount(event_rank, minlength=len(order)), encoding)
+    arrays["orig_side"] = np.array(orig_sides, dtype=code_dtype(len(encoding["side"])))[order]
+    # the file either has a condition column or not, so every trial has a condition or none does
+    if conditions:
+        arrays["condition"] = np.array(conditions, dtype=code_dtype(len(encoding["condition"])))[order]
+    arrays["start"] = np.frombuffer(starts, dtype=np.float64)[event_order]
+    arrays["end"] = np.frombuffer(ends, dtype=np.float64)[event_order]
+    arrays["aoi"] = np.frombuffer(aois, dtype=np.int16)[event_order].astype(code_dtype(len(aoi_codes)))
+    arrays.update(encoding.label_arrays())
+    return TrialStore("fixations", arrays)
+
+
+def _trial_arrays(participants, trial_keys, trial_participants, order, event_counts, encoding):
+    """ builds the participant and trial index arrays shared by both kinds of stores, coding the trials with encoding """
+    participant_counts = np.bincount(np.asarray(trial_participants, dtype=np.int64), minlength=len(participants))
+    participant_offsets = np.zeros(len(participants) + 1, dtype=np.int64)
+    np.cumsum(participant_counts, out=participant_offsets[1:])
+    event_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(event_counts, out=event_offsets[1:])
+    return {
+        "participants": np.array(list(participants), dtype=str),
+        "participant_offsets": participant_offsets,
+        "trials": encoding["trial"].encode([trial_keys[i][1] for i in order.tolist()]),
+        "event_offsets": event_offsets,
+    }
+
+
+def sample_store_from_dict(samples_dict):
+    """ builds a TrialStore from the dictionary returned by read_samples
+    inputs
+    ------
+    samples_dict: dictionary returned by read_samples
+    outputs
+    -------
+    store: TrialStore of kind "samples"
+    """
+    participants = {}
+    trial_keys = []
+    trial_participants = []
+    encoding = CategoricalEncoding(("trial", "side", "file_name", "condition", "saccade"))
+    fields = {"orig_side": [], "file_name": [], "condition": []}
+    first_saccade_times = []
+    has_saccades = []
+    saccades = []
+    saccade_counts = []
+
+    for participant in samples_dict:
+        participant_id = participants.setdefault(participant, len(participants))
+        for trial in samples_dict[participant]:
+            trial_dict = samples_dict[participant][trial]
+            trial_keys.append((participant, trial))
+            trial_participants.append(participant_id)
+            for column, values in fields.items():
+                values.append(trial_dict.get(column, ""))
+            first_saccade_times.append(trial_dict.get("first_saccade_time", ""))
+            order_of_saccades = trial_dict.get("order_of_saccades")
+            has_saccades.append(order_of_saccades is not None)
+            saccades += order_of_saccades or []
+            saccade_counts.append(len(order_of_saccades or []))
+
+    order = np.arange(len(trial_keys))
+    arrays = _trial_arrays(participants, trial_keys, trial_participants, order,
+                           np.array(saccade_counts, dtype=np.int64), encoding)
+    for column, values in fields.items():
+        arrays[column] = encoding[CATEGORICAL_COLUMNS[column]].encode(values)
+    arrays["first_saccade_time"] = np.array(first_saccade_times, dtype=str)
+    arrays["has_saccades"] = np.array(has_saccades, dtype=bool)
+    arrays["saccades"] = encoding["saccade"].encode(saccades)
+    arrays.update(encoding.label_arrays())
+    return TrialStore("samples", arrays)
+
+
+def sample_store_from_file(samples_path, row_filter=DEFAULT_FILTER, chunk_size=CHUNK_SIZE):
+    """ builds a TrialStore from the trial segments parse_sample_chunk reduces the samples file to, without
+        building the whole read_samples dictionary
+    inputs
+    ------
+    samples_path: string path to the samples file
+    row_filter: RowFilter selecting the rows to keep, by default every participant but nikki
+    chunk_size: number of characters parsed at once
+    outputs
+    -------
+    store: TrialStore of kind "samples"
+    """
+    participants = {}
+    trial_index = {}
+    trial_keys = []
+    trial_participants = []
+    encoding = CategoricalEncoding(("trial", "side", "file_name", "condition", "saccade"))
+    saccade_codes = encoding["saccade"]
+    fields = {"orig_side": [], "file_name": [], "condition": []}
+    first_saccade_times = []
+    # code of the last saccade of every trial, -1 before its first one
+    last_saccades = []
+
+    event_trials = array('q')
+    saccades = array('h')
+
+    instrumentation.count_file("samples_bytes", samples_path)
+    with open(samples_path, 'r') as file:
+        next(file)
+        while True:
+            # read whole lines only
+            text = file.read(chunk_size)
+            if not text:
+                break
+            text += file.readline()
+            for segment in parse_sample_chunk(text, row_filter):
+                participant, trial, orig_side, file_name, condition, segment_saccades, first_saccade_time, _ = segment
+                key = (participant, trial)
+                trial_id = trial_index.get(key)
+                if trial_id is None:
+                    trial_id = trial_index[key] = len(trial_keys)
+                    trial_keys.append(key)
+                    trial_participants.append(participants.setdefault(participant, len(participants)))
+                    for column, label in (("orig_side", orig_side), ("file_name", file_name), ("condition", condition)):
+                        fields[column].append(encoding.code(CATEGORICAL_COLUMNS[column], label))
+                    first_saccade_times.append("")
+                    last_saccades.append(-1)
+                if not segment_saccades:
+                    continue
+                codes = [saccade_codes.code(saccade) for saccade in segment_saccades]
+                if last_saccades[trial_id] < 0:
+                    first_saccade_times[trial_id] = first_saccade_time
+                    start = 0
+                else:
+                    # the segment continues the trial, so a repeat of the last interest area is not a new saccade
+                    start = int(codes[0] == last_saccades[trial_id])
+                last_saccades[trial_id] = codes[-1]
+                event_trials.extend([trial_id] * (len(codes) - start))
+                saccades.extend(codes[start:])
+    instrumentation.count("samples_trials", len(trial_keys))
+
+    order = _dictionary_order(trial_participants)
+    # position of every trial in dictionary order
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    event_rank = rank[np.frombuffer(event_trials, dtype=np.int64)] if len(event_trials) else np.empty(0, dtype=np.int64)
+    event_order = np.argsort(event_rank, kind="stable")
+
+    arrays = _trial_arrays(participants, trial_keys, trial_participants, order,
+                           np.bincount(event_rank, minlength=len(order)), encoding)
+    for column, codes in fields.items():
+        arrays[column] = np.array(codes, dtype=code_dtype(len(encoding[CATEGORICAL_COLUMNS[column]])))[order]
+    arrays["first_saccade_time"] = np.array(first_saccade_times, dtype=str)[order]
+    arrays["has_saccades"] = np.array(last_saccades, dtype=np.int64)[order] >= 0
+    arrays["saccades"] = np.frombuffer(saccades, dtype=np.int16)[event_order].astype(code_dtype(len(saccade_codes)))
+    arrays.update(encoding.label_arrays())
+    return TrialStore("samples", arrays)